@@ -0,0 +1,98 @@
+##############################################################################
+##
+## admission.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Admission control for the prediction service. At most
+## max_in_flight requests run at once and at most max_waiting more may
+## queue for a slot; anything beyond that is shed immediately so the
+## client can retry instead of timing out. Every request carries a
+## deadline, and a request still waiting (for a slot or in the
+## micro-batcher) when its deadline passes is dropped before any inference
+## is spent on it.
+##
+##############################################################################
+
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """The queue is full, the request was shed without being queued."""
+
+    def __init__(self, message, retry_after):
+        Exception.__init__(self, message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before it could be served."""
+
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+class AdmissionController(object):
+    """Bounded in-flight and waiting limits with per-request deadlines."""
+
+    def __init__(self, max_in_flight, max_waiting=64, retry_after=1):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+
+        ### Counters ###
+        self.admitted = 0
+        self.shed = 0
+        self.expired = 0
+
+    def acquire(self, deadline=None):
+        """Take a slot, waiting until deadline (a time.monotonic() value)."""
+        with self._cond:
+            if self.in_flight >= self.max_in_flight:
+                if self.waiting >= self.max_waiting:
+                    self.shed += 1
+                    raise Overloaded("Server is overloaded (%d in flight, %d waiting)" %
+                                     (self.in_flight, self.waiting), self.retry_after)
+                self.waiting += 1
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.expired += 1
+                            raise DeadlineExceeded("Deadline passed while queued")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            if expired(deadline):
+                self.expired += 1
+                raise DeadlineExceeded("Deadline passed before the request was admitted")
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def record_expired(self):
+        """Count a request dropped after admission (e.g. in the batch queue)."""
+        with self._cond:
+            self.expired += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_waiting': self.max_waiting,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'expired': self.expired}
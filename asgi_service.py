@@ -0,0 +1,258 @@
+##############################################################################
+##
+## asgi_service.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: asyncio/ASGI entry point serving both the prediction and
+## the stats routes with the same responses as the Flask services:
+##      GET /<team1>/<team2>[?season=]      prediction_web_service.py
+##      GET /get-stats/<team_id>[?season=]  stat_web_service.py
+##      GET /get-stats[?season=&conference=]
+##      GET /metrics                        Prometheus text (see metrics.py)
+## One event loop holds every connection, so thousands of keep-alive
+## clients cost no threads. Model inference runs on a bounded thread pool
+## (NumPy releases the GIL during the matrix multiplies) and stat lines are
+## precomputed bytes served straight from the loop.
+##
+## The PREDICTION_* and STATS_RELOAD_INTERVAL settings of the Flask services
+## apply here as well, plus
+##      ASGI_INFERENCE_THREADS  = inference thread pool size (default: cores)
+## Admission control (PREDICTION_MAX_IN_FLIGHT etc., see admission.py) and
+## the X-Request-Deadline-Ms header behave as in prediction_web_service.py:
+## shed requests get 503 + Retry-After, expired ones 504. A slot is taken
+## on the inference thread, so waiting for one never blocks the loop.
+## HEAD requests get the headers of the GET response without its body.
+##
+## Usage:
+##      uvicorn asgi_service:app --host 0.0.0.0 --port 5000 [--workers N]
+##      python asgi_service.py
+##
+##############################################################################
+
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from feature_store import RAW_STORE, UnknownTeam
+from admission import AdmissionController, DeadlineExceeded, Overloaded
+from batching import QueueFull
+from prediction_cache import PredictionCache
+from serving import PredictionState, config_from_env, state_paths
+from stat_payloads import CONFERENCES_PATH, load_payloads
+from hot_reload import HotReloader
+from metrics import CONTENT_TYPE, REGISTRY, STAGE_SECONDS, record_request, reloader_collector, stats_collector
+
+PREDICTION_ROUTE = re.compile(r'^/(\d+)/(\d+)$')
+TEAM_STATS_ROUTE = re.compile(r'^/get-stats/(\d+)$')
+BULK_STATS_ROUTE = '/get-stats'
+
+state_config = config_from_env()
+cache_size = int(os.environ.get('PREDICTION_CACHE_SIZE', 0))
+cache = None
+retry_after = int(os.environ.get('PREDICTION_RETRY_AFTER', 1))
+max_in_flight = int(os.environ.get('PREDICTION_MAX_IN_FLIGHT', 0))
+default_deadline_ms = float(os.environ.get('PREDICTION_DEADLINE_MS', 0))
+admission = AdmissionController(max_in_flight,
+                                max_waiting=int(os.environ.get('PREDICTION_MAX_WAITING', 64)),
+                                retry_after=retry_after) \
+    if max_in_flight else None
+
+
+def swap_state(old, new):
+    if cache is not None:
+        cache.reset(new.fingerprint)
+    old.close()
+
+
+predictions = HotReloader(lambda: PredictionState(**state_config).warm(),
+                          state_paths(state_config),
+                          interval=float(os.environ.get('PREDICTION_RELOAD_INTERVAL', 0)),
+                          on_swap=swap_state)
+stats = HotReloader(load_payloads, [RAW_STORE, CONFERENCES_PATH],
+                    interval=float(os.environ.get('STATS_RELOAD_INTERVAL', 0)))
+if cache_size:
+    cache = PredictionCache(cache_size, predictions.peek().fingerprint)
+
+REGISTRY.add_collector(reloader_collector("prediction_model", predictions))
+REGISTRY.add_collector(reloader_collector("stats_payloads", stats))
+REGISTRY.add_collector(stats_collector("prediction_admission",
+                                       lambda: admission.stats() if admission is not None else None))
+
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASGI_INFERENCE_THREADS', os.cpu_count() or 1)),
+                              thread_name_prefix="inference")
+
+
+##############################################################################
+##
+## Response helpers
+##
+##############################################################################
+
+async def respond(send, status, body, headers=(), content_type=b'application/json'):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type),
+                            (b'content-length', str(len(body)).encode())] + list(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def respond_json(send, status, obj, headers=()):
+    await respond(send, status, json.dumps(obj, sort_keys=True).encode(), headers)
+
+
+def query_int(query, name):
+    values = query.get(name)
+    try:
+        return int(values[0]) if values else None
+    except ValueError:
+        return None
+
+
+def request_deadline(scope):
+    """Deadline as a time.monotonic() value, from the header or the default."""
+    header = dict(scope.get('headers', [])).get(b'x-request-deadline-ms')
+    try:
+        budget_ms = float(header) if header else default_deadline_ms
+    except ValueError:
+        budget_ms = default_deadline_ms
+    return time.monotonic() + budget_ms / 1000.0 if budget_ms else None
+
+
+##############################################################################
+##
+## Routes
+##
+##############################################################################
+
+def admitted_prediction(state, team1, team2, season, deadline):
+    """Run on an inference thread, holding an admission slot if enabled."""
+    if admission is None:
+        return state.predict_matchup(team1, team2, season, cache, deadline=deadline)
+    admission.acquire(deadline)
+    try:
+        return state.predict_matchup(team1, team2, season, cache, deadline=deadline)
+    except DeadlineExceeded:
+        admission.record_expired()
+        raise
+    finally:
+        admission.release()
+
+
+async def prediction(send, scope, query, team1, team2):
+    state = predictions.current
+    season = query_int(query, 'season')
+    loop = asyncio.get_running_loop()
+    pred = await loop.run_in_executor(executor, admitted_prediction, state, team1, team2, season,
+                                      request_deadline(scope))
+
+    with STAGE_SECONDS.time(stage='serialization'):
+        out = {}
+        out[str(team1)] = str(pred[0][0])
+        out[str(team2)] = str(pred[0][1])
+        body = json.dumps(out, sort_keys=True).encode()
+    await respond(send, 200, body, [(b'x-model-version', state.version.encode())])
+
+
+async def stat_payload(send, scope, payloads, payload):
+    body, etag = payload
+    etag = ('"%s"' % etag).encode()
+    headers = [(b'etag', etag), (b'cache-control', b'no-cache'),
+               (b'x-stats-version', (payloads.version or '').encode())]
+
+    if_none_match = dict(scope.get('headers', [])).get(b'if-none-match', b'')
+    if etag in [tag.strip() for tag in if_none_match.split(b',')] or if_none_match.strip() == b'*':
+        await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    await respond(send, 200, body, headers)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def route(scope, send):
+    """Serve one request, returns the route name it matched."""
+    path = scope['path']
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if scope['method'] not in ('GET', 'HEAD'):
+        await respond_json(send, 405, {'error': 'Method not allowed'})
+        return 'unmatched'
+
+    name = 'unmatched'
+    try:
+        match = PREDICTION_ROUTE.match(path)
+        if match:
+            name = 'prediction'
+            await prediction(send, scope, query, int(match.group(1)), int(match.group(2)))
+            return name
+
+        match = TEAM_STATS_ROUTE.match(path)
+        if match:
+            name = 'team_stats'
+            payloads = stats.current
+            with STAGE_SECONDS.time(stage='feature_lookup'):
+                payload = payloads.team(int(match.group(1)), query_int(query, 'season'))
+            await stat_payload(send, scope, payloads, payload)
+            return name
+
+        if path == BULK_STATS_ROUTE:
+            name = 'bulk_stats'
+            payloads = stats.current
+            conference = query.get('conference', [None])[0]
+            with STAGE_SECONDS.time(stage='feature_lookup'):
+                payload = payloads.bulk(query_int(query, 'season'), conference)
+            await stat_payload(send, scope, payloads, payload)
+            return name
+
+        if path == '/metrics':
+            await respond(send, 200, REGISTRY.render().encode(), content_type=CONTENT_TYPE.encode())
+            return 'metrics'
+
+        await respond_json(send, 404, {'error': 'Not found'})
+    except UnknownTeam as error:
+        await respond_json(send, 404, {'error': str(error)})
+    except QueueFull as error:
+        await respond_json(send, 503, {'error': str(error)}, [(b'retry-after', str(retry_after).encode())])
+    except Overloaded as error:
+        await respond_json(send, 503, {'error': str(error)}, [(b'retry-after', str(error.retry_after).encode())])
+    except DeadlineExceeded as error:
+        await respond_json(send, 504, {'error': str(error)})
+    return name
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    start = time.perf_counter()
+    status = {}
+
+    async def send_and_record(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+        elif message['type'] == 'http.response.body' and scope['method'] == 'HEAD':
+            ### Keep the GET headers (content-length included), drop the body ###
+            message = dict(message, body=b'')
+        await send(message)
+
+    name = await route(scope, send_and_record)
+    record_request(name, status.get('code', 500), time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,304 @@
+##############################################################################
+##
+## backtest.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Season by season backtest scored the way the competition
+## is, on log loss over NCAA tournament games. For each held-out season the
+## tournament games from data/stage_2/NCAATourneyCompactResults.csv are
+## predicted in one batch as P(lower TeamID wins), the same orientation as
+## the kaggle submission, and scored on
+##      log_loss   accuracy   brier   ece (expected calibration error)
+## plus a reliability table of predicted vs observed win rate per bin.
+##
+## The model is either loaded (--weights, NumPy forward pass) or trained
+## per season (--train) on the regular season games before the held-out
+## season, with that season's regular season as the early stopping set, so
+## no tournament result leaks into training.
+##
+## Seasons run in parallel worker processes. Each result is cached in
+## .backtest_cache/ under a hash of the season, the model config and the
+## contents of every input file and of the scoring code (and the training
+## code when training), so an unchanged season is never recomputed.
+##
+## Usage:
+##      python backtest.py [--seasons 2015 2016 ...] [--weights FILE]
+##                         [--model FILE] [--processes N] [--no-cache]
+##          Backtest saved weights (default weights/best_model.h5).
+##      python backtest.py --train '{"layers": [128, 64], "epochs": 50}'
+##          Train a fresh model for every season from the given
+##          train_model.py parameters.
+##      python backtest.py --promote weights/<candidate>.h5 [--margin 0.0]
+##          Backtest the candidate and the current best model and replace
+##          weights/best_model.h5 with the candidate only if its mean log
+##          loss beats the current one by more than --margin. Exits 1 when
+##          the candidate is rejected.
+##
+##############################################################################
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from feature_store import NORMALIZED_STORE, load_or_build_store
+from feature_lookup import FeatureLookup
+from inference import MODEL_PATH, WEIGHTS_PATH, load_model
+from normalization import ScalerMismatch, check_weights, read_scaler_info, weights_scaler_path, write_scaler_info
+from prediction_matrix import fingerprint
+from sweep import limit_threads, log_loss
+
+TOURNEY_RESULTS_PATH = os.path.normpath("data/stage_2/NCAATourneyCompactResults.csv")
+REGULAR_SEASON_PATH = os.path.normpath("data/stage_2/RegularSeasonDetailedResults.csv")
+CACHE_DIR = os.path.normpath(".backtest_cache")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINING_CODE = [os.path.join(REPO_DIR, name) for name in ["train_model.py", "training_input.py", "training_data.py"]]
+SCORING_CODE = [os.path.join(REPO_DIR, name)
+                for name in ["inference.py", "feature_lookup.py", "feature_store.py", "normalization.py"]]
+
+
+##############################################################################
+##
+## Scoring
+##
+##############################################################################
+
+def tourney_games(season, results_path=TOURNEY_RESULTS_PATH):
+    """(team1, team2, team1_won) for a season's tournament, team1 < team2."""
+    results = pd.read_csv(results_path)
+    results = results[results['Season'] == season]
+    winners = results['WTeamID'].values
+    losers = results['LTeamID'].values
+    team1 = np.minimum(winners, losers)
+    return team1, np.maximum(winners, losers), (winners == team1).astype(np.float64)
+
+
+def calibration(probs, outcomes, bins=10):
+    """Reliability table and expected calibration error over equal width bins."""
+    which = np.minimum((probs * bins).astype(int), bins - 1)
+    table = []
+    ece = 0.0
+    for b in range(bins):
+        mask = which == b
+        if not mask.any():
+            continue
+        predicted, observed = float(probs[mask].mean()), float(outcomes[mask].mean())
+        ece += mask.sum() / float(len(probs)) * abs(predicted - observed)
+        table.append({'bin': "%.1f-%.1f" % (b / float(bins), (b + 1) / float(bins)),
+                      'games': int(mask.sum()), 'predicted': predicted, 'observed': observed})
+    return table, ece
+
+
+def score(probs, outcomes):
+    probs = np.asarray(probs, dtype=np.float64)
+    table, ece = calibration(probs, outcomes)
+    return {'games': int(len(probs)),
+            'log_loss': log_loss(np.stack((outcomes, 1 - outcomes), axis=1), np.stack((probs, 1 - probs), axis=1)),
+            'accuracy': float(np.mean((probs > 0.5) == (outcomes > 0.5))),
+            'brier': float(np.mean((probs - outcomes) ** 2)),
+            'ece': ece,
+            'calibration': table}
+
+
+##############################################################################
+##
+## Per season workers
+##
+##############################################################################
+
+def train_season_model(season, params, work_dir):
+    """Train on the regular seasons before season, return the Keras model."""
+    import train_model
+    from training_data import SCALER_INFO_FILE, orient_games, write_dataset
+
+    lookup = FeatureLookup(load_or_build_store(NORMALIZED_STORE))
+    games = pd.read_csv(REGULAR_SEASON_PATH, usecols=['Season', 'WTeamID', 'LTeamID', 'WLoc'])
+    home, away, seasons, home_won = orient_games(games)
+    train, val = seasons < season, seasons == season
+    if not train.any() or not val.any():
+        raise ValueError("Season %d needs earlier seasons to train on and its own regular season" % season)
+
+    train_dir, val_dir = os.path.join(work_dir, "train"), os.path.join(work_dir, "val")
+    write_dataset(lookup, home[train], away[train], seasons[train], home_won[train], train_dir)
+    write_dataset(lookup, home[val], away[val], seasons[val], home_won[val], val_dir)
+    write_scaler_info(os.path.join(train_dir, SCALER_INFO_FILE), lookup.scaler_info)
+
+    settings = dict(layers=train_model.LAYERS, alpha=train_model.ALPHA, batch_size=train_model.BATCH_SIZE,
+                    epochs=train_model.EPOCHS, patience=train_model.PATIENCE)
+    settings.update(params)
+    train_batches, val_batches = train_model.training_sequences(settings['batch_size'], train_dir, val_dir)
+    model = train_model.build_model(train_batches.input_dim, settings['layers'], settings['alpha'])
+    checkpoint_path = os.path.join(work_dir, "best.h5")
+    train_model.train(model, train_batches, val_batches, epochs=settings['epochs'],
+                      patience=settings['patience'], checkpoint_path=checkpoint_path, workers=1,
+                      train_dir=train_dir)
+    model.load_weights(checkpoint_path)
+    return model
+
+
+def run_season(season, config):
+    """Predict and score one held-out season's tournament."""
+    team1, team2, outcomes = tourney_games(season)
+    if len(team1) == 0:
+        raise ValueError("No tournament games for season %d" % season)
+
+    with tempfile.TemporaryDirectory(prefix="backtest-%d-" % season) as work_dir:
+        if config['mode'] == 'train':
+            model = train_season_model(season, config['params'], work_dir)
+        else:
+            model = load_model(config['model_path'], config['weights_path'], backend='numpy')
+        lookup = FeatureLookup(load_or_build_store(NORMALIZED_STORE))
+        probs = model.predict(lookup.matchups(team1, team2, season), batch_size=8192)[:, 0]
+
+    result = score(probs, outcomes)
+    result['season'] = season
+    return result
+
+
+##############################################################################
+##
+## Cache and driver
+##
+##############################################################################
+
+def cache_key(season, config):
+    paths = [NORMALIZED_STORE, TOURNEY_RESULTS_PATH] + SCORING_CODE
+    if config['mode'] == 'train':
+        paths += [REGULAR_SEASON_PATH] + TRAINING_CODE
+    else:
+        paths += [config['model_path'], config['weights_path']]
+    description = json.dumps({'season': season, 'config': config}, sort_keys=True)
+    return hashlib.sha1((description + fingerprint(*paths)).encode()).hexdigest()
+
+
+def backtest(seasons, config, processes=None, threads=1, use_cache=True):
+    """Results for every season, from the cache where the inputs are unchanged."""
+    results = {}
+    pending = []
+    for season in seasons:
+        path = os.path.join(CACHE_DIR, cache_key(season, config) + ".json")
+        if use_cache and os.path.exists(path):
+            with open(path, "r") as cache_file:
+                results[season] = json.load(cache_file)
+        else:
+            pending.append((season, path))
+
+    if pending:
+        context = multiprocessing.get_context('spawn')
+        workers = min(len(pending), processes or max(1, (os.cpu_count() or 1) // threads))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=limit_threads, initargs=(threads,)) as pool:
+            futures = [(season, path, pool.submit(run_season, season, config)) for season, path in pending]
+            for season, path, future in futures:
+                results[season] = future.result()
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                with open(path + ".tmp", "w") as cache_file:
+                    json.dump(results[season], cache_file, indent=2)
+                os.replace(path + ".tmp", path)
+
+    return [results[season] for season in seasons]
+
+
+def summarize(results):
+    """Per season table and the mean over seasons (weighted by games for log loss)."""
+    table = pd.DataFrame([{key: value for key, value in result.items() if key != 'calibration'}
+                          for result in results]).set_index('season')
+    games = table['games'].sum()
+    mean = {'games': games,
+            'log_loss': (table['log_loss'] * table['games']).sum() / games,
+            'accuracy': (table['accuracy'] * table['games']).sum() / games,
+            'brier': (table['brier'] * table['games']).sum() / games,
+            'ece': table['ece'].mean()}
+    return table, mean
+
+
+def report(name, results):
+    table, mean = summarize(results)
+    print("%s\n%s" % (name, table[['games', 'log_loss', 'accuracy', 'brier', 'ece']].to_string(float_format="%.4f")))
+    print("all seasons: log_loss=%.4f accuracy=%.4f brier=%.4f ece=%.4f\n" %
+          (mean['log_loss'], mean['accuracy'], mean['brier'], mean['ece']))
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the model on past NCAA tournaments.")
+    parser.add_argument("--seasons", type=int, nargs='+', default=None,
+                        help="held-out seasons (default: every season with tournament results and stats)")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--weights", default=WEIGHTS_PATH)
+    parser.add_argument("--train", default=None,
+                        help="JSON train_model.py parameters, train a model per season")
+    parser.add_argument("--promote", default=None,
+                        help="candidate weights to promote to %s if they backtest better" % WEIGHTS_PATH)
+    parser.add_argument("--margin", type=float, default=0.0,
+                        help="log loss improvement required to promote")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=1,
+                        help="BLAS/TensorFlow threads per worker")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default=None,
+                        help="write the full results (with calibration tables) as JSON")
+    args = parser.parse_args()
+
+    seasons = args.seasons
+    if seasons is None:
+        played = set(pd.read_csv(TOURNEY_RESULTS_PATH, usecols=['Season'])['Season'])
+        stored = load_or_build_store(NORMALIZED_STORE).seasons.tolist()
+        seasons = sorted(int(s) for s in played & set(stored))
+
+    def run(config):
+        return backtest(seasons, config, args.processes, args.threads, not args.no_cache)
+
+    if args.promote:
+        if os.path.normpath(args.model) != MODEL_PATH:
+            print("Only weights for %s can be promoted to %s" % (MODEL_PATH, WEIGHTS_PATH))
+            sys.exit(1)
+        try:
+            check_weights(args.promote, load_or_build_store(NORMALIZED_STORE).scaler)
+        except ScalerMismatch as error:
+            print("Cannot promote: %s" % error)
+            sys.exit(1)
+        current = report("current %s" % WEIGHTS_PATH,
+                         run({'mode': 'load', 'model_path': MODEL_PATH, 'weights_path': WEIGHTS_PATH}))
+        candidate = report("candidate %s" % args.promote,
+                           run({'mode': 'load', 'model_path': MODEL_PATH, 'weights_path': args.promote}))
+        if candidate['log_loss'] < current['log_loss'] - args.margin:
+            ### Copy then rename so a hot reloading service never sees a partial file, ###
+            ### the scaler stamp is renamed in after the weights it describes ###
+            stamp_path = weights_scaler_path(WEIGHTS_PATH)
+            shutil.copyfile(args.promote, WEIGHTS_PATH + ".tmp")
+            write_scaler_info(stamp_path + ".tmp", read_scaler_info(weights_scaler_path(args.promote)))
+            os.replace(WEIGHTS_PATH + ".tmp", WEIGHTS_PATH)
+            if os.path.exists(stamp_path + ".tmp"):
+                os.replace(stamp_path + ".tmp", stamp_path)
+            else:
+                write_scaler_info(stamp_path, None)
+            print("Promoted %s to %s (log loss %.4f -> %.4f)" %
+                  (args.promote, WEIGHTS_PATH, current['log_loss'], candidate['log_loss']))
+            return
+        print("Kept %s, candidate log loss %.4f does not beat %.4f by %.4f" %
+              (WEIGHTS_PATH, candidate['log_loss'], current['log_loss'], args.margin))
+        sys.exit(1)
+
+    if args.train is not None:
+        config = {'mode': 'train', 'params': json.loads(args.train)}
+    else:
+        config = {'mode': 'load', 'model_path': os.path.normpath(args.model),
+                  'weights_path': os.path.normpath(args.weights)}
+    results = run(config)
+    report(args.weights if config['mode'] == 'load' else "trained %s" % args.train, results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+##############################################################################
+##
+## batching.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Micro-batching request coalescer. Concurrent callers submit
+## single input rows, a background thread gathers them into one batch until
+## either max_batch_size rows are waiting or max_wait seconds have passed
+## since the first row arrived, runs one batched forward pass and hands
+## each caller back its own output row.
+##
+## close() stops the background thread once everything already queued has
+## been answered, later submissions are run synchronously instead.
+##
+## Rows submitted with a deadline that has passed by the time their batch
+## is formed are dropped with DeadlineExceeded instead of being predicted.
+##
+##############################################################################
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from admission import DeadlineExceeded, expired
+from metrics import BATCH_SIZE
+
+
+class QueueFull(Exception):
+    """Raised by submit() when max_queue requests are already waiting."""
+
+
+_CLOSE = object()
+
+
+class MicroBatcher(object):
+    """Coalesce single-row predict calls into batched ones."""
+
+    def __init__(self, predict, max_batch_size=64, max_wait=0.002, max_queue=1024):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+        ### Achieved batch size metrics ###
+        self.batches = 0
+        self.rows = 0
+        self.max_seen = 0
+        self.batch_sizes = {}
+        self.expired = 0
+
+    def _ensure_started_locked(self):
+        ### Threads do not survive a fork, so each worker process starts its own ###
+        if self._pid != os.getpid():
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, row, deadline=None):
+        """Queue an input block (usually one row), returns a Future for its output rows.
+
+        deadline is an optional time.monotonic() value after which the rows
+        are no longer worth predicting.
+        """
+        future = Future()
+        with self._lock:
+            if not self._closed:
+                self._ensure_started_locked()
+                if self._queue.qsize() >= self.max_queue:
+                    raise QueueFull("Prediction queue is full (%d waiting)" % self.max_queue)
+                self._queue.put_nowait((row, future, deadline))
+                return future
+
+        future.set_result(self.predict(row))
+        return future
+
+    def close(self):
+        """Answer what is queued, then stop the background thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._pid == os.getpid():
+                self._queue.put_nowait(_CLOSE)
+
+    def predict_one(self, row, timeout=None, deadline=None):
+        return self.submit(row, deadline).result(timeout)
+
+    def _collect(self):
+        """Gather the next batch, the second value is True once close() was seen."""
+        first = self._queue.get()
+        if first is _CLOSE:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _CLOSE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        closed = False
+        while not closed:
+            batch, closed = self._collect()
+            batch = self._drop_expired(batch)
+            if not batch:
+                continue
+            rows = [row for row, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+            try:
+                out = self.predict(np.concatenate(rows))
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+
+            start = 0
+            for row, future in zip(rows, futures):
+                future.set_result(out[start:start + len(row)])
+                start += len(row)
+            self._record(start)
+
+    def _drop_expired(self, batch):
+        live = []
+        for item in batch:
+            if expired(item[2]):
+                item[1].set_exception(DeadlineExceeded("Deadline passed while waiting for a batch"))
+                with self._lock:
+                    self.expired += 1
+            else:
+                live.append(item)
+        return live
+
+    def _record(self, size):
+        BATCH_SIZE.observe(size)
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        with self._lock:
+            self.batches += 1
+            self.rows += size
+            self.max_seen = max(self.max_seen, size)
+            self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+
+    def stats(self):
+        """Achieved batch sizes, bucketed by the next power of two."""
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'rows': self.rows,
+                'mean_batch_size': float(self.rows) / self.batches if self.batches else 0.0,
+                'max_batch_size_seen': self.max_seen,
+                'batch_size_buckets': {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                'queue_depth': self._queue.qsize(),
+                'expired': self.expired,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'max_queue': self.max_queue}
@@ -0,0 +1,294 @@
+##############################################################################
+##
+## benchmark.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Stage level benchmarks of the pipeline and the services on
+## synthetic data (see synthetic_data.py) at 1x, 10x or 100x the real
+## volume. Each scale runs in its own temporary working directory with the
+## generated data/stage_2 csvs and the repo's models/ and weights/, and
+## every stage runs as a separate process:
+##      data_manipulation    aggregation of the box scores (games/s)
+##      data_normalization   normalization of the yearly stats (rows/s)
+##      create_labels        training arrays (games/s)
+##      inference_single     one matchup per model call (predictions/s)
+##      inference_batched    every matchup of the last season (predictions/s)
+##      kaggle_submission    the sample submission (rows/s)
+##      prediction_service   GET /<team1>/<team2> latency (requests/s)
+##      stats_service        GET /get-stats/<team> latency (requests/s)
+## For every stage the wall time, the process's own peak RSS (wait4) and
+## the throughput are recorded, plus p50/p99 latency for the per request
+## stages, in a JSON results file.
+##
+## With --compare, the results are checked against a baseline results file
+## and any stage whose wall time (or peak RSS) grew by more than
+## --threshold is reported as a regression and the exit status is 1.
+##
+## Usage:
+##      python benchmark.py [--scales 1 10 100] [--stages ...]
+##                          [--output benchmark_results.json]
+##                          [--compare baseline.json] [--threshold 0.1]
+##      python benchmark.py --compare baseline.json --results new.json
+##          Compare two results files without running anything.
+##
+##############################################################################
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGES = ['data_manipulation', 'data_normalization', 'create_labels', 'inference_single',
+          'inference_batched', 'kaggle_submission', 'prediction_service', 'stats_service']
+LATENCY_SAMPLES = 2000
+
+### Commands run from the scale's working directory ###
+SCRIPT_STAGES = {
+    'data_manipulation': ["data_manipulation.py"],
+    'data_normalization': ["data_normalization.py", "custom_data/yearly_stats.p",
+                           "custom_data/yearly_stats_normalized.p"],
+    'create_labels': ["create_labels.py"],
+    'kaggle_submission': ["kaggle_submission.py"]}
+
+
+##############################################################################
+##
+## Stages measured inside their own process (--run-stage)
+##
+##############################################################################
+
+def latency_summary(latencies, extra=None):
+    latencies = np.asarray(latencies)
+    metrics = {'items': len(latencies), 'timed_wall': float(latencies.sum()),
+               'p50_ms': float(np.percentile(latencies, 50) * 1000),
+               'p99_ms': float(np.percentile(latencies, 99) * 1000)}
+    metrics.update(extra or {})
+    return metrics
+
+
+def random_matchups(lookup, count):
+    index = lookup.store.index
+    teams = index[index[:, 1] == lookup.latest_season, 0]
+    rng = np.random.default_rng(0)
+    return rng.choice(teams, count), rng.choice(teams, count)
+
+
+def run_inference_single():
+    from feature_store import FeatureStore, NORMALIZED_STORE
+    from feature_lookup import FeatureLookup
+    from inference import load_model
+
+    lookup = FeatureLookup(FeatureStore.load(NORMALIZED_STORE))
+    model = load_model()
+    latencies = []
+    for team1, team2 in zip(*random_matchups(lookup, LATENCY_SAMPLES)):
+        start = time.perf_counter()
+        model.predict(lookup.matchup(team1, team2))
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+def run_inference_batched():
+    from feature_store import FeatureStore, NORMALIZED_STORE
+    from feature_lookup import FeatureLookup
+    from inference import load_model
+    from prediction_matrix import build_matrix
+
+    lookup = FeatureLookup(FeatureStore.load(NORMALIZED_STORE))
+    model = load_model()
+    start = time.perf_counter()
+    matrix = build_matrix(lambda x: model.predict(x, batch_size=8192), lookup, lookup.latest_season)
+    return {'items': len(matrix.teams) ** 2, 'timed_wall': time.perf_counter() - start}
+
+
+def run_service(module, paths):
+    import importlib
+    app = importlib.import_module(module).app
+    client = app.test_client()
+    latencies = []
+    errors = 0
+    for path in paths:
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        response.close()
+        latencies.append(time.perf_counter() - start)
+        errors += response.status_code != 200
+    return latency_summary(latencies, {'errors': errors})
+
+
+def run_prediction_service():
+    from feature_store import FeatureStore, NORMALIZED_STORE
+    from feature_lookup import FeatureLookup
+
+    lookup = FeatureLookup(FeatureStore.load(NORMALIZED_STORE))
+    return run_service('prediction_web_service',
+                       ["/%d/%d" % pair for pair in zip(*random_matchups(lookup, LATENCY_SAMPLES))])
+
+
+def run_stats_service():
+    from feature_store import FeatureStore, RAW_STORE
+    from feature_lookup import FeatureLookup
+
+    lookup = FeatureLookup(FeatureStore.load(RAW_STORE))
+    teams, _ = random_matchups(lookup, LATENCY_SAMPLES)
+    return run_service('stat_web_service', ["/get-stats/%d" % team for team in teams])
+
+
+IN_PROCESS_STAGES = {
+    'inference_single': run_inference_single,
+    'inference_batched': run_inference_batched,
+    'prediction_service': run_prediction_service,
+    'stats_service': run_stats_service}
+
+
+##############################################################################
+##
+## Driver
+##
+##############################################################################
+
+def prepare(work_dir, scale):
+    """Generate the scale's data and copy in the model files."""
+    from synthetic_data import generate
+
+    counts = generate(os.path.join(work_dir, "data", "stage_2"), scale)
+    for directory in ["custom_data", "train_data", "val_data"]:
+        os.makedirs(os.path.join(work_dir, directory), exist_ok=True)
+    shutil.copytree(os.path.join(REPO_DIR, "models"), os.path.join(work_dir, "models"))
+    os.makedirs(os.path.join(work_dir, "weights"))
+    shutil.copy(os.path.join(REPO_DIR, "weights", "best_model.h5"), os.path.join(work_dir, "weights"))
+    return counts
+
+
+def stage_items(stage, counts):
+    """Work items per stage for the throughput of the script stages."""
+    return {'data_manipulation': counts['games'],
+            'data_normalization': counts['teams'] * counts['seasons'],
+            'create_labels': counts['games'],
+            'kaggle_submission': counts['submission_rows']}.get(stage)
+
+
+def run_stage(stage, work_dir, counts, log_file):
+    """Run one stage in a child process and measure it."""
+    metrics_path = os.path.join(work_dir, "%s.metrics.json" % stage)
+    if stage in SCRIPT_STAGES:
+        command = [sys.executable] + [os.path.join(REPO_DIR, SCRIPT_STAGES[stage][0])] + SCRIPT_STAGES[stage][1:]
+    else:
+        command = [sys.executable, os.path.abspath(__file__), "--run-stage", stage, "--metrics", metrics_path]
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=work_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    result = {'stage': stage, 'wall': wall, 'cpu': usage.ru_utime + usage.ru_stime,
+              'peak_rss_mb': usage.ru_maxrss / 1024.0, 'returncode': process.returncode}
+    if process.returncode == 0 and os.path.exists(metrics_path):
+        with open(metrics_path, "r") as metrics_file:
+            result.update(json.load(metrics_file))
+    else:
+        result['items'] = stage_items(stage, counts)
+    if result.get('items') and process.returncode == 0:
+        result['throughput'] = result['items'] / result.get('timed_wall', wall)
+    return result
+
+
+def run_benchmarks(scales, stages, keep=False):
+    results = []
+    for scale in scales:
+        work_dir = tempfile.mkdtemp(prefix="benchmark-%dx-" % scale)
+        try:
+            counts = prepare(work_dir, scale)
+            print("scale %dx: %d games, %d submission rows in %s" %
+                  (scale, counts['games'], counts['submission_rows'], work_dir))
+            with open(os.path.join(work_dir, "benchmark.log"), "wb") as log_file:
+                for stage in STAGES:
+                    if stage not in stages:
+                        continue
+                    result = run_stage(stage, work_dir, counts, log_file)
+                    result['scale'] = scale
+                    results.append(result)
+                    print("  %-20s %8.2fs %8.1f MB %s" %
+                          (stage, result['wall'], result['peak_rss_mb'],
+                           "%.0f/s" % result['throughput'] if 'throughput' in result
+                           else "FAILED (%d), see %s" % (result['returncode'], log_file.name)))
+        finally:
+            if not keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(baseline, current, threshold):
+    """Stages whose wall time or peak RSS regressed by more than threshold."""
+    base = {(r['stage'], r['scale']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        before = base.get((result['stage'], result['scale']))
+        if before is None or before.get('returncode') or result.get('returncode'):
+            continue
+        for metric in ['wall', 'peak_rss_mb']:
+            change = result[metric] / before[metric] - 1.0 if before[metric] else 0.0
+            flag = "REGRESSION" if change > threshold else ""
+            print("%-20s %4dx %-12s %10.2f -> %10.2f %+7.1f%% %s" %
+                  (result['stage'], result['scale'], metric, before[metric], result[metric], change * 100, flag))
+            if flag:
+                regressions.append((result['stage'], result['scale'], metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs='+', default=[1],
+                        help="data volume multiples of the real data")
+    parser.add_argument("--stages", nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="baseline results file")
+    parser.add_argument("--results", default=None,
+                        help="results file to compare instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown (or memory growth) that counts as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the working directories")
+    parser.add_argument("--run-stage", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--metrics", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        with open(args.metrics, "w") as metrics_file:
+            json.dump(IN_PROCESS_STAGES[args.run_stage](), metrics_file)
+        return
+
+    if args.results:
+        with open(args.results, "r") as results_file:
+            current = json.load(results_file)
+    else:
+        current = {'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   'python': platform.python_version(),
+                   'machine': platform.platform(),
+                   'cpus': os.cpu_count(),
+                   'results': run_benchmarks(args.scales, args.stages, args.keep)}
+        with open(args.output, "w") as output_file:
+            json.dump(current, output_file, indent=2)
+        print("Results written to %s" % args.output)
+
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            regressions = compare(json.load(baseline_file), current, args.threshold)
+        if regressions:
+            print("%d regressions over %.0f%%" % (len(regressions), args.threshold * 100))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
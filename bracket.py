@@ -0,0 +1,339 @@
+##############################################################################
+##
+## bracket.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Monte Carlo tournament simulator on top of the prediction
+## model. A season's bracket is read from
+##      data/stage_2/NCAATourneySeeds.csv  (Season, Seed, TeamID)
+##      data/stage_2/NCAATourneySlots.csv  (Season, Slot, StrongSeed, WeakSeed)
+## and every pairwise win probability it needs comes from a prediction
+## matrix (see prediction_matrix.py), one batched model pass.
+## P(a beats b) averages the model output for both orderings so that
+## P(a beats b) + P(b beats a) = 1.
+##
+## Tournaments are simulated as array operations: every slot is decided
+## for a whole chunk of simulations at once from one vector of uniform
+## draws, and chunks are split across worker processes with independent
+## random streams. The results are
+##      per team probability of winning a game in each round (R1 .. R6,
+##      play_in for the First Four slots without an R<n> prefix)
+##      the most likely bracket, the single set of winners with the
+##      highest probability under the model, found exactly by a dynamic
+##      program over the slot tree: for every slot and every team that
+##      can win it, the best log-probability of the games below it and
+##      the opponent that achieves it (a back-pointer to rebuild the
+##      picks from the championship down)
+##      the chalk bracket, which advances the favourite of every game in
+##      slot order. It is built game by game, so it can differ from the
+##      most likely bracket.
+## Every pick carries its matchup and simulated slot win probability.
+##
+## The prediction service serves the same result at /bracket/<season>. It
+## reads the CSVs once at startup (load_brackets) and keeps recent results
+## in a BracketCache keyed on the season, the model/stats fingerprint, the
+## number of simulations and the seed.
+##
+## Usage:
+##      python bracket.py [season] [--simulations 1000000] [--processes N]
+##                        [--seed N] [--output bracket.json]
+##
+##############################################################################
+
+import argparse
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from feature_store import UnknownSeason
+
+SEEDS_PATH = os.path.normpath("data/stage_2/NCAATourneySeeds.csv")
+SLOTS_PATH = os.path.normpath("data/stage_2/NCAATourneySlots.csv")
+PLAY_IN = "play_in"
+
+
+class Bracket(object):
+    """A season's seeds and slots compiled to node indices.
+
+    Nodes 0 .. S-1 are the seeds and S .. S+K-1 the slots, in an order
+    where every slot comes after the two nodes that feed it.
+    """
+
+    def __init__(self, season, seed_labels, seed_teams, slots, strong, weak):
+        self.season = season
+        self.teams = np.unique(seed_teams)
+        self.seed_labels = seed_labels
+        self.seed_positions = np.searchsorted(self.teams, seed_teams)
+        self.slots = slots
+        self.strong = np.asarray(strong, dtype=np.int64)
+        self.weak = np.asarray(weak, dtype=np.int64)
+        self.rounds = [slot[:2] if re.match(r'^R\d', slot) else PLAY_IN for slot in slots]
+        self.round_names = sorted(set(self.rounds), key=lambda name: (name != PLAY_IN, name))
+
+    @classmethod
+    def load(cls, season, seeds_path=SEEDS_PATH, slots_path=SLOTS_PATH):
+        return cls.from_frames(season, pd.read_csv(seeds_path), pd.read_csv(slots_path))
+
+    @classmethod
+    def from_frames(cls, season, seeds, slots):
+        """Compile one season out of the seeds and slots frames of every season."""
+        seeds = seeds[seeds['Season'] == season]
+        slots = slots[slots['Season'] == season]
+        if seeds.shape[0] == 0 or slots.shape[0] == 0:
+            raise UnknownSeason("No bracket for season %d" % season)
+
+        nodes = {label: i for i, label in enumerate(seeds['Seed'])}
+        pending = list(zip(slots['Slot'], slots['StrongSeed'], slots['WeakSeed']))
+        names, strong, weak = [], [], []
+        while pending:
+            ready = [slot for slot in pending if slot[1] in nodes and slot[2] in nodes]
+            if not ready:
+                raise ValueError("Slots %s of season %d reference unknown seeds or slots" %
+                                 (", ".join(slot[0] for slot in pending), season))
+            for name, strong_seed, weak_seed in ready:
+                nodes[name] = len(nodes)
+                names.append(name)
+                strong.append(nodes[strong_seed])
+                weak.append(nodes[weak_seed])
+            pending = [slot for slot in pending if slot[0] not in nodes]
+
+        return cls(season, list(seeds['Seed']), seeds['TeamID'].values, names, strong, weak)
+
+    def seed_of(self):
+        """Team -> seed label."""
+        return {int(self.teams[pos]): label for pos, label in zip(self.seed_positions, self.seed_labels)}
+
+
+def load_brackets(seeds_path=SEEDS_PATH, slots_path=SLOTS_PATH):
+    """{season: Bracket} for every season with both seeds and slots, reading the CSVs once."""
+    seeds = pd.read_csv(seeds_path)
+    slots = pd.read_csv(slots_path)
+    seasons = sorted(set(seeds['Season']) & set(slots['Season']))
+    return {int(season): Bracket.from_frames(season, seeds, slots) for season in seasons}
+
+
+class BracketCache(object):
+    """Thread-safe LRU of run_bracket results.
+
+    Keys are (season, fingerprint, simulations, seed), so a reloaded model
+    never gets a result of the old one. Concurrent misses on the same key
+    may both simulate, the last one is kept.
+    """
+
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_run(self, key, run):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = run()
+
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'capacity': self.capacity, 'size': len(self._entries),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def win_probabilities(matrix, teams):
+    """(T x T) P(teams[i] beats teams[j]) from a PredictionMatrix."""
+    positions = matrix.positions_of(teams)
+    probs = matrix.probs[np.ix_(positions, positions)].astype(np.float64)
+    return (probs[:, :, 0] + probs[:, :, 1].T) / 2.0
+
+
+def simulate(bracket, probs, simulations, seed=None, chunk_size=100000):
+    """(K x T) count of simulated wins of every team in every slot."""
+    rng = np.random.default_rng(seed)
+    num_seeds = len(bracket.seed_positions)
+    counts = np.zeros((len(bracket.slots), len(bracket.teams)), dtype=np.int64)
+
+    for start in range(0, simulations, chunk_size):
+        size = min(chunk_size, simulations - start)
+        occupants = np.empty((num_seeds + len(bracket.slots), size), dtype=np.int16)
+        occupants[:num_seeds] = bracket.seed_positions[:, None]
+        for k in range(len(bracket.slots)):
+            a, b = occupants[bracket.strong[k]], occupants[bracket.weak[k]]
+            winner = np.where(rng.random(size) < probs[a, b], a, b)
+            occupants[num_seeds + k] = winner
+            counts[k] += np.bincount(winner, minlength=len(bracket.teams))
+    return counts
+
+
+def simulate_parallel(bracket, probs, simulations, processes=None, seed=None):
+    """simulate() split across worker processes, one random stream each."""
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or simulations < 2 * processes:
+        return simulate(bracket, probs, simulations, seed)
+
+    shares = [simulations // processes + (i < simulations % processes) for i in range(processes)]
+    streams = np.random.SeedSequence(seed).spawn(processes)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return sum(pool.map(simulate, [bracket] * processes, [probs] * processes, shares, streams))
+
+
+def bracket_picks(bracket, probs, counts, simulations, winners):
+    """JSON-ready picks from the winner (team position) of every node."""
+    picks = []
+    for k, slot in enumerate(bracket.slots):
+        a, b = winners[bracket.strong[k]], winners[bracket.weak[k]]
+        winner = winners[len(bracket.seed_positions) + k]
+        loser = b if winner == a else a
+        picks.append({'slot': slot,
+                      'strong': int(bracket.teams[a]),
+                      'weak': int(bracket.teams[b]),
+                      'winner': int(bracket.teams[winner]),
+                      'matchup_probability': float(probs[winner, loser]),
+                      'slot_probability': float(counts[k, winner]) / simulations})
+    return picks
+
+
+def most_likely_bracket(bracket, probs, counts, simulations):
+    """The bracket with the highest joint probability, and its log-probability.
+
+    best[n][t] is the highest log-probability of the games below node n
+    with team position t winning n (-inf if t cannot), and opponent[k][t]
+    the team t beats in slot k on that best path.
+    """
+    num_seeds = len(bracket.seed_positions)
+    with np.errstate(divide='ignore'):
+        log_probs = np.log(probs)
+
+    best = []
+    for position in bracket.seed_positions:
+        scores = np.full(len(bracket.teams), -np.inf)
+        scores[position] = 0.0
+        best.append(scores)
+
+    opponent = []
+    for k in range(len(bracket.slots)):
+        strong, weak = best[bracket.strong[k]], best[bracket.weak[k]]
+        ### Either side's possible winners against the best opponent from the other side ###
+        from_strong = weak[None, :] + log_probs
+        from_weak = strong[None, :] + log_probs
+        beat_strong, beat_weak = from_strong.argmax(axis=1), from_weak.argmax(axis=1)
+        rows = np.arange(len(bracket.teams))
+        on_strong = np.isfinite(strong)
+        best.append(np.where(on_strong, strong + from_strong[rows, beat_strong],
+                             weak + from_weak[rows, beat_weak]))
+        opponent.append(np.where(on_strong, beat_strong, beat_weak))
+
+    ### Follow the back-pointers down from the slot no other slot feeds ###
+    fed = set(bracket.strong) | set(bracket.weak)
+    root = [num_seeds + k for k in range(len(bracket.slots)) if num_seeds + k not in fed][0]
+    winners = {root: int(np.argmax(best[root]))}
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        if node < num_seeds:
+            continue
+        k = node - num_seeds
+        winner, strong, weak = winners[node], bracket.strong[k], bracket.weak[k]
+        if np.isfinite(best[strong][winner]):
+            winners[strong], winners[weak] = winner, int(opponent[k][winner])
+        else:
+            winners[strong], winners[weak] = int(opponent[k][winner]), winner
+        pending += [strong, weak]
+
+    return bracket_picks(bracket, probs, counts, simulations, winners), float(best[root].max())
+
+
+def chalk_bracket(bracket, probs, counts, simulations):
+    """Advance the favourite of every game, slot by slot."""
+    winners = list(bracket.seed_positions)
+    for k in range(len(bracket.slots)):
+        a, b = winners[bracket.strong[k]], winners[bracket.weak[k]]
+        winners.append(a if probs[a, b] >= probs[b, a] else b)
+    return bracket_picks(bracket, probs, counts, simulations, winners)
+
+
+def advancement(bracket, counts, simulations):
+    """Per team probability of winning a game in each round."""
+    rounds = np.asarray(bracket.rounds)
+    table = pd.DataFrame({name: counts[rounds == name].sum(axis=0) / float(simulations)
+                          for name in bracket.round_names}, index=bracket.teams)
+    table.index.name = 'team'
+    table.insert(0, 'seed', pd.Series(bracket.seed_of()))
+    return table.sort_values(bracket.round_names[::-1], ascending=False)
+
+
+def run_bracket(bracket, matrix, simulations, processes=1, seed=None):
+    """Simulate a bracket and return the JSON-ready results."""
+    probs = win_probabilities(matrix, bracket.teams)
+    counts = simulate_parallel(bracket, probs, simulations, processes, seed)
+    table = advancement(bracket, counts, simulations)
+    most_likely, log_probability = most_likely_bracket(bracket, probs, counts, simulations)
+    return {'season': bracket.season,
+            'simulations': simulations,
+            'rounds': bracket.round_names,
+            'teams': [dict(team=int(team), **{key: (value if key == 'seed' else float(value))
+                                               for key, value in row.items()})
+                      for team, row in table.iterrows()],
+            'most_likely_bracket': most_likely,
+            'most_likely_log_probability': log_probability,
+            'chalk_bracket': chalk_bracket(bracket, probs, counts, simulations)}
+
+
+def main():
+    from feature_store import NORMALIZED_STORE, load_or_build_store
+    from feature_lookup import FeatureLookup
+    from inference import WEIGHTS_PATH, load_model
+    from normalization import check_weights
+    from prediction_matrix import load_or_build
+
+    parser = argparse.ArgumentParser(description="Simulate a season's NCAA tournament.")
+    parser.add_argument("season", type=int, nargs='?', default=None)
+    parser.add_argument("--simulations", type=int, default=1000000)
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: cores)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None,
+                        help="write the full results as JSON")
+    args = parser.parse_args()
+
+    stats = FeatureLookup(load_or_build_store(NORMALIZED_STORE))
+    season = stats.season_or_latest(args.season)
+    bracket = Bracket.load(season)
+    check_weights(WEIGHTS_PATH, stats.scaler_info)
+    model = load_model()
+    matrix = load_or_build(lambda x: model.predict(x, batch_size=8192), stats, season)
+
+    result = run_bracket(bracket, matrix, args.simulations, args.processes, args.seed)
+    table = pd.DataFrame(result['teams']).set_index('team')
+    print(table.to_string(float_format="%.4f"))
+    for title, key in (("Most likely bracket (log-probability %.2f)" % result['most_likely_log_probability'],
+                        'most_likely_bracket'),
+                       ("Chalk bracket (favourite of every game)", 'chalk_bracket')):
+        print("\n%s:" % title)
+        for pick in result[key]:
+            print("%-6s %5d vs %5d -> %5d (matchup %.3f, slot %.3f)" %
+                  (pick['slot'], pick['strong'], pick['weak'], pick['winner'],
+                   pick['matchup_probability'], pick['slot_probability']))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(result, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,81 +3,64 @@
 ## create_labels.py
 ##
 ## @author: Matthew Cline
-## @version: 20190319
+## @version: 20261018
 ##
-## Description: Creates a training set by iterating through the regular
-## season game data to build a new dataframe with the following attributes
+## Description: Creates a training set from the regular season game data.
+## Each game is oriented as
 ##      home_team
 ##      away_team
 ##      season
 ##      home_team_outcome
 ##      away_team_outcome
-## the first three values will be used to pull the appropriate record from
-## the yearly stats dataframe, and the last two serve as the labels for the 
-## model.
+## for every game at once, the first three values select the matchup
+## vectors from the normalized feature store (both orderings in one gather)
+## and the last two serve as the labels for the model. See training_data.py
+## for the row layout and the output files.
+##
+## Usage:
+##      python create_labels.py [--val-season 2018] [--dtype float32]
+##          Games from seasons before --val-season are written to
+##          train_data/, that season and later to val_data/.
 ##
 ##############################################################################
 
-import numpy as np
-import pickle
-import pandas as pd
+import argparse
 import os
-from tqdm import tqdm
-
-### Read in data from csv ###
-raw_data = pd.read_csv(os.path.normpath("data/stage_2/RegularSeasonDetailedResults.csv"))
-team_data = pickle.load(open(os.path.normpath("custom_data/yearly_stats_normalized.p"), "rb"))
-data = []
-labels = []
-val_data = []
-val_labels = []
+import pandas as pd
+from feature_store import NORMALIZED_STORE, load_or_build_store
+from feature_lookup import FeatureLookup
+from training_data import SCALER_INFO_FILE, TRAIN_DIR, VAL_DIR, orient_games, write_dataset
+from normalization import write_scaler_info
+from profiling import phase
 
-### Reformat the data into new dataframe ###
-for idx, row in tqdm(raw_data.iterrows(), total=raw_data.shape[0]):
-    if row['WLoc'] == 'H':
-        season = row['Season']
-        home_team = row['WTeamID']
-        away_team = row['LTeamID']
-        if season < 2018:
-            labels.append(np.array([1.0, 0.0]))
-            labels.append(np.array([0.0, 1.0]))
-        else:
-            val_labels.append(np.array([1.0, 0.0]))
-            val_labels.append(np.array([0.0, 1.0]))
-    else:
-        season = row['Season']
-        away_team = row['WTeamID']
-        home_team = row['LTeamID']
-        if season < 2018:
-            labels.append(np.array([0.0, 1.0]))
-            labels.append(np.array([1.0, 0.0]))
-        else:
-            val_labels.append(np.array([0.0, 1.0]))
-            val_labels.append(np.array([1.0, 0.0]))
+parser = argparse.ArgumentParser(description="Build the training and validation arrays.")
+parser.add_argument("--val-season", type=int, default=2018,
+                    help="first season held out for validation")
+parser.add_argument("--dtype", default="float32",
+                    help="dtype of the written arrays")
+parser.add_argument("--chunk-size", type=int, default=65536,
+                    help="games gathered per chunk")
+args = parser.parse_args()
 
-    if season < 2018:
-        data.append(np.concatenate((team_data.loc[(home_team, season)].values,
-            team_data.loc[(away_team, season)].values)))
-        data.append(np.concatenate((team_data.loc[(away_team, season)].values,
-            team_data.loc[(home_team, season)].values)))
-    else:
-        val_data.append(np.concatenate((team_data.loc[(home_team, season)].values,
-            team_data.loc[(away_team, season)].values)))
-        val_data.append(np.concatenate((team_data.loc[(away_team, season)].values,
-            team_data.loc[(home_team, season)].values)))
+### Read in data from csv ###
+with phase("read_csv"):
+    raw_data = pd.read_csv(os.path.normpath("data/stage_2/RegularSeasonDetailedResults.csv"),
+                           usecols=['Season', 'WTeamID', 'LTeamID', 'WLoc'])
+with phase("load_store"):
+    team_data = FeatureLookup(load_or_build_store(NORMALIZED_STORE))
 
-data = np.array(data)
-labels = np.array(labels)
-val_data = np.array(val_data)
-val_labels = np.array(val_labels)
+### Orient every game and split on the validation season ###
+with phase("orient"):
+    home, away, season, home_won = orient_games(raw_data)
+    train = season < args.val_season
 
-print("data.shape = ", data.shape)
-print("labels.shape = ", labels.shape)
-print("val_data.shape = ", val_data.shape)
-print("val_labels.shape = ", val_labels.shape)
+for name, directory, mask in [("data", TRAIN_DIR, train), ("val_data", VAL_DIR, ~train)]:
+    with phase("write_" + name):
+        data_shape, labels_shape = write_dataset(team_data, home[mask], away[mask], season[mask], home_won[mask],
+                                                 directory, dtype=args.dtype, chunk_size=args.chunk_size)
+    print("%s.shape = " % name, data_shape)
+    print("%s.shape = " % name.replace("data", "labels"), labels_shape)
 
-### Dump data and labels to pickle objects ###
-pickle.dump(data, open(os.path.normpath("train_data/data.p"), "wb"))
-pickle.dump(labels, open(os.path.normpath("train_data/labels.p"), "wb"))
-pickle.dump(val_data, open(os.path.normpath("val_data/data.p"), "wb"))
-pickle.dump(val_labels, open(os.path.normpath("val_data/labels.p"), "wb"))
+### Record the scaler the features were normalized with, train_model.py
+### stamps it on the weights ###
+write_scaler_info(os.path.join(TRAIN_DIR, SCALER_INFO_FILE), team_data.store.scaler)
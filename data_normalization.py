@@ -3,26 +3,59 @@
 ## data_normalization.py
 ##
 ## @author: Matthew Cline
-## @version: 20190319
+## @version: 20261018
 ##
 ## Description: Normalize a pandas dataframe that is stored as a pickled 
 ## object. The object is passed in as an argument to the program.
 ##
+## The min/max of every column are saved as a scaler (see
+## normalization.py), so later incremental updates and the services can
+## normalize with the same parameters, and its fingerprint is recorded in
+## the store. They are taken over the whole frame like the original
+## normalization, --played-only fits on the team/seasons that played
+## instead, which needs the model retrained.
+##
+## Usage:
+##      python data_normalization.py <input pickle> <export pickle> [dtype]
+##                                   [--scaler custom_data/scaler.npz]
+##                                   [--scaler-dtype float64] [--played-only]
+##          Also writes a memory-mapped feature store next to the export
+##          pickle (see feature_store.py), float32 unless dtype is given.
+##
 ##############################################################################
 
-import pandas as pd
+import argparse
 import pickle
-import sys
 import os
+from feature_store import played_mask, store_path_for, write_store
+from normalization import SCALER_PATH, Scaler
+from profiling import phase
 
-if len(sys.argv) < 3:
-    print("You must pass an input file as the first argument and an export file as the second argument...")
-    exit(1)
+parser = argparse.ArgumentParser(description="Normalize the yearly stats.")
+parser.add_argument("input", help="pickled yearly stats frame")
+parser.add_argument("export", help="pickle to write the normalized frame to")
+parser.add_argument("dtype", nargs='?', default='float32',
+                    help="dtype of the memory-mapped feature store")
+parser.add_argument("--scaler", default=SCALER_PATH, help="where the scaler parameters are saved")
+parser.add_argument("--scaler-dtype", default='float64', choices=['float32', 'float64'],
+                    help="dtype of the saved minimum and maximum")
+parser.add_argument("--played-only", action="store_true",
+                    help="fit on the team/seasons that played only (retrain the model after)")
+args = parser.parse_args()
 
-import_path = os.path.normpath(sys.argv[1])
-export_path = os.path.normpath(sys.argv[2])
-df = pickle.load(open(import_path, "rb"))
+import_path = os.path.normpath(args.input)
+export_path = os.path.normpath(args.export)
+with phase("read_pickle"):
+    df = pickle.load(open(import_path, "rb"))
 
-normalized_df = (df - df.min())/(df.max() - df.min())
+with phase("fit_scaler"):
+    scaler = Scaler.fit_frame(df, dtype=args.scaler_dtype, played_only=args.played_only)
+    scaler.save(os.path.normpath(args.scaler))
+with phase("normalize"):
+    normalized_df = scaler.transform_frame(df)
 
-pickle.dump(normalized_df, open(export_path, "wb"))
+with phase("write_pickle"):
+    pickle.dump(normalized_df, open(export_path, "wb"))
+with phase("write_store"):
+    write_store(normalized_df, store_path_for(export_path), dtype=args.dtype, mask=played_mask(df),
+                scaler=scaler.info())
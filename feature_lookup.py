@@ -0,0 +1,125 @@
+##############################################################################
+##
+## feature_lookup.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Array-indexed matchup vector lookup on top of a feature
+## store. A dense (team - first_team, season - first_season) table holds
+## the row offset of every team/season in the store's feature matrix (-1
+## for pairs that never played), so building model inputs is a table read
+## and one fancy-index gather instead of pandas MultiIndex lookups.
+##
+## A matchup vector is the first team's features followed by the second
+## team's features, the same layout the model was trained on.
+##
+## Given a Scaler (see normalization.py) the lookup reads a raw store and
+## normalizes every gathered vector in place, so a service can serve from
+## the same raw stats as everything else instead of a normalized copy.
+##
+##############################################################################
+
+import numpy as np
+from feature_store import UnknownSeason, UnknownTeam
+
+
+class FeatureLookup(object):
+    """Gather (team1, team2, season) matchup vectors from a FeatureStore."""
+
+    def __init__(self, store, scaler=None):
+        self.store = store
+        self.features = store.features
+        self.num_features = store.num_features
+        self.width = 2 * self.num_features
+
+        ### Vectors normalized at lookup are float32 like the training data,
+        ### whatever the raw store holds ###
+        self.scaler = scaler
+        self.dtype = self.features.dtype
+        if scaler is not None:
+            scaler.check_columns(store.columns)
+            self.dtype = np.dtype(np.float32)
+            self._minimum = np.tile(scaler.minimum, 2).astype(self.dtype)
+            self._scale = np.tile(scaler.scale, 2).astype(self.dtype)
+
+        index = store.index
+        self.first_team = int(index[:, 0].min())
+        self.first_season = int(index[:, 1].min())
+        self.latest_season = int(index[:, 1].max())
+        shape = (int(index[:, 0].max()) - self.first_team + 1,
+                 self.latest_season - self.first_season + 1)
+
+        self.offsets = np.full(shape, -1, dtype=np.int64)
+        self.offsets[index[:, 0] - self.first_team, index[:, 1] - self.first_season] = \
+            np.arange(index.shape[0])
+
+    @property
+    def scaler_info(self):
+        """Fingerprint of the scaling the vectors come out with (see normalization.py)."""
+        return self.scaler.info() if self.scaler is not None else self.store.scaler
+
+    @property
+    def paths(self):
+        """Files the lookup's vectors depend on, for fingerprints."""
+        return [self.store.path] + ([self.scaler.path] if self.scaler is not None and self.scaler.path else [])
+
+    def season_or_latest(self, season):
+        return self.latest_season if season is None else season
+
+    def rows(self, teams, seasons):
+        """Row offsets for arrays of teams and seasons (broadcast together).
+
+        Raises UnknownTeam naming the first team/season that has no stats,
+        UnknownSeason if no team has stats in that season.
+        """
+        teams = np.asarray(teams, dtype=np.int64)
+        seasons = np.asarray(seasons, dtype=np.int64)
+        teams, seasons = np.broadcast_arrays(teams, seasons)
+        t = teams - self.first_team
+        s = seasons - self.first_season
+
+        in_range = (t >= 0) & (t < self.offsets.shape[0]) & (s >= 0) & (s < self.offsets.shape[1])
+        rows = np.full(teams.shape, -1, dtype=np.int64)
+        rows[in_range] = self.offsets[t[in_range], s[in_range]]
+
+        missing = rows < 0
+        if missing.any():
+            first = tuple(np.argwhere(missing)[0])
+            if not (s[first] >= 0 and s[first] < self.offsets.shape[1]
+                    and (self.offsets[:, s[first]] >= 0).any()):
+                raise UnknownSeason("No stats for season %d" % seasons[first])
+            raise UnknownTeam("No stats for team %d in season %d" % (teams[first], seasons[first]))
+        return rows
+
+    def matchup_rows(self, team1, team2, season=None):
+        """(N x 2) row offsets of the two teams of N matchups."""
+        season = self.season_or_latest(season)
+        team1, team2, season = np.broadcast_arrays(np.atleast_1d(team1), np.atleast_1d(team2),
+                                                   np.atleast_1d(season))
+        return self.rows(np.stack((team1, team2), axis=1), season[:, None])
+
+    def gather(self, rows, out=None):
+        """Build the (N x 2F) input matrix for matchup_rows in one gather."""
+        num_rows = rows.shape[0]
+        if out is None:
+            out = np.empty((num_rows, self.width), dtype=self.dtype)
+        np.take(self.features, rows, axis=0, out=out.reshape(num_rows, 2, self.num_features),
+                mode='clip')
+        if self.scaler is not None:
+            out -= self._minimum
+            out *= self._scale
+        return out
+
+    def matchups(self, team1, team2, season=None, out=None):
+        """Build an (N x 2F) input matrix for N matchups in one gather.
+
+        team1, team2 and season may be scalars or arrays; season defaults to
+        the latest season in the store. Pass a preallocated C-contiguous out
+        array of the lookup's dtype to avoid allocating per call.
+        """
+        return self.gather(self.matchup_rows(team1, team2, season), out=out)
+
+    def matchup(self, team1, team2, season=None, out=None):
+        """Build the (1 x 2F) input vector for a single matchup."""
+        return self.matchups(team1, team2, season, out=out)
@@ -0,0 +1,207 @@
+##############################################################################
+##
+## feature_store.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Compact memory-mapped store for the yearly stats frames.
+## A store is a directory holding
+##      features.npy  = (rows x columns) feature matrix, float32 by default
+##                      and float64 for the raw store, whose values the
+##                      stats service returns as they are
+##      index.npy     = (rows x 2) int32 array of (team, season) pairs
+##      schema.json   = column names, dtype and row count, plus the
+##                      fingerprint of the scaler for a normalized store
+## Only the team/seasons that actually played are written, so the all-zero
+## rows of the cartesian team x season frame are dropped. Loading maps the
+## feature matrix read-only with np.load(mmap_mode='r'), so every process
+## that opens the same store shares the same pages.
+##
+## A fresh checkout only has the pickles, so load_or_build_store writes a
+## missing store first: the raw store from custom_data/yearly_stats.p, the
+## normalized store by normalizing that frame (see normalization.py) so it
+## records the scaler it was normalized with.
+##
+## Usage:
+##      python feature_store.py --build
+##          Write the raw and normalized stores if they are missing (the
+##          Docker image does this at build time).
+##      python feature_store.py <pickled frame> [store dir] [dtype]
+##          Convert an existing yearly stats pickle into a store. The store
+##          dir defaults to the pickle path with a .store extension.
+##
+##############################################################################
+
+import json
+import os
+import pickle
+import sys
+import numpy as np
+import pandas as pd
+
+RAW_PICKLE = os.path.normpath("custom_data/yearly_stats.p")
+RAW_STORE = os.path.normpath("custom_data/yearly_stats.store")
+RAW_DTYPE = 'float64'
+NORMALIZED_STORE = os.path.normpath("custom_data/yearly_stats_normalized.store")
+
+FEATURES_FILE = "features.npy"
+INDEX_FILE = "index.npy"
+SCHEMA_FILE = "schema.json"
+
+
+class UnknownTeam(KeyError):
+    """No stats for a team in a season, which the services answer with a 404."""
+
+    def __str__(self):
+        ### KeyError would quote the message ###
+        return str(self.args[0]) if self.args else ""
+
+
+class UnknownSeason(UnknownTeam):
+    """No stats for any team in a season."""
+
+
+def store_path_for(pickle_path):
+    """Return the store directory that sits next to a pickled frame."""
+    return os.path.splitext(pickle_path)[0] + ".store"
+
+
+def _replace(path, write):
+    """Write a file through a temporary name and atomically move it in place.
+
+    Readers that already mapped the old file keep the old inode, so a store
+    can be rewritten underneath a running service.
+    """
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def played_mask(df):
+    """Rows of a yearly stats frame for team/seasons with at least one game."""
+    if 'games_home' in df.columns and 'games_away' in df.columns:
+        return ((df['games_home'] > 0) | (df['games_away'] > 0)).values
+    return (np.nan_to_num(df.values) != 0).any(axis=1)
+
+
+def write_store(df, path, dtype='float32', mask=None, scaler=None):
+    """Write a (team, year) indexed stats frame as a memory-mappable store.
+
+    mask selects the rows to keep, by default played_mask(df). Pass the raw
+    frame's mask for a normalized frame, whose game counts may scale to 0.
+    scaler is the Scaler.info() a normalized frame was scaled with.
+    """
+    os.makedirs(path, exist_ok=True)
+    df = df[played_mask(df) if mask is None else mask].sort_index()
+
+    index = np.array([df.index.get_level_values(0), df.index.get_level_values(1)],
+                     dtype=np.int32).T
+    schema = {
+        'columns': [str(col) for col in df.columns],
+        'index_names': list(df.index.names),
+        'dtype': np.dtype(dtype).name,
+        'rows': int(df.shape[0])}
+    if scaler is not None:
+        schema['scaler'] = scaler
+
+    def write_features(tmp_path):
+        features = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=df.shape)
+        features[:] = df.values
+        features.flush()
+        del features
+
+    def write_index(tmp_path):
+        with open(tmp_path, "wb") as index_file:
+            np.save(index_file, index)
+
+    def write_schema(tmp_path):
+        with open(tmp_path, "w") as schema_file:
+            json.dump(schema, schema_file, indent=2)
+
+    ### The schema is written last so it marks a complete store ###
+    _replace(os.path.join(path, FEATURES_FILE), write_features)
+    _replace(os.path.join(path, INDEX_FILE), write_index)
+    _replace(os.path.join(path, SCHEMA_FILE), write_schema)
+
+
+def load_or_build_store(path):
+    """Map a store, writing it first if it is missing (e.g. a fresh checkout)."""
+    if not os.path.exists(os.path.join(path, SCHEMA_FILE)):
+        if os.path.normpath(path) == NORMALIZED_STORE:
+            from normalization import build_normalized_store
+            build_normalized_store(path)
+        else:
+            with open(os.path.splitext(path)[0] + ".p", "rb") as pickle_file:
+                write_store(pickle.load(pickle_file), path, dtype=RAW_DTYPE)
+    return FeatureStore.load(path)
+
+
+class FeatureStore(object):
+    """Read-only view over a store written by write_store."""
+
+    def __init__(self, path, features, index, schema):
+        self.path = path
+        self.features = features
+        self.index = index
+        self.columns = schema['columns']
+        self.dtype = np.dtype(schema['dtype'])
+        self.scaler = schema.get('scaler')
+        self.teams = np.unique(index[:, 0]) if len(index) else np.array([], dtype=np.int32)
+        self.seasons = np.unique(index[:, 1]) if len(index) else np.array([], dtype=np.int32)
+        self._rows = {(int(team), int(season)): row for row, (team, season) in enumerate(index)}
+        self._columns = {col: i for i, col in enumerate(self.columns)}
+
+    @classmethod
+    def load(cls, path):
+        """Map a store from disk without copying the feature matrix."""
+        with open(os.path.join(path, SCHEMA_FILE), "r") as schema_file:
+            schema = json.load(schema_file)
+        features = np.load(os.path.join(path, FEATURES_FILE), mmap_mode='r')
+        index = np.load(os.path.join(path, INDEX_FILE))
+        return cls(path, features, index, schema)
+
+    @property
+    def num_features(self):
+        return len(self.columns)
+
+    def __contains__(self, key):
+        return (int(key[0]), int(key[1])) in self._rows
+
+    def position(self, team, season):
+        """Row offset of a (team, season) pair, UnknownTeam if it never played."""
+        try:
+            return self._rows[(int(team), int(season))]
+        except KeyError:
+            raise UnknownTeam("No stats for team %s in season %s" % (team, season))
+
+    def row(self, team, season):
+        """Feature vector of a (team, season) pair."""
+        return self.features[self.position(team, season)]
+
+    def column_index(self, name):
+        return self._columns[name]
+
+    def to_frame(self):
+        """Copy the store back into a (team, year) indexed DataFrame."""
+        index = pd.MultiIndex.from_arrays([self.index[:, 0], self.index[:, 1]], names=['team', 'year'])
+        return pd.DataFrame(np.array(self.features), index=index, columns=self.columns)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("You must pass a pickled yearly stats frame as the first argument...")
+        exit(1)
+
+    if sys.argv[1] == "--build":
+        for store_path in [RAW_STORE, NORMALIZED_STORE]:
+            print("%s: %d rows" % (store_path, load_or_build_store(store_path).index.shape[0]))
+        exit(0)
+
+    import_path = os.path.normpath(sys.argv[1])
+    export_path = os.path.normpath(sys.argv[2]) if len(sys.argv) > 2 else store_path_for(import_path)
+    dtype = sys.argv[3] if len(sys.argv) > 3 else 'float32'
+
+    df = pickle.load(open(import_path, "rb"))
+    write_store(df, export_path, dtype=dtype)
+    print("Wrote %s" % export_path)
@@ -0,0 +1,84 @@
+##############################################################################
+##
+## gunicorn.conf.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Production multi-worker serving for the web services.
+## The app module is imported once in the master (preload_app), so the
+## model weights and the memory-mapped feature store are loaded a single
+## time and shared copy-on-write by every forked worker. Background
+## threads (micro-batcher, hot reload watcher) start lazily in each worker.
+##
+## Every worker holds its own copy of the served state, so a POST to
+## /admin/reload only reloads the worker that takes it. Under gunicorn the
+## file watcher is therefore on by default (SERVE_RELOAD_INTERVAL) and
+## every worker picks up new weights or stats by itself within that many
+## seconds of the files changing. /admin/reload answers only localhost
+## unless PREDICTION_ADMIN_TOKEN / STATS_ADMIN_TOKEN is set (in a
+## container, requests from the host do not come from localhost).
+##
+## Usage:
+##      gunicorn -c gunicorn.conf.py prediction_web_service:app
+##      gunicorn -c gunicorn.conf.py stat_web_service:app
+##
+## Configuration (environment variables):
+##      SERVE_BIND              = address to listen on (default 0.0.0.0:5000)
+##      SERVE_WORKERS           = worker processes (default: one per core)
+##      SERVE_THREADS           = request threads per worker (default 4)
+##      SERVE_TIMEOUT           = seconds before a stuck worker is killed (30)
+##      SERVE_GRACEFUL_TIMEOUT  = seconds workers get to finish on restart (30)
+##      SERVE_MAX_REQUESTS      = recycle a worker after N requests (0 = never)
+##      SERVE_WARMUP            = run a prediction in each new worker (1)
+##      SERVE_BLAS_THREADS      = BLAS/OpenMP threads per worker (1)
+##      SERVE_RELOAD_INTERVAL   = default PREDICTION_RELOAD_INTERVAL and
+##                                STATS_RELOAD_INTERVAL in seconds (10)
+##
+## Send SIGHUP to the master for a graceful restart of all workers.
+##
+##############################################################################
+
+import gc
+import multiprocessing
+import os
+import sys
+
+### Limit math library threads before numpy is imported so N workers do
+### not each start a thread per core ###
+blas_threads = os.environ.get('SERVE_BLAS_THREADS', '1')
+for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(var, blas_threads)
+
+### Poll for new artifacts in every worker unless the services say otherwise ###
+reload_interval = os.environ.get('SERVE_RELOAD_INTERVAL', '10')
+for var in ('PREDICTION_RELOAD_INTERVAL', 'STATS_RELOAD_INTERVAL'):
+    os.environ.setdefault(var, reload_interval)
+
+bind = os.environ.get('SERVE_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('SERVE_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('SERVE_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('SERVE_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))
+max_requests = int(os.environ.get('SERVE_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+preload_app = True
+warmup = os.environ.get('SERVE_WARMUP', '1') == '1'
+
+
+def pre_fork(server, worker):
+    ### Keep the garbage collector from touching (and so copying) the
+    ### objects loaded in the master ###
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    if not warmup:
+        return
+    ### The Flask app's import_name is the service module holding the reloader ###
+    module = sys.modules.get(getattr(worker.wsgi, 'import_name', ''))
+    reloader = getattr(module, 'reloader', None)
+    state = reloader.current if reloader is not None else None
+    if hasattr(state, 'warm'):
+        state.warm()
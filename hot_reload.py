@@ -0,0 +1,147 @@
+##############################################################################
+##
+## hot_reload.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Zero-downtime reload of the artifacts a web service serves
+## from. A HotReloader owns the current state object (model + stats, or the
+## stats payloads), watches the files it was built from and, when one of
+## them changes or reload() is called, builds and warms a replacement in a
+## background thread. The new object is swapped in with a single reference
+## assignment, so requests that already took the old state finish on it.
+##
+## A build that fails (e.g. weights caught half written) is logged and the
+## old state keeps serving, the watcher retries it on its next poll.
+##
+## The services' POST /admin/reload is guarded by admin_allowed: with an
+## admin token configured (PREDICTION_ADMIN_TOKEN / STATS_ADMIN_TOKEN) the
+## request must send it as "Authorization: Bearer <token>", without one
+## only clients on the loopback interface may reload.
+##
+##############################################################################
+
+import hmac
+import ipaddress
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def signature(paths):
+    """Cheap change detector: (mtime, size) of every file under paths."""
+    sig = []
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if not name.endswith(".tmp"))
+        for file_path in files:
+            try:
+                stat = os.stat(file_path)
+                sig.append((file_path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                sig.append((file_path, None, None))
+    return tuple(sig)
+
+
+def admin_allowed(token, authorization, remote_addr):
+    """(allowed, HTTP status if not) for an admin request.
+
+    token is the configured admin token (None or empty for none),
+    authorization the request's Authorization header.
+    """
+    if token:
+        supplied = (authorization or "").partition("Bearer ")[2].strip()
+        if supplied and hmac.compare_digest(supplied.encode(), token.encode()):
+            return True, None
+        return False, 401
+    try:
+        if ipaddress.ip_address(remote_addr or "").is_loopback:
+            return True, None
+    except ValueError:
+        pass
+    return False, 403
+
+
+class HotReloader(object):
+    """Keep a state object current with the artifacts it was built from.
+
+    build() must return a ready (warmed) state. on_swap(old, new) is called
+    after every swap, e.g. to clear caches or stop the old state's threads.
+    """
+
+    def __init__(self, build, paths, interval=0, on_swap=None):
+        self.build = build
+        self.paths = paths
+        self.interval = interval
+        self.on_swap = on_swap
+        ### Built first, the build may write missing stores (see feature_store.py) ###
+        self._current = build()
+        self._signature = signature(paths)
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._watcher_pid = None
+        self.reloads = 0
+        self.failures = 0
+
+    @property
+    def current(self):
+        self._ensure_watching()
+        return self._current
+
+    def peek(self):
+        """The current state without starting the watcher, for use at import
+        time where the process may be a preloading gunicorn master."""
+        return self._current
+
+    def _ensure_watching(self):
+        ### The watcher thread is started lazily so forked workers get their own ###
+        if self.interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid != os.getpid():
+                self._watcher_pid = os.getpid()
+                threading.Thread(target=self._watch, name="hot-reload", daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            if signature(self.paths) != self._signature:
+                self.reload(background=False)
+
+    def reload(self, background=True):
+        """Build a new state and swap it in, returns False if one is already loading."""
+        with self._lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+
+        if background:
+            threading.Thread(target=self._reload, name="hot-reload-build", daemon=True).start()
+        else:
+            self._reload()
+        return True
+
+    def _reload(self):
+        try:
+            new_signature = signature(self.paths)
+            try:
+                new = self.build()
+            except Exception:
+                self.failures += 1
+                logger.exception("Reload failed, still serving the previous version")
+                return
+            old, self._current = self._current, new
+            self._signature = new_signature
+            self.reloads += 1
+            if self.on_swap is not None:
+                self.on_swap(old, new)
+            logger.info("Reloaded %s", getattr(new, 'version', ''))
+        finally:
+            with self._lock:
+                self._reloading = False
@@ -0,0 +1,183 @@
+##############################################################################
+##
+## inference.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: TensorFlow-free inference for the serving model. The model
+## is a plain stack of Dense layers with LeakyReLU and softmax activations,
+## so the forward pass is a handful of NumPy matrix multiplies. The
+## architecture is read from the Keras YAML in models/ and the weights from
+## the Keras .h5 file in weights/ (either a save_weights file or a full
+## model save with a model_weights group). The keras backend rebuilds the
+## model from the same parsed YAML (Sequential.from_config), so it does not
+## need model_from_yaml, which newer Keras versions removed.
+##
+## load_model() returns an object with a Keras style predict(x, batch_size)
+## for either backend, chosen by the backend argument or the MODEL_BACKEND
+## environment variable ('numpy' by default, 'keras' to use Keras itself).
+##
+## Usage:
+##      python inference.py --check [num_rows]
+##          Compare the NumPy backend against Keras on random inputs and
+##          exit non-zero if the outputs differ by more than 1e-5.
+##
+##############################################################################
+
+import os
+import sys
+import h5py
+import numpy as np
+import yaml
+
+MODEL_PATH = os.path.normpath("models/20190319.yaml")
+WEIGHTS_PATH = os.path.normpath("weights/best_model.h5")
+
+
+class _ConfigLoader(yaml.SafeLoader):
+    """Safe YAML loader that understands the !!python/tuple tags Keras writes."""
+
+
+_ConfigLoader.add_constructor(u'tag:yaml.org,2002:python/tuple',
+                              lambda loader, node: tuple(loader.construct_sequence(node)))
+
+
+##############################################################################
+##
+## Activations
+##
+##############################################################################
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+    'softmax': softmax}
+
+
+def leaky_relu(alpha):
+    alpha = np.float32(alpha)
+    return lambda x: np.where(x > 0, x, alpha * x)
+
+
+##############################################################################
+##
+## NumPy model
+##
+##############################################################################
+
+def read_model_config(model_path):
+    """Parse a Keras YAML model definition into its config dict."""
+    with open(model_path, "r") as model_file:
+        return yaml.load(model_file, Loader=_ConfigLoader)
+
+
+def read_layer_weights(weights_path):
+    """Map layer name -> list of weight arrays from a Keras .h5 file."""
+    weights = {}
+    with h5py.File(weights_path, "r") as h5:
+        group = h5['model_weights'] if 'model_weights' in h5 else h5
+        for name in group.attrs['layer_names']:
+            name = name.decode() if isinstance(name, bytes) else name
+            layer = group[name]
+            weight_names = [w.decode() if isinstance(w, bytes) else w
+                            for w in layer.attrs.get('weight_names', [])]
+            weights[name] = [np.asarray(layer[w], dtype=np.float32) for w in weight_names]
+    return weights
+
+
+class NumpyModel(object):
+    """Forward pass of a Sequential Dense/LeakyReLU/Activation model."""
+
+    def __init__(self, steps, input_dim):
+        self.steps = steps
+        self.input_dim = input_dim
+
+    @classmethod
+    def load(cls, model_path=MODEL_PATH, weights_path=WEIGHTS_PATH):
+        layers = read_model_config(model_path)['config']
+        if isinstance(layers, dict):
+            layers = layers['layers']
+        weights = read_layer_weights(weights_path)
+
+        steps = []
+        input_dim = None
+        for layer in layers:
+            kind = layer['class_name']
+            layer_config = layer['config']
+            if kind == 'Dense':
+                params = weights[layer_config['name']]
+                kernel = params[0]
+                bias = params[1] if layer_config.get('use_bias', True) else None
+                if input_dim is None:
+                    input_dim = kernel.shape[0]
+                steps.append(('dense', kernel, bias))
+                activation = layer_config.get('activation', 'linear')
+                if activation != 'linear':
+                    steps.append(('activation', ACTIVATIONS[activation]))
+            elif kind == 'LeakyReLU':
+                steps.append(('activation', leaky_relu(layer_config.get('alpha', 0.3))))
+            elif kind == 'Activation':
+                steps.append(('activation', ACTIVATIONS[layer_config['activation']]))
+            else:
+                raise ValueError("Unsupported layer type %s in %s" % (kind, model_path))
+        return cls(steps, input_dim)
+
+    def _forward(self, x):
+        for step in self.steps:
+            if step[0] == 'dense':
+                x = np.dot(x, step[1])
+                if step[2] is not None:
+                    x += step[2]
+            else:
+                x = step[1](x)
+        return x
+
+    def predict(self, x, batch_size=None):
+        x = np.asarray(x, dtype=np.float32)
+        if batch_size is None or x.shape[0] <= batch_size:
+            return self._forward(x)
+        return np.concatenate([self._forward(x[start:start + batch_size])
+                               for start in range(0, x.shape[0], batch_size)])
+
+
+def load_keras_model(model_path=MODEL_PATH, weights_path=WEIGHTS_PATH):
+    from keras.models import Sequential
+
+    model = Sequential.from_config(read_model_config(model_path)['config'])
+    model.load_weights(weights_path)
+    if hasattr(model, '_make_predict_function'):
+        model._make_predict_function()
+    return model
+
+
+def load_model(model_path=MODEL_PATH, weights_path=WEIGHTS_PATH, backend=None):
+    """Load the serving model with the numpy (default) or keras backend."""
+    backend = backend or os.environ.get('MODEL_BACKEND', 'numpy')
+    if backend == 'keras':
+        return load_keras_model(model_path, weights_path)
+    if backend == 'numpy':
+        return NumpyModel.load(model_path, weights_path)
+    raise ValueError("Unknown model backend %s" % backend)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != '--check':
+        print("Usage: python inference.py --check [num_rows]")
+        exit(1)
+
+    num_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    numpy_model = load_model(backend='numpy')
+    keras_model = load_model(backend='keras')
+
+    inputs = np.random.RandomState(0).rand(num_rows, numpy_model.input_dim).astype(np.float32)
+    diff = np.abs(numpy_model.predict(inputs) - keras_model.predict(inputs)).max()
+    print("Max abs difference over %d rows: %g" % (num_rows, diff))
+    exit(0 if diff <= 1e-5 else 1)
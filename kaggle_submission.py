@@ -3,52 +3,88 @@
 ## kaggle_submission.py
 ##
 ## @author: Matthew Cline
-## @version: 20190320
+## @version: 20261018
 ##
 ## Description: Model prediciton on all of the games for the kaggle
 ## competition.
 ##
+## All game IDs are parsed in one vectorized step, the full input matrix
+## is gathered from the feature store at once and the model runs in large
+## batches. With --chunk-size the submission file is streamed through in
+## chunks so files far larger than the Stage 2 sample (e.g. every D1 pair
+## over several seasons) never have to be held in memory.
+##
+## Usage:
+##      python kaggle_submission.py [--input CSV] [--output CSV]
+##          [--batch-size N] [--chunk-size N]
+##
 ##############################################################################
 
-import pickle
+import argparse
 import os
-from keras.models import Sequential, model_from_yaml
-from keras.layers import Dense, LeakyReLU, Activation
-import tensorflow as tf
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from feature_store import NORMALIZED_STORE, load_or_build_store
+from feature_lookup import FeatureLookup
+from inference import WEIGHTS_PATH, load_model
+from normalization import check_weights
+from profiling import phase
 
+parser = argparse.ArgumentParser(description="Predict every game in a kaggle submission file.")
+parser.add_argument("--input", default="data/stage_2/SampleSubmissionStage2.csv",
+                    help="submission csv with an ID column of SEASON_TEAM1_TEAM2")
+parser.add_argument("--output", default="custom_data/kaggle_output.csv")
+parser.add_argument("--batch-size", type=int, default=4096,
+                    help="rows per model.predict batch")
+parser.add_argument("--chunk-size", type=int, default=0,
+                    help="stream the input in chunks of this many rows (0 = whole file)")
+args = parser.parse_args()
 
-### Load the team mappings ###
-teams = pd.read_csv(os.path.normpath("data/stage_2/TeamSpellings.csv"), encoding='latin1')
-teams = teams.set_index('TeamNameSpelling')
-stats = pickle.load(open(os.path.normpath("custom_data/yearly_stats_normalized.p"), "rb"))
-game_list = pd.read_csv(os.path.normpath("data/stage_2/SampleSubmissionStage2.csv"), encoding='latin1')
 
+### Load the team stats ###
+with phase("load_store"):
+    stats = FeatureLookup(load_or_build_store(NORMALIZED_STORE))
+    check_weights(WEIGHTS_PATH, stats.scaler_info)
 
-### Load the model architecture and weights ###
-model_file = open(os.path.normpath("models/20190319.yaml"), "r")
-model_config = model_file.read()
-model_file.close()
-model = model_from_yaml(model_config)
 
-model.load_weights(os.path.normpath("weights/best_model.h5"))
+### Load the model architecture and weights (MODEL_BACKEND=keras to use Keras) ###
+with phase("load_model"):
+    model = load_model()
 print("Model successfully loaded.\n\n")
 
-model.compile(loss='categorical_crossentropy', optimizer='adam',
-              metrics=['accuracy', 'mean_squared_error'])
 
-### Loop through all games ###
-for idx, row in tqdm(game_list.iterrows(), total=game_list.shape[0]):
-    matchup = row['ID'].split("_")
-    team1 = int(matchup[1])
-    team2 = int(matchup[2])
+### Input buffer reused across chunks ###
+buffer = np.empty((args.chunk_size, stats.width), dtype=stats.dtype) if args.chunk_size else None
+
+
+def predict_games(game_list):
+    """Fill the Pred column of a frame of submission IDs in one pass."""
+    with phase("parse_ids"):
+        ids = game_list['ID'].str.split("_", expand=True).astype(int).values
+        season, team1, team2 = ids[:, 0], ids[:, 1], ids[:, 2]
+
+    with phase("gather"):
+        out = buffer[:len(ids)] if buffer is not None else None
+        input_matrix = stats.matchups(team1, team2, season, out=out)
+
+    with phase("predict"):
+        pred = model.predict(input_matrix, batch_size=args.batch_size)
+    game_list['Pred'] = pred[:, 0].astype(np.float64)
+    return game_list
 
-    ### Create input vector ###
-    input_vector = np.array([np.concatenate((stats.loc[(team1, 2019)].values, stats.loc[(team2, 2019)].values))])
 
-    pred = model.predict(input_vector)
-    game_list.loc[idx, 'Pred'] = pred[0][0]
+input_path = os.path.normpath(args.input)
+output_path = os.path.normpath(args.output)
 
-game_list.to_csv(os.path.normpath("custom_data/kaggle_output.csv"), index=None, header=True)
+if args.chunk_size:
+    chunks = pd.read_csv(input_path, encoding='latin1', chunksize=args.chunk_size)
+    for i, game_list in enumerate(tqdm(chunks)):
+        predict_games(game_list).to_csv(output_path, mode='w' if i == 0 else 'a',
+                                        index=None, header=(i == 0))
+else:
+    with phase("read_csv"):
+        game_list = pd.read_csv(input_path, encoding='latin1')
+    predict_games(game_list)
+    with phase("write_csv"):
+        game_list.to_csv(output_path, index=None, header=True)
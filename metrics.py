@@ -0,0 +1,194 @@
+##############################################################################
+##
+## metrics.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: In-process metrics for the web services, rendered in the
+## Prometheus text exposition format at /metrics. Counters and histograms
+## are plain locked dictionaries updated on the request path, values that
+## already live elsewhere (cache hits, admission counters, the model
+## version) are read by collector callbacks only when /metrics is scraped.
+##
+## Each process keeps its own metrics, under gunicorn every worker is
+## scraped (or labelled by pid) separately.
+##
+##      STAGE_SECONDS    request time per stage (feature_lookup,
+##                       vector_build, model_predict, serialization, ...)
+##      REQUEST_SECONDS  end to end request latency per route
+##      REQUESTS         requests per route and status code
+##      BATCH_SIZE       rows per forward pass of the micro-batcher
+##
+##############################################################################
+
+import contextlib
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in zip(names, values))
+
+
+class Counter(object):
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s counter" % self.name]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append("%s%s %s" % (self.name, _labels(self.labelnames, key), value))
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+                    break
+            counts[1] += 1
+            counts[2] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        with self._lock:
+            for key, (counts, total, total_sum) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append("%s_bucket%s %d" % (self.name, _labels(self.labelnames + ('le',), key + (bound,)),
+                                                     cumulative))
+                lines.append("%s_bucket%s %d" % (self.name, _labels(self.labelnames + ('le',), key + ('+Inf',)),
+                                                 total))
+                lines.append("%s_count%s %d" % (self.name, _labels(self.labelnames, key), total))
+                lines.append("%s_sum%s %r" % (self.name, _labels(self.labelnames, key), total_sum))
+        return lines
+
+
+class Registry(object):
+    """Metrics plus collectors, rendered together."""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() returns [(name, type, help, [(labels dict, value), ...])]."""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            for name, kind, help, samples in collect():
+                lines.append("# HELP %s %s" % (name, help))
+                lines.append("# TYPE %s %s" % (name, kind))
+                for labels, value in samples:
+                    lines.append("%s%s %s" % (name, _labels(list(labels), list(labels.values())), value))
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "stage_seconds", "Time spent in each stage of a request", ['stage']))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "request_seconds", "End to end request latency", ['route']))
+REQUESTS = REGISTRY.register(Counter(
+    "requests_total", "Requests served", ['route', 'status']))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "batch_size", "Rows per micro-batched forward pass", buckets=BATCH_BUCKETS))
+
+
+def record_request(route, status, seconds):
+    REQUEST_SECONDS.observe(seconds, route=route)
+    REQUESTS.inc(route=route, status=status)
+
+
+def reloader_collector(prefix, reloader):
+    """Version, reload and failure samples of a HotReloader."""
+    def collect():
+        return [(prefix + "_info", "gauge", "Version currently served",
+                 [({'version': getattr(reloader.current, 'version', '') or ''}, 1)]),
+                (prefix + "_reloads_total", "counter", "Successful reloads", [({}, reloader.reloads)]),
+                (prefix + "_reload_failures_total", "counter", "Failed reloads", [({}, reloader.failures)])]
+    return collect
+
+
+def stats_collector(prefix, get_stats):
+    """Numeric fields of a stats() dict (e.g. cache or admission) as gauges."""
+    def collect():
+        stats = get_stats()
+        if stats is None:
+            return []
+        return [("%s_%s" % (prefix, name), "gauge", "%s %s" % (prefix, name), [({}, value)])
+                for name, value in sorted(stats.items())
+                if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    return collect
+
+
+def instrument_flask(app):
+    """Time and count every request of a Flask app and serve /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record(response):
+        start = g.get('request_start')
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            record_request(route, response.status_code, time.perf_counter() - start)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
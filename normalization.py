@@ -0,0 +1,230 @@
+##############################################################################
+##
+## normalization.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Min/max scaling of the yearly stats with persisted
+## parameters. A Scaler is fit in one pass over the stats in chunks and its
+## per column minimum and maximum are saved to
+##      custom_data/scaler.npz   = minimum, maximum, column names and fit
+## which lets
+##      - data_normalization.py write the normalized stats,
+##      - data_manipulation.py --incremental normalize only the rows it
+##        re-derived, with the saved parameters,
+##      - the services normalize matchup vectors at lookup time from the
+##        raw store (see feature_lookup.py), so the raw and the normalized
+##        stats do not both have to be kept.
+## A column with a single value scales to 0 instead of dividing by zero.
+##
+## By default the min/max are taken over the whole cartesian team x season
+## frame ('full'), the same as the original normalization, so the all-zero
+## rows of teams that never played pin every minimum at 0. A 'played' fit
+## uses only the team/seasons with games (see feature_store.played_mask)
+## and puts the inputs on a different scale, so it needs a retrain.
+##
+## Weights are only valid with the scaler their training data was built
+## with. Its fingerprint is written next to the weights
+##      weights/<name>.scaler.json
+## (train_model.py does this) and check_weights refuses a store or scaler
+## with a different one. Weights without the file predate the saved
+## scaler and were trained on a 'full' fit.
+##
+## Usage:
+##      python normalization.py --stamp <weights.h5> [store dir]
+##          Record the scaler of a normalized store (default
+##          custom_data/yearly_stats_normalized.store) as the one the
+##          weights were trained with.
+##
+##############################################################################
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import numpy as np
+import pandas as pd
+from feature_store import NORMALIZED_STORE, RAW_PICKLE, played_mask, write_store
+
+SCALER_PATH = os.path.normpath("custom_data/scaler.npz")
+
+
+class ScalerMismatch(ValueError):
+    """Weights were trained on stats normalized with a different scaler."""
+
+
+class Scaler(object):
+    """Per column (x - min) / (max - min) with saved parameters."""
+
+    def __init__(self, minimum, maximum, columns, fit='full', path=None):
+        self.minimum = np.asarray(minimum)
+        self.maximum = np.asarray(maximum)
+        self.columns = [str(col) for col in columns]
+        self.fit_rows = fit
+        self.path = path
+        span = self.maximum - self.minimum
+        self.scale = np.divide(1, span, out=np.zeros_like(span), where=span > 0)
+
+    @classmethod
+    def fit(cls, chunks, columns, dtype='float64', fit='full'):
+        """Running min/max over an iterable of (rows x columns) arrays, NaNs ignored."""
+        minimum = maximum = None
+        for chunk in chunks:
+            if chunk.shape[0] == 0:
+                continue
+            low, high = np.fmin.reduce(chunk, axis=0), np.fmax.reduce(chunk, axis=0)
+            minimum = low if minimum is None else np.fmin(minimum, low)
+            maximum = high if maximum is None else np.fmax(maximum, high)
+        if minimum is None:
+            raise ValueError("Cannot fit a scaler without any rows")
+        return cls(minimum.astype(dtype), maximum.astype(dtype), columns, fit=fit)
+
+    @classmethod
+    def fit_frame(cls, df, dtype='float64', played_only=False, chunk_size=65536):
+        """Fit on a yearly stats frame chunk by chunk, on its played rows only if asked."""
+        mask = played_mask(df) if played_only else np.ones(df.shape[0], dtype=bool)
+        chunks = (df.values[start:start + chunk_size][mask[start:start + chunk_size]]
+                  for start in range(0, df.shape[0], chunk_size))
+        return cls.fit(chunks, df.columns, dtype=dtype, fit='played' if played_only else 'full')
+
+    @classmethod
+    def load(cls, path=SCALER_PATH):
+        with np.load(path) as params:
+            fit = str(params['fit']) if 'fit' in params.files else 'played'
+            return cls(params['minimum'], params['maximum'], params['columns'].tolist(), fit=fit, path=path)
+
+    def save(self, path=SCALER_PATH):
+        """Write the parameters through a temporary file and move it in place."""
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as scaler_file:
+            np.savez(scaler_file, minimum=self.minimum, maximum=self.maximum,
+                     columns=np.array(self.columns), fit=np.array(self.fit_rows))
+        os.replace(tmp_path, path)
+        self.path = path
+
+    @property
+    def fingerprint(self):
+        """Hash of the parameters, independent of the dtype they are saved in."""
+        digest = hashlib.sha1()
+        digest.update(json.dumps([self.fit_rows, self.columns]).encode())
+        digest.update(self.minimum.astype('<f8').tobytes())
+        digest.update(self.maximum.astype('<f8').tobytes())
+        return digest.hexdigest()
+
+    def info(self):
+        """What a store or a set of weights records about its scaler."""
+        return {'fingerprint': self.fingerprint, 'fit': self.fit_rows}
+
+    def check_columns(self, columns):
+        if [str(col) for col in columns] != self.columns:
+            raise ValueError("Scaler %s was fit on different columns, rerun data_normalization.py"
+                             % (self.path or ""))
+
+    def transform(self, values, out=None):
+        """Scale a (rows x columns) array, in place when out is values."""
+        out = np.subtract(values, self.minimum, out=out)
+        out *= self.scale
+        return out
+
+    def transform_frame(self, df):
+        self.check_columns(df.columns)
+        return pd.DataFrame(self.transform(df.values), index=df.index, columns=df.columns)
+
+
+def load_or_fit(path=SCALER_PATH, stats_path=RAW_PICKLE, df=None):
+    """The saved scaler, fit (full) on the yearly stats and saved if there is none."""
+    if os.path.exists(path):
+        return Scaler.load(path)
+    if df is None:
+        with open(stats_path, "rb") as stats_file:
+            df = pickle.load(stats_file)
+    scaler = Scaler.fit_frame(df)
+    scaler.save(path)
+    return scaler
+
+
+def build_normalized_store(path=NORMALIZED_STORE, stats_path=RAW_PICKLE, scaler_path=SCALER_PATH,
+                           dtype='float32'):
+    """Write the normalized store from the pickled yearly stats with the saved scaler."""
+    with open(stats_path, "rb") as stats_file:
+        df = pickle.load(stats_file)
+    scaler = load_or_fit(scaler_path, stats_path, df)
+    write_store(scaler.transform_frame(df), path, dtype=dtype, mask=played_mask(df), scaler=scaler.info())
+
+
+def update_normalized(normalized, yearly_stats, touched, scaler):
+    """Normalize only the touched (and any new) rows of yearly_stats into normalized."""
+    scaler.check_columns(yearly_stats.columns)
+    rows = touched.union(yearly_stats.index.difference(normalized.index))
+    normalized = normalized.reindex(yearly_stats.index)
+    normalized.loc[rows, :] = scaler.transform(yearly_stats.loc[rows].values)
+    return normalized
+
+
+##############################################################################
+##
+## Scaler fingerprints of the weights
+##
+##############################################################################
+
+def weights_scaler_path(weights_path):
+    return os.path.splitext(weights_path)[0] + ".scaler.json"
+
+
+def read_scaler_info(path):
+    """Scaler info saved at path, None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as info_file:
+        return json.load(info_file)
+
+
+def write_scaler_info(path, info):
+    """Save scaler info at path, or remove a stale one when info is None."""
+    if info is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w") as info_file:
+        json.dump(info, info_file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def check_weights(weights_path, info):
+    """Raise ScalerMismatch unless the weights were trained with the scaler info.
+
+    info is the Scaler.info() of the stats about to be fed to the model,
+    None for a normalized store written before scalers were recorded.
+    """
+    expected = read_scaler_info(weights_scaler_path(weights_path))
+    if expected is None:
+        ### Weights from before the scaler was recorded were trained on a full fit ###
+        if info is not None and info['fit'] != 'full':
+            raise ScalerMismatch("%s was trained on a full min/max fit but the stats use a %s fit, "
+                                 "retrain or rerun data_normalization.py without --played-only"
+                                 % (weights_path, info['fit']))
+        return
+    if info is None or info['fingerprint'] != expected['fingerprint']:
+        raise ScalerMismatch("%s was trained with scaler %s but the stats were normalized with %s, "
+                             "retrain or restore the matching stats"
+                             % (weights_path, expected['fingerprint'][:12],
+                                info['fingerprint'][:12] if info is not None else "an unrecorded scaler"))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != "--stamp":
+        print("Usage: python normalization.py --stamp <weights.h5> [store dir]")
+        exit(1)
+
+    from feature_store import FeatureStore
+
+    weights_path = os.path.normpath(sys.argv[2])
+    store = FeatureStore.load(os.path.normpath(sys.argv[3]) if len(sys.argv) > 3 else NORMALIZED_STORE)
+    if store.scaler is None:
+        print("%s does not record its scaler, rerun data_normalization.py" % store.path)
+        exit(1)
+    write_scaler_info(weights_scaler_path(weights_path), store.scaler)
+    print("Stamped %s with scaler %s" % (weights_path, store.scaler['fingerprint'][:12]))
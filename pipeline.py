@@ -0,0 +1,356 @@
+##############################################################################
+##
+## pipeline.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Single entry point for the offline pipeline
+##      aggregate -> normalize -> labels -> train
+##                   normalize -> matrix, submission
+## modelled as a DAG of stages with declared inputs, outputs, code and
+## parameters. A stage depends on whichever stage produces one of its
+## inputs. Before a stage runs, its key (a hash of the contents of every
+## input and code file, its parameters and its command) is compared with
+## the key recorded in .pipeline/state.json when it last succeeded. If
+## they match and its outputs are still the files it wrote, it is
+## skipped. Stages whose upstream stages are done run concurrently
+## (--jobs), each as its own process with its log in .pipeline/logs/.
+##
+## weights/best_model.h5 is an input of the submission and of the served
+## prediction matrices (custom_data/matrices, see prediction_matrix.py)
+## but not an output of any stage: training checkpoints to
+## weights/<version>.best.h5 and a model is promoted with
+## backtest.py --promote. So training is an independent branch and new
+## weights only rerun the matrix and submission stages. The scaler stamp
+## next to them (weights/best_model.scaler.json, see normalization.py) is
+## hashed with them; weights from before the stamps have none, so it is an
+## optional input.
+##
+## File hashes are remembered by (size, mtime) so unchanged large csvs are
+## not read again on every run.
+##
+## Usage:
+##      python pipeline.py [stage ...] [--jobs 2] [--force stage ...]
+##                         [--set stage.param=value ...] [--dry-run]
+##          Bring the named stages (default: all) and everything upstream
+##          of them up to date. e.g. after new weights land
+##              python pipeline.py submission
+##          only reruns the submission.
+##      python pipeline.py --list
+##          Show every stage with its inputs, outputs and parameters.
+##
+##############################################################################
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = os.path.normpath(".pipeline")
+STATE_PATH = os.path.join(STATE_DIR, "state.json")
+LOG_DIR = os.path.join(STATE_DIR, "logs")
+
+REGULAR_SEASON = "data/stage_2/RegularSeasonDetailedResults.csv"
+NORMALIZED_STORE = "custom_data/yearly_stats_normalized.store"
+DATASET = ["train_data/data.npy", "train_data/labels.npy", "val_data/data.npy", "val_data/labels.npy"]
+
+
+class Stage(object):
+    """One step of the pipeline.
+
+    command(params) returns the script arguments, and inputs/outputs may
+    also be callables of params when they depend on them. Optional inputs
+    are hashed like the others but may be missing.
+    """
+
+    def __init__(self, name, script, command, inputs, outputs, code=(), params=None, optional=()):
+        self.name = name
+        self.script = script
+        self.command = command
+        self._inputs = inputs
+        self.optional = list(optional)
+        self._outputs = outputs
+        self.code = [script] + list(code)
+        self.params = dict(params or {})
+
+    def inputs(self):
+        required = self._inputs(self.params) if callable(self._inputs) else list(self._inputs)
+        return required + self.optional
+
+    def outputs(self):
+        return self._outputs(self.params) if callable(self._outputs) else list(self._outputs)
+
+    def argv(self):
+        return [sys.executable, os.path.join(REPO_DIR, self.script)] + [str(arg) for arg in self.command(self.params)]
+
+
+STAGES = [
+    Stage("aggregate", "data_manipulation.py",
+          lambda p: ["--dtype", p['dtype']],
+          inputs=[REGULAR_SEASON, "data/stage_2/Teams.csv"],
+          outputs=["custom_data/yearly_stats.p", "custom_data/yearly_totals.p", "custom_data/yearly_stats.store"],
+          code=["stat_aggregation.py", "normalization.py", "feature_store.py", "profiling.py"],
+          params={'dtype': 'float64'}),
+    Stage("normalize", "data_normalization.py",
+          lambda p: ["custom_data/yearly_stats.p", "custom_data/yearly_stats_normalized.p", p['dtype'],
+                     "--scaler-dtype", p['scaler_dtype']] + (["--played-only"] if p['played_only'] else []),
+          inputs=["custom_data/yearly_stats.p"],
+          outputs=["custom_data/yearly_stats_normalized.p", NORMALIZED_STORE, "custom_data/scaler.npz"],
+          code=["normalization.py", "feature_store.py", "profiling.py"],
+          params={'dtype': 'float32', 'scaler_dtype': 'float64', 'played_only': False}),
+    Stage("labels", "create_labels.py",
+          lambda p: ["--val-season", p['val_season'], "--dtype", p['dtype']],
+          inputs=[REGULAR_SEASON, NORMALIZED_STORE],
+          outputs=DATASET + ["train_data/scaler.json"],
+          code=["training_data.py", "feature_lookup.py", "feature_store.py", "normalization.py", "profiling.py"],
+          params={'val_season': 2018, 'dtype': 'float32'}),
+    Stage("train", "train_model.py",
+          lambda p: ["--epochs", p['epochs'], "--batch-size", p['batch_size'], "--version", p['version'],
+                     "--checkpoint", "weights/%s.best.h5" % p['version']],
+          inputs=DATASET + ["train_data/scaler.json"],
+          outputs=lambda p: ["models/%s.yaml" % p['version'], "weights/%s.h5" % p['version'],
+                             "weights/%s.scaler.json" % p['version'], "weights/%s.best.h5" % p['version'],
+                             "weights/%s.best.scaler.json" % p['version']],
+          code=["training_input.py", "training_data.py", "normalization.py", "profiling.py"],
+          params={'epochs': 150, 'batch_size': 10, 'version': '20190320'}),
+    Stage("matrix", "prediction_matrix.py",
+          lambda p: ["--all"] if p['all_seasons'] else [],
+          inputs=[NORMALIZED_STORE, "models/20190319.yaml", "weights/best_model.h5"],
+          outputs=["custom_data/matrices"],
+          code=["inference.py", "feature_lookup.py", "feature_store.py", "serving.py", "normalization.py"],
+          params={'all_seasons': False},
+          optional=["weights/best_model.scaler.json"]),
+    Stage("submission", "kaggle_submission.py",
+          lambda p: ["--input", p['input'], "--output", "custom_data/kaggle_output.csv"],
+          inputs=lambda p: [p['input'], NORMALIZED_STORE, "models/20190319.yaml", "weights/best_model.h5"],
+          outputs=["custom_data/kaggle_output.csv"],
+          code=["inference.py", "feature_lookup.py", "feature_store.py", "normalization.py", "profiling.py"],
+          params={'input': "data/stage_2/SampleSubmissionStage2.csv"},
+          optional=["weights/best_model.scaler.json"]),
+]
+
+
+##############################################################################
+##
+## Hashing and state
+##
+##############################################################################
+
+class State(object):
+    """Stage keys, output hashes and the (size, mtime) file hash memo."""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {'stages': {}, 'files': {}}
+        if os.path.exists(path):
+            with open(path, "r") as state_file:
+                self.data = json.load(state_file)
+
+    def file_hash(self, path):
+        """sha1 of a file (or every file under a directory), None if missing."""
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path)
+                           for name in names if not name.endswith(".tmp"))
+            if not files:
+                return None
+            digest = hashlib.sha1()
+            for file_path in files:
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(self.file_hash(file_path).encode())
+            return digest.hexdigest()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            memo = self.data['files'].get(path)
+        if memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+        digest = hashlib.sha1()
+        with open(path, "rb") as data_file:
+            for block in iter(lambda: data_file.read(1 << 20), b""):
+                digest.update(block)
+        with self._lock:
+            self.data['files'][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def stage_key(self, stage):
+        """Hash of everything a stage's outputs are a function of."""
+        missing = [path for path in stage.inputs()
+                   if path not in stage.optional and self.file_hash(path) is None]
+        if missing:
+            raise IOError("Stage %s is missing inputs: %s" % (stage.name, ", ".join(missing)))
+        description = {
+            'inputs': {path: self.file_hash(path) for path in stage.inputs()},
+            'code': {path: self.file_hash(os.path.join(REPO_DIR, path)) for path in stage.code},
+            'params': stage.params,
+            'command': stage.command(stage.params)}
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def up_to_date(self, stage, key):
+        record = self.data['stages'].get(stage.name)
+        if record is None or record['key'] != key:
+            return False
+        return all(self.file_hash(path) == digest for path, digest in record['outputs'].items())
+
+    def record(self, stage, key, seconds):
+        outputs = {path: self.file_hash(path) for path in stage.outputs()}
+        with self._lock:
+            self.data['stages'][stage.name] = {'key': key, 'outputs': outputs, 'seconds': seconds,
+                                               'finished': time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            with open(self.path + ".tmp", "w") as state_file:
+                json.dump(self.data, state_file, indent=2, sort_keys=True)
+            os.replace(self.path + ".tmp", self.path)
+
+
+##############################################################################
+##
+## Scheduling
+##
+##############################################################################
+
+def dependencies(stages):
+    """stage name -> names of the stages producing its inputs."""
+    producers = {}
+    for stage in stages:
+        for path in stage.outputs():
+            producers[os.path.normpath(path)] = stage.name
+    return {stage.name: sorted(set(producers[os.path.normpath(path)] for path in stage.inputs()
+                                   if os.path.normpath(path) in producers) - {stage.name})
+            for stage in stages}
+
+
+def upstream(targets, deps):
+    """The targets and every stage they depend on."""
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(deps[name])
+    return selected
+
+
+def run_stage(stage, state, force, dry_run):
+    """Run a stage unless it is up to date, returns 'skipped', 'ran' or 'stale'."""
+    if dry_run and force:
+        return 'stale'
+    key = state.stage_key(stage)
+    if not force and state.up_to_date(stage, key):
+        return 'skipped'
+    if dry_run:
+        return 'stale'
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    start = time.time()
+    with open(os.path.join(LOG_DIR, "%s.log" % stage.name), "wb") as log_file:
+        returncode = subprocess.call(stage.argv(), stdout=log_file, stderr=subprocess.STDOUT,
+                                     env=dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep +
+                                              os.environ.get('PYTHONPATH', '')))
+    if returncode != 0:
+        raise RuntimeError("Stage %s failed with exit code %d, see %s" %
+                           (stage.name, returncode, log_file.name))
+    state.record(stage, key, time.time() - start)
+    state.save()
+    return 'ran'
+
+
+def run_pipeline(stages, targets=None, jobs=2, force=(), dry_run=False):
+    """Bring the targets up to date, running independent stages concurrently."""
+    by_name = {stage.name: stage for stage in stages}
+    deps = dependencies(stages)
+    selected = upstream(targets or list(by_name), deps)
+    state = State()
+
+    done, failed, results = set(), set(), {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            for name in [stage.name for stage in stages]:
+                if name not in selected or name in done or name in failed or name in running.values():
+                    continue
+                if any(dep in failed for dep in deps[name] if dep in selected):
+                    failed.add(name)
+                    results[name] = 'blocked'
+                    print("%-12s blocked by a failed upstream stage" % name)
+                elif all(dep in done for dep in deps[name] if dep in selected):
+                    ### In a dry run a stale upstream makes every dependent stale ###
+                    stale_upstream = dry_run and any(results.get(dep) == 'stale' for dep in deps[name])
+                    running[pool.submit(run_stage, by_name[name], state,
+                                        name in force or stale_upstream, dry_run)] = name
+                    if not dry_run:
+                        print("%-12s started" % name)
+            if not running:
+                break
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                    done.add(name)
+                    seconds = state.data['stages'].get(name, {}).get('seconds', 0.0)
+                    print("%-12s %s%s" % (name, {'skipped': "up to date", 'ran': "done", 'stale': "would run"}
+                                          [results[name]], " (%.1fs)" % seconds if results[name] == 'ran' else ""))
+                except Exception as error:
+                    failed.add(name)
+                    results[name] = 'failed'
+                    print("%-12s FAILED: %s" % (name, error))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline stages that are out of date.")
+    parser.add_argument("targets", nargs='*', help="stages to bring up to date (default: all)")
+    parser.add_argument("--jobs", type=int, default=2, help="stages run at once")
+    parser.add_argument("--force", nargs='+', default=[], help="rerun these stages even if up to date")
+    parser.add_argument("--set", nargs='+', default=[], metavar="STAGE.PARAM=VALUE",
+                        help="override a stage parameter")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would run")
+    parser.add_argument("--list", action="store_true", help="describe the stages")
+    args = parser.parse_args()
+
+    by_name = {stage.name: stage for stage in STAGES}
+    for override in args.set:
+        target, value = override.split("=", 1)
+        name, param = target.split(".", 1)
+        if name not in by_name or param not in by_name[name].params:
+            parser.error("Unknown parameter %s" % target)
+        default = by_name[name].params[param]
+        if isinstance(default, bool):
+            by_name[name].params[param] = value.lower() in ('1', 'true', 'yes')
+        else:
+            by_name[name].params[param] = type(default)(value)
+    for name in args.targets + args.force:
+        if name not in by_name:
+            parser.error("Unknown stage %s (stages: %s)" % (name, ", ".join(by_name)))
+
+    if args.list:
+        deps = dependencies(STAGES)
+        for stage in STAGES:
+            print("%s (%s) after %s\n    inputs:  %s\n    outputs: %s\n    params:  %s" %
+                  (stage.name, stage.script, ", ".join(deps[stage.name]) or "-", ", ".join(stage.inputs()),
+                   ", ".join(stage.outputs()), json.dumps(stage.params, sort_keys=True)))
+        return
+
+    results = run_pipeline(STAGES, args.targets, args.jobs, set(args.force), args.dry_run)
+    if any(result in ('failed', 'blocked') for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,25 +9,30 @@
 ## basketball game, this program will return the name of the winner
 ## between the two teams provided as arguments.
 ##
+## Usage:
+##      python prediction.py <team1> <team2> [season]
+##          season defaults to the latest season in the feature store.
+##
 ##############################################################################
 
-import pickle
 import os
-from keras.models import Sequential, model_from_yaml
-from keras.layers import Dense, LeakyReLU, Activation
-import tensorflow as tf
-import numpy as np
 import pandas as pd
 import sys
+from feature_store import NORMALIZED_STORE, load_or_build_store
+from feature_lookup import FeatureLookup
+from inference import WEIGHTS_PATH, load_model
+from normalization import check_weights
 
-if len(sys.argv) != 3:
+if len(sys.argv) not in (3, 4):
     print("You must enter two teams to predict the winner...")
     exit(1)
 
 ### Load the team mappings ###
 teams = pd.read_csv(os.path.normpath("data/stage_2/TeamSpellings.csv"), encoding='latin1')
 teams = teams.set_index('TeamNameSpelling')
-stats = pickle.load(open(os.path.normpath("custom_data/yearly_stats_normalized.p"), "rb"))
+stats = FeatureLookup(load_or_build_store(NORMALIZED_STORE))
+check_weights(WEIGHTS_PATH, stats.scaler_info)
+season = int(sys.argv[3]) if len(sys.argv) == 4 else None
 
 ### Get team id ###
 team1 = 0
@@ -43,20 +48,12 @@ except:
     print("Unable to find Team2. Check spelling...")
 
 ### Create input vector ###
-input_vector = np.array([np.concatenate((stats.loc[(team1, 2019)].values, stats.loc[(team2, 2019)].values))])
+input_vector = stats.matchup(team1, team2, season)
 print(input_vector.shape)
 
-### Load the model architecture and weights ###
-model_file = open(os.path.normpath("models/20190319.yaml"), "r")
-model_config = model_file.read()
-model_file.close()
-model = model_from_yaml(model_config)
-
-model.load_weights(os.path.normpath("weights/best_model.h5"))
+### Load the model architecture and weights (MODEL_BACKEND=keras to use Keras) ###
+model = load_model()
 print("Model successfully loaded.\n\n")
 
-model.compile(loss='categorical_crossentropy', optimizer='adam',
-              metrics=['accuracy', 'mean_squared_error'])
-
 pred = model.predict(input_vector)
 print("Predictions: \n\t%s: %f\n\t%s: %f" % (sys.argv[1], pred[0][0], sys.argv[2], pred[0][1]))
@@ -0,0 +1,79 @@
+##############################################################################
+##
+## prediction_cache.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Bounded LRU cache of matchup predictions for the web
+## service. Entries are keyed on (team1, team2, season, fingerprint) where
+## the fingerprint identifies the model weights and stats the prediction
+## came from, and a miss on either ordering of a pair fills both orderings
+## from one two-row batch.
+##
+##############################################################################
+
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache(object):
+    """Thread-safe LRU cache of (1 x 2) model outputs."""
+
+    def __init__(self, capacity, fingerprint=None):
+        self.capacity = capacity
+        self.fingerprint = fingerprint
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def reset(self, fingerprint):
+        """Drop every entry if the model/stats fingerprint has changed."""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._entries.clear()
+                self.fingerprint = fingerprint
+
+    def get_or_compute(self, team1, team2, season, fingerprint, predict_pair):
+        """Cached output for team1 vs team2 from the model identified by fingerprint.
+
+        On a miss predict_pair(team1, team2, season) must return the
+        (2 x 2) outputs for (team1, team2) and (team2, team1); both rows are
+        stored.
+        """
+        with self._lock:
+            key = (team1, team2, season, fingerprint)
+            pred = self._entries.get(key)
+            if pred is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pred
+            self.misses += 1
+
+        pair = predict_pair(team1, team2, season)
+
+        with self._lock:
+            ### Results computed against a model that was since swapped out are not kept ###
+            if fingerprint == self.fingerprint:
+                self._put(key, pair[0:1])
+                self._put((team2, team1, season, fingerprint), pair[1:2])
+        return pair[0:1]
+
+    def _put(self, key, pred):
+        self._entries[key] = pred
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'fingerprint': self.fingerprint}
@@ -0,0 +1,204 @@
+##############################################################################
+##
+## prediction_matrix.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Precomputed all-pairs win probability matrix for a season.
+## With ~350 D1 teams there are only ~120k ordered matchups, so the whole
+## T x T matrix is computed in one batched pass and every later prediction
+## is an array read.
+##
+## Matrices are built offline (this script, the pipeline's matrix stage)
+## and saved in a cache directory as
+##      custom_data/matrices/<season>.<fingerprint>.pairs.npz
+## where the fingerprint hashes the model architecture, the weights, the
+## feature store and the scaler (if vectors are normalized at lookup) it
+## was built from. New weights or stats get a new file name, so a matrix
+## is never served for files it was not built from. Building a season
+## removes its matrices for other fingerprints.
+##
+## The prediction service only loads these files, apart from the latest
+## season which it builds at startup when it is missing (see serving.py).
+##
+## Usage:
+##      python prediction_matrix.py [season ...] [--all] [--dir DIR]
+##          Build (or refresh) the matrices of the seasons, defaulting to
+##          the latest season in the feature store, or of every season
+##          with --all. Set PREDICTION_NORMALIZE_AT_LOOKUP=1 as for the
+##          service it is built for.
+##
+##############################################################################
+
+import argparse
+import glob
+import hashlib
+import os
+import numpy as np
+from feature_store import UnknownSeason, UnknownTeam
+from inference import MODEL_PATH, WEIGHTS_PATH, load_model
+
+MATRIX_DIR = os.path.normpath("custom_data/matrices")
+
+
+def fingerprint(*paths):
+    """Content hash of a set of files and directories."""
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if not name.endswith(".tmp"))
+        else:
+            files = [path]
+        for file_path in files:
+            digest.update(os.path.basename(file_path).encode())
+            with open(file_path, "rb") as artifact:
+                for block in iter(lambda: artifact.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def matrix_path(season, fingerprint, directory=MATRIX_DIR):
+    return os.path.join(directory, "%d.%s.pairs.npz" % (season, fingerprint[:16]))
+
+
+class PredictionMatrix(object):
+    """Win probabilities for every ordered pair of teams in a season.
+
+    probs[i, j] is the model output for teams[i] (first) vs teams[j]
+    (second), i.e. the same two values model.predict returns for that
+    matchup vector.
+    """
+
+    def __init__(self, season, teams, probs, fingerprint):
+        self.season = season
+        self.teams = teams
+        self.probs = probs
+        self.fingerprint = fingerprint
+        self.first_team = int(teams[0])
+        self.positions = np.full(int(teams[-1]) - self.first_team + 1, -1, dtype=np.int64)
+        self.positions[teams - self.first_team] = np.arange(len(teams))
+
+    def position(self, team):
+        offset = int(team) - self.first_team
+        if offset < 0 or offset >= len(self.positions) or self.positions[offset] < 0:
+            raise UnknownTeam("No stats for team %d in season %d" % (team, self.season))
+        return self.positions[offset]
+
+    def positions_of(self, teams):
+        """Matrix positions for an array of teams."""
+        offsets = np.asarray(teams, dtype=np.int64) - self.first_team
+        in_range = (offsets >= 0) & (offsets < len(self.positions))
+        positions = np.full(offsets.shape, -1, dtype=np.int64)
+        positions[in_range] = self.positions[offsets[in_range]]
+        if (positions < 0).any():
+            team = np.asarray(teams)[positions < 0][0]
+            raise UnknownTeam("No stats for team %d in season %d" % (team, self.season))
+        return positions
+
+    def predict(self, team1, team2):
+        """Model output for a single matchup as a (1 x 2) array."""
+        return self.probs[self.position(team1), self.position(team2)][None, :]
+
+    def predict_many(self, team1, team2):
+        """Model outputs for arrays of matchups as an (N x 2) array."""
+        return self.probs[self.positions_of(team1), self.positions_of(team2)]
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, season=self.season, teams=self.teams, probs=self.probs,
+                 fingerprint=self.fingerprint)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            return cls(int(saved['season']), saved['teams'], saved['probs'], str(saved['fingerprint']))
+
+
+def build_matrix(predict, lookup, season, fingerprint=None, batch_size=8192, teams=None):
+    """Run every ordered matchup of a season (or of just teams) through predict in batches."""
+    if teams is None:
+        index = lookup.store.index
+        teams = np.unique(index[index[:, 1] == season, 0])
+        if len(teams) == 0:
+            raise UnknownSeason("No stats for season %d" % season)
+    else:
+        teams = np.unique(np.asarray(teams, dtype=np.int64))
+
+    num_teams = len(teams)
+    team1 = np.repeat(teams, num_teams)
+    team2 = np.tile(teams, num_teams)
+    probs = np.empty((num_teams * num_teams, 2), dtype=np.float32)
+    buffer = np.empty((batch_size, lookup.width), dtype=lookup.dtype)
+
+    for start in range(0, len(team1), batch_size):
+        stop = min(start + batch_size, len(team1))
+        input_matrix = lookup.matchups(team1[start:stop], team2[start:stop], season,
+                                       out=buffer[:stop - start])
+        probs[start:stop] = predict(input_matrix)
+
+    return PredictionMatrix(season, teams, probs.reshape(num_teams, num_teams, 2), fingerprint)
+
+
+def load_or_build(predict, lookup, season, model_path=MODEL_PATH, weights_path=WEIGHTS_PATH,
+                  directory=MATRIX_DIR, current=None, build=True):
+    """The saved matrix for season, built and saved if missing (None if not build).
+
+    current is the fingerprint of model_path, weights_path and the lookup's
+    files when the caller already has it.
+    """
+    if current is None:
+        current = fingerprint(model_path, weights_path, *lookup.paths)
+    path = matrix_path(season, current, directory)
+
+    if os.path.exists(path):
+        matrix = PredictionMatrix.load(path)
+        if matrix.fingerprint == current:
+            return matrix
+    if not build:
+        return None
+
+    matrix = build_matrix(predict, lookup, season, fingerprint=current)
+    os.makedirs(directory, exist_ok=True)
+    matrix.save(path)
+    ### Matrices of older weights or stats are never loaded again ###
+    for stale in glob.glob(os.path.join(directory, "%d.*.pairs.npz" % season)):
+        if stale != path:
+            os.remove(stale)
+    return matrix
+
+
+def main():
+    from feature_store import NORMALIZED_STORE, load_or_build_store
+    from feature_lookup import FeatureLookup
+    from normalization import load_or_fit
+    from serving import config_from_env
+
+    parser = argparse.ArgumentParser(description="Build the all-pairs prediction matrices.")
+    parser.add_argument("seasons", type=int, nargs='*', help="default: the latest season")
+    parser.add_argument("--all", action='store_true', help="every season in the feature store")
+    parser.add_argument("--dir", default=MATRIX_DIR)
+    args = parser.parse_args()
+
+    ### The same stats the service reads, so the fingerprints match ###
+    config = config_from_env()
+    stats = FeatureLookup(load_or_build_store(config.get('store_path', NORMALIZED_STORE)),
+                          load_or_fit(config['scaler_path']) if config.get('scaler_path') else None)
+    if args.all:
+        seasons = [int(season) for season in np.unique(stats.store.index[:, 1])]
+    else:
+        seasons = args.seasons or [stats.latest_season]
+
+    model = load_model()
+    current = fingerprint(MODEL_PATH, WEIGHTS_PATH, *stats.paths)
+    for season in seasons:
+        matrix = load_or_build(lambda x: model.predict(x, batch_size=8192), stats, season,
+                               directory=args.dir, current=current)
+        print("%d x %d matrix for %d saved to %s" % (len(matrix.teams), len(matrix.teams), season,
+                                                     matrix_path(season, current, args.dir)))
+
+
+if __name__ == '__main__':
+    main()
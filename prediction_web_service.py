@@ -9,54 +9,335 @@
 ## basketball game, this program will return the name of the winner
 ## between the two teams provided as arguments.
 ##
+## Set PREDICTION_MATRIX=1 to serve predictions from the precomputed
+## all-pairs matrix (see prediction_matrix.py). The latest season is loaded
+## or built at startup, other seasons are served from their matrix if it
+## was built offline (python prediction_matrix.py --all, or the pipeline's
+## matrix stage) and from the model otherwise.
+##
+## Set PREDICTION_BATCHING=1 to coalesce concurrent requests into batched
+## forward passes (see batching.py), tuned with
+##      PREDICTION_MAX_BATCH    = rows per batch (default 64)
+##      PREDICTION_MAX_WAIT_MS  = max wait for a batch to fill (default 2)
+##      PREDICTION_QUEUE_DEPTH  = waiting requests before 503s (default 1024)
+## The achieved batch sizes are reported at /batching.
+##
+## POST /bulk evaluates many matchups in one request. The JSON body is
+##      {"matchups": [[team1, team2], ...], "season": 2019, "format": "jsonl"}
+## season is optional, matchups may also be a flat [team1, team2, ...]
+## list. A body that is not of this form is refused with 400 and an error
+## message. Results are streamed back chunk by chunk
+## (PREDICTION_BULK_CHUNK rows, default 4096) either as JSON Lines
+##      {"team1": 1101, "team2": 1102, "pred": [0.51, 0.49]}
+## or, with "format": "binary", as little-endian float32 pairs in request
+## order (application/octet-stream, row count in X-Matchup-Count).
+##
+## Set PREDICTION_CACHE_SIZE to a number of entries to keep an LRU cache of
+## single matchup predictions (see prediction_cache.py), a miss fills both
+## orderings of the pair. Hit/miss/eviction counters are reported at /cache.
+##
+## Set PREDICTION_NORMALIZE_AT_LOOKUP=1 to serve from the raw stats store
+## and normalize matchup vectors at lookup time with the saved scaler
+## (custom_data/scaler.npz, see normalization.py) instead of keeping a
+## normalized copy of the stats.
+##
+## The model, weights and stats are reloaded without a restart
+## (see hot_reload.py). Set PREDICTION_RELOAD_INTERVAL to poll the files
+## every N seconds (default 0, off, but on under gunicorn.conf.py where
+## each worker has to notice new files itself) or POST /admin/reload to
+## trigger it in the process that receives it. Set PREDICTION_ADMIN_TOKEN
+## to require "Authorization: Bearer <token>" on /admin/reload, without it
+## only localhost may call it (see hot_reload.admin_allowed).
+## The new version is loaded and warmed in the background and swapped in
+## atomically, requests in flight finish on the old one. Every response
+## carries the version that served it in X-Model-Version.
+##
+## Admission control (see admission.py) protects latency under load:
+##      PREDICTION_MAX_IN_FLIGHT = concurrent prediction requests (0 = off)
+##      PREDICTION_MAX_WAITING   = requests queued for a slot before new
+##                                 ones are shed with 503 + Retry-After (64)
+##      PREDICTION_RETRY_AFTER   = Retry-After seconds on a 503 (1)
+##      PREDICTION_DEADLINE_MS   = default request deadline (0 = none)
+## A client can set its own budget with the X-Request-Deadline-Ms header.
+## Requests whose deadline passes while queued (for a slot or a batch) are
+## dropped with 504 before inference. Counters are reported at /admission.
+##
+## GET /metrics serves Prometheus text metrics (see metrics.py): per stage
+## latency histograms (feature_lookup, vector_build, model_predict,
+## serialization), request latency and counts per route and status, the
+## served model version, reload, cache and admission counters and the
+## micro-batch size distribution.
+##
+## Logging goes through the logging module at LOG_LEVEL (default INFO).
+## Every prediction is logged at DEBUG, so it costs nothing unless enabled.
+##
+## GET /bracket/<season>[?simulations=&seed=] simulates the season's
+## tournament (see bracket.py) from the season's saved prediction matrix,
+## or one built for just the tournament teams, and returns per team round
+## probabilities, the most likely bracket (the highest joint probability)
+## and the chalk bracket (the favourite of every game).
+## The seeds and slots CSVs are read once at startup and results are
+## cached per season, model version, simulations and seed, so repeated
+## requests do not simulate again.
+##      BRACKET_SIMULATIONS     = default simulations per request (10000)
+##      BRACKET_MAX_SIMULATIONS = cap on ?simulations= (100000)
+##      BRACKET_CACHE_SIZE      = cached results (16)
+##
 ##############################################################################
 
-import pickle
 import os
-from keras.models import Sequential, model_from_yaml
-from keras.layers import Dense, LeakyReLU, Activation
-import tensorflow as tf
+import functools
+import json
+import logging
+import time
 import numpy as np
-import pandas as pd
-import sys
+from prediction_cache import PredictionCache
+from batching import QueueFull
+from admission import AdmissionController, Overloaded, DeadlineExceeded
+from feature_store import UnknownSeason, UnknownTeam
+from serving import PredictionState, config_from_env, state_paths
+from hot_reload import HotReloader, admin_allowed
+from bracket import SEEDS_PATH, SLOTS_PATH, BracketCache, load_brackets, run_bracket
+from metrics import REGISTRY, STAGE_SECONDS, instrument_flask, reloader_collector, stats_collector
 
 from flask import Flask
+from flask import Response
+from flask import g
 from flask import jsonify
+from flask import make_response
+from flask import request
 
-### Load the team mappings ###
-stats = pickle.load(open(os.path.normpath("custom_data/yearly_stats_normalized.p"), "rb"))
+### Service configuration ###
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'),
+                    format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger("prediction_web_service")
+state_config = config_from_env()
+bulk_chunk = int(os.environ.get('PREDICTION_BULK_CHUNK', 4096))
+cache_size = int(os.environ.get('PREDICTION_CACHE_SIZE', 0))
+reload_interval = float(os.environ.get('PREDICTION_RELOAD_INTERVAL', 0))
+ADMIN_TOKEN_VARIABLE = 'PREDICTION_ADMIN_TOKEN'
+admin_token = os.environ.get(ADMIN_TOKEN_VARIABLE)
+max_in_flight = int(os.environ.get('PREDICTION_MAX_IN_FLIGHT', 0))
+default_deadline_ms = float(os.environ.get('PREDICTION_DEADLINE_MS', 0))
+retry_after = int(os.environ.get('PREDICTION_RETRY_AFTER', 1))
+admission = AdmissionController(max_in_flight,
+                                max_waiting=int(os.environ.get('PREDICTION_MAX_WAITING', 64)),
+                                retry_after=retry_after) \
+    if max_in_flight else None
+bracket_simulations = int(os.environ.get('BRACKET_SIMULATIONS', 10000))
+bracket_max_simulations = int(os.environ.get('BRACKET_MAX_SIMULATIONS', 100000))
+bracket_cache = BracketCache(int(os.environ.get('BRACKET_CACHE_SIZE', 16)))
 
 
-### Load the model architecture and weights ###
-model_file = open(os.path.normpath("models/20190319.yaml"), "r")
-model_config = model_file.read()
-model_file.close()
-model = model_from_yaml(model_config)
+### Load and warm the model and stats (MODEL_BACKEND=keras to use Keras) ###
+def build_state():
+    return PredictionState(**state_config).warm()
 
-model.load_weights(os.path.normpath("weights/best_model.h5"))
-print("Model successfully loaded.\n\n")
+def swap_state(old, new):
+    if cache is not None:
+        cache.reset(new.fingerprint)
+    old.close()
 
-model.compile(loss='categorical_crossentropy', optimizer='adam',
-              metrics=['accuracy', 'mean_squared_error'])
+cache = None
+reloader = HotReloader(build_state, state_paths(state_config),
+                       interval=reload_interval, on_swap=swap_state)
+logger.info("Model successfully loaded, version %s", reloader.peek().version)
 
-model._make_predict_function()
+### Tournament brackets, read once ###
+if os.path.exists(SEEDS_PATH) and os.path.exists(SLOTS_PATH):
+    brackets = load_brackets()
+else:
+    logger.warning("No %s or %s, /bracket is unavailable", SEEDS_PATH, SLOTS_PATH)
+    brackets = {}
+
+### Optional LRU cache keyed on the model weights and stats fingerprint ###
+if cache_size:
+    cache = PredictionCache(cache_size, reloader.peek().fingerprint)
 
 app = Flask(__name__)
+instrument_flask(app)
+REGISTRY.add_collector(reloader_collector("prediction_model", reloader))
+REGISTRY.add_collector(stats_collector("prediction_cache", lambda: cache.stats() if cache is not None else None))
+REGISTRY.add_collector(stats_collector("bracket_cache", bracket_cache.stats))
+REGISTRY.add_collector(stats_collector("prediction_admission",
+                                       lambda: admission.stats() if admission is not None else None))
+REGISTRY.add_collector(stats_collector("prediction_batching",
+                                       lambda: reloader.current.batcher.stats()
+                                       if reloader.current.batcher is not None else None))
+
+
+class InvalidRequest(ValueError):
+    """Malformed request body, answered with a 400."""
+
+
+def bulk_request(body, latest_season):
+    """(team1, team2, season, binary) of a /bulk body, InvalidRequest if it is malformed."""
+    if not isinstance(body, dict):
+        raise InvalidRequest("Body must be a JSON object")
+
+    season = body.get('season')
+    if season is None:
+        season = latest_season
+    elif isinstance(season, bool) or not isinstance(season, (int, str)) or not str(season).strip().isdigit():
+        raise InvalidRequest("season must be an integer, got %s" % json.dumps(season))
+    season = int(season)
+
+    output_format = body.get('format', request.args.get('format', 'jsonl'))
+    if output_format not in ('jsonl', 'binary'):
+        raise InvalidRequest("format must be jsonl or binary, got %s" % json.dumps(output_format))
+
+    matchups = body.get('matchups', [])
+    if not isinstance(matchups, list):
+        raise InvalidRequest("matchups must be a list of [team1, team2] pairs")
+    try:
+        matchups = np.asarray(matchups)
+    except ValueError:
+        ### Ragged nesting ###
+        raise InvalidRequest("matchups must be a list of [team1, team2] pairs")
+    if matchups.size == 0:
+        matchups = np.empty((0, 2), dtype=np.int64)
+    elif matchups.dtype.kind not in 'iu':
+        raise InvalidRequest("Team ids in matchups must be integers")
+    elif matchups.ndim == 1 and len(matchups) % 2:
+        raise InvalidRequest("matchups has an odd number of team ids (%d)" % len(matchups))
+    elif matchups.ndim > 2 or (matchups.ndim == 2 and matchups.shape[1] != 2):
+        raise InvalidRequest("matchups must be a list of [team1, team2] pairs")
+    matchups = matchups.astype(np.int64).reshape(-1, 2)
+    return matchups[:, 0], matchups[:, 1], season, output_format == 'binary'
+
+
+def request_deadline():
+    """Deadline as a time.monotonic() value, from the header or the default."""
+    budget_ms = request.headers.get('X-Request-Deadline-Ms', default_deadline_ms, type=float)
+    return time.monotonic() + budget_ms / 1000.0 if budget_ms else None
+
+def admitted(view):
+    """Run a view under admission control, holding the slot until the
+    response (including a streamed body) is closed."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.deadline = request_deadline()
+        if admission is None:
+            return view(*args, **kwargs)
+
+        admission.acquire(g.deadline)
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            admission.release()
+            raise
+        response.call_on_close(admission.release)
+        return response
+    return wrapper
 
 
 @app.route('/<int:team1>/<int:team2>')
+@admitted
 def prediction(team1, team2, method='GET'):
+    state = reloader.current
+
+    ### Make Prediction, ?season= defaults to the latest season ###
+    season = request.args.get('season', None, type=int)
+    try:
+        pred = state.predict_matchup(team1, team2, season, cache, deadline=g.deadline)
+    except DeadlineExceeded:
+        if admission is not None:
+            admission.record_expired()
+        raise
+    with STAGE_SECONDS.time(stage='serialization'):
+        out = {}
+        out[str(team1)] = str(pred[0][0])
+        out[str(team2)] = str(pred[0][1])
+        response = jsonify(out)
+    logger.debug("prediction team1=%d team2=%d season=%s pred=%s version=%s",
+                 team1, team2, season, out, state.version)
+    response.headers['X-Model-Version'] = state.version
+    return response
+
+@app.route('/bulk', methods=['POST'])
+@admitted
+def bulk_prediction():
+    state = reloader.current
+    team1, team2, season, binary = bulk_request(request.get_json(force=True, silent=True),
+                                                state.stats.latest_season)
+
+    ### Reject unknown teams before any output is streamed ###
+    state.check_matchups(team1, team2, season)
+
+    def binary_stream():
+        for _, _, pred in state.predict_chunks(team1, team2, season, bulk_chunk):
+            yield np.ascontiguousarray(pred, dtype='<f4').tobytes()
+
+    def jsonl_stream():
+        for start, stop, pred in state.predict_chunks(team1, team2, season, bulk_chunk):
+            yield "".join(json.dumps({'team1': int(t1), 'team2': int(t2), 'pred': [float(p[0]), float(p[1])]}) + "\n"
+                          for t1, t2, p in zip(team1[start:stop], team2[start:stop], pred))
+
+    headers = {'X-Matchup-Count': str(len(team1)), 'X-Season': str(season),
+               'X-Model-Version': state.version}
+    if binary:
+        return Response(binary_stream(), mimetype='application/octet-stream', headers=headers)
+    return Response(jsonl_stream(), mimetype='application/x-ndjson', headers=headers)
+
+@app.route('/bracket/<int:season>')
+@admitted
+def bracket_simulation(season):
+    state = reloader.current
+    if season not in brackets:
+        raise UnknownSeason("No bracket for season %d" % season)
+    simulations = max(min(request.args.get('simulations', bracket_simulations, type=int),
+                          bracket_max_simulations), 1)
+    seed = request.args.get('seed', None, type=int)
+    result = bracket_cache.get_or_run(
+        (season, state.fingerprint, simulations, seed),
+        lambda: run_bracket(brackets[season], state.teams_matrix(season, brackets[season].teams), simulations,
+                            processes=1, seed=seed))
+    response = jsonify(result)
+    response.headers['X-Model-Version'] = state.version
+    return response
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    allowed, status = admin_allowed(admin_token, request.headers.get('Authorization'), request.remote_addr)
+    if not allowed:
+        if status == 401:
+            return jsonify({'error': "Missing or wrong admin token"}), 401, {'WWW-Authenticate': 'Bearer'}
+        return jsonify({'error': "Reload is only allowed from localhost without %s" % ADMIN_TOKEN_VARIABLE}), 403
+    started = reloader.reload()
+    return jsonify({'reloading': started, 'version': reloader.current.version}), 202
+
+@app.route('/batching')
+def batching_stats():
+    batcher = reloader.current.batcher
+    return jsonify(batcher.stats() if batcher is not None else {'batches': 0})
+
+@app.route('/admission')
+def admission_stats():
+    return jsonify(admission.stats() if admission is not None else {'max_in_flight': 0})
+
+@app.route('/cache')
+def cache_stats():
+    return jsonify(cache.stats() if cache is not None else {'capacity': 0})
+
+@app.errorhandler(UnknownTeam)
+def unknown_team(error):
+    return jsonify({'error': str(error)}), 404
+
+@app.errorhandler(InvalidRequest)
+def invalid_request(error):
+    return jsonify({'error': str(error)}), 400
+
+@app.errorhandler(QueueFull)
+def queue_full(error):
+    return jsonify({'error': str(error)}), 503, {'Retry-After': str(retry_after)}
+
+@app.errorhandler(Overloaded)
+def overloaded(error):
+    return jsonify({'error': str(error)}), 503, {'Retry-After': str(error.retry_after)}
 
-    ### Create input vector ###
-    input_vector = np.array([np.concatenate((stats.loc[(team1, 2019)].values, stats.loc[(team2, 2019)].values))])
-    print(input_vector.shape)
-    ### Make Prediction ###
-    pred = model.predict(input_vector)
-    out = {}
-    out[str(team1)] = str(pred[0][0])
-    out[str(team2)] = str(pred[0][1])
-    print(out)
-    return jsonify(out)
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(error):
+    return jsonify({'error': str(error)}), 504
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
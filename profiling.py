@@ -0,0 +1,206 @@
+##############################################################################
+##
+## profiling.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Per phase profiling for the offline pipeline scripts. The
+## scripts wrap their phases (csv parsing, aggregation, pickling, training,
+## ...) in
+##      with phase("read_csv"):
+##          ...
+## which is free unless profiling is switched on with PIPELINE_PROFILE=1
+## or by running the script under this module. When on, every phase
+## records its wall time, CPU time and peak RSS (VmHWM, reset at the start
+## of each phase where the kernel allows it) and at exit one summary line
+## is printed to stderr, e.g.
+##      profile create_labels.py wall=2.10s cpu=1.95s peak=410MB | read_csv wall=0.61s ...
+## so two runs can be diffed line against line. A phase entered more than
+## once (e.g. per chunk) is summed into one entry. The same numbers are
+## written to summary.json in the run directory.
+##
+##      PIPELINE_PROFILE=1             phase timings and the summary line
+##      PIPELINE_PROFILE_DIR=DIR       run directory (default
+##                                     profiles/<script>-<timestamp>)
+##      PIPELINE_PROFILE_CPROFILE=1    dump cProfile stats of the whole run
+##                                     to DIR/cprofile.pstats
+##      PIPELINE_PROFILE_TRACEMALLOC=1 allocation peak per phase and a
+##                                     tracemalloc snapshot DIR/<phase>.snapshot
+##
+## Usage:
+##      python profiling.py [--cprofile] [--tracemalloc] [--run-dir DIR]
+##                          <script.py> [script args ...]
+##          Run a pipeline script with profiling on.
+##
+##############################################################################
+
+import atexit
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+
+_profiler = None
+
+
+def _enabled():
+    return os.environ.get('PIPELINE_PROFILE', '0') == '1'
+
+
+def _peak_rss_mb():
+    """Peak resident set size since the last reset, in MB."""
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+class Profiler(object):
+    """Phase records and run level profiles for one script run."""
+
+    def __init__(self, script, run_dir=None, cprofile=False, tracemalloc=False):
+        self.script = script
+        self.run_dir = run_dir or os.path.join(
+            "profiles", "%s-%s" % (os.path.splitext(os.path.basename(script))[0], time.strftime("%Y%m%d-%H%M%S")))
+        self.phases = []
+        self._by_name = {}
+        self._stack = []
+        self._start = (time.perf_counter(), time.process_time())
+        self._cprofile = None
+        self._tracemalloc = tracemalloc
+
+        if cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        if tracemalloc:
+            import tracemalloc as tracemalloc_module
+            tracemalloc_module.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        name = "/".join([entry['name'] for entry in self._stack] + [name])
+        entry = {'name': name, 'child_peak': 0.0}
+        self._stack.append(entry)
+        _reset_peak_rss()
+        if self._tracemalloc:
+            import tracemalloc
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = {'name': name,
+                      'wall': time.perf_counter() - wall,
+                      'cpu': time.process_time() - cpu,
+                      'peak_rss_mb': max(_peak_rss_mb(), entry['child_peak'])}
+            if self._tracemalloc:
+                import tracemalloc
+                record['peak_alloc_mb'] = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+                os.makedirs(self.run_dir, exist_ok=True)
+                tracemalloc.take_snapshot().dump(os.path.join(self.run_dir, "%s.snapshot" % name.replace("/", ".")))
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]['child_peak'] = max(self._stack[-1]['child_peak'], record['peak_rss_mb'])
+            self._add(record)
+
+    def _add(self, record):
+        """Phases entered repeatedly (e.g. per chunk) are summed into one record."""
+        existing = self._by_name.get(record['name'])
+        if existing is None:
+            record['calls'] = 1
+            self._by_name[record['name']] = record
+            self.phases.append(record)
+            return
+        existing['calls'] += 1
+        for key in ['wall', 'cpu']:
+            existing[key] += record[key]
+        for key in ['peak_rss_mb', 'peak_alloc_mb']:
+            if key in record:
+                existing[key] = max(existing[key], record[key])
+
+    def summary(self):
+        total = {'name': os.path.basename(self.script),
+                 'wall': time.perf_counter() - self._start[0],
+                 'cpu': time.process_time() - self._start[1],
+                 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}
+        return total, self.phases
+
+    def finish(self):
+        """Write the profiles and summary.json and print the summary line."""
+        total, phases = self.summary()
+        os.makedirs(self.run_dir, exist_ok=True)
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(os.path.join(self.run_dir, "cprofile.pstats"))
+        with open(os.path.join(self.run_dir, "summary.json"), "w") as summary_file:
+            json.dump({'total': total, 'phases': phases}, summary_file, indent=2)
+
+        fields = ["%s wall=%.2fs cpu=%.2fs peak=%.0fMB" % (total['name'], total['wall'], total['cpu'],
+                                                           total['peak_rss_mb'])]
+        fields += ["%s%s wall=%.2fs cpu=%.2fs peak=%.0fMB" % (p['name'], " x%d" % p['calls'] if p['calls'] > 1 else "",
+                                                            p['wall'], p['cpu'], p['peak_rss_mb'])
+                   for p in phases]
+        sys.stderr.write("profile %s\n" % " | ".join(fields))
+
+
+def profiler():
+    """The run's Profiler, created on first use when profiling is on."""
+    global _profiler
+    if _profiler is None and _enabled():
+        _profiler = Profiler(sys.argv[0] or "python",
+                             run_dir=os.environ.get('PIPELINE_PROFILE_DIR') or None,
+                             cprofile=os.environ.get('PIPELINE_PROFILE_CPROFILE', '0') == '1',
+                             tracemalloc=os.environ.get('PIPELINE_PROFILE_TRACEMALLOC', '0') == '1')
+        atexit.register(_profiler.finish)
+    return _profiler
+
+
+def phase(name):
+    """Context manager timing one phase of a script, a no-op when profiling is off."""
+    active = profiler()
+    if active is None:
+        return contextlib.nullcontext()
+    return active.phase(name)
+
+
+if __name__ == '__main__':
+    import argparse
+    import runpy
+
+    parser = argparse.ArgumentParser(description="Run a pipeline script with per phase profiling.")
+    parser.add_argument("--cprofile", action="store_true", help="dump cProfile stats of the run")
+    parser.add_argument("--tracemalloc", action="store_true", help="trace allocations per phase")
+    parser.add_argument("--run-dir", default=None)
+    parser.add_argument("script")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    os.environ['PIPELINE_PROFILE'] = '1'
+    os.environ['PIPELINE_PROFILE_CPROFILE'] = '1' if args.cprofile else '0'
+    os.environ['PIPELINE_PROFILE_TRACEMALLOC'] = '1' if args.tracemalloc else '0'
+    if args.run_dir:
+        os.environ['PIPELINE_PROFILE_DIR'] = args.run_dir
+
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+
+    ### Start the profiler in the module the scripts import, not in __main__ ###
+    import profiling
+    profiling.profiler()
+    runpy.run_path(args.script, run_name='__main__')
@@ -0,0 +1,167 @@
+##############################################################################
+##
+## serving.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Everything the prediction service needs to answer requests
+## for one version of the model and stats, bundled so a whole version can
+## be loaded, warmed and swapped in at once (see hot_reload.py). A request
+## takes the current PredictionState when it starts and uses only that
+## object, so a reload never mixes two model versions in one response.
+##
+## With PREDICTION_NORMALIZE_AT_LOOKUP=1 the stats come from the raw store
+## (the one the stats service maps too) and matchup vectors are normalized
+## at lookup time with the saved scaler (see normalization.py).
+##
+## Weights trained on stats normalized with another scaler are refused with
+## ScalerMismatch: the service does not start, and a reload keeps serving
+## the previous version.
+##
+##############################################################################
+
+import functools
+import os
+import threading
+import numpy as np
+from feature_store import NORMALIZED_STORE, RAW_STORE, load_or_build_store
+from feature_lookup import FeatureLookup
+from inference import MODEL_PATH, WEIGHTS_PATH, load_model
+from prediction_matrix import build_matrix, fingerprint, load_or_build
+from batching import MicroBatcher
+from metrics import STAGE_SECONDS
+from normalization import SCALER_PATH, check_weights, load_or_fit, weights_scaler_path
+
+
+def config_from_env():
+    """PredictionState keyword arguments from the PREDICTION_* variables."""
+    batching = None
+    if os.environ.get('PREDICTION_BATCHING', '0') == '1':
+        batching = {
+            'max_batch_size': int(os.environ.get('PREDICTION_MAX_BATCH', 64)),
+            'max_wait': float(os.environ.get('PREDICTION_MAX_WAIT_MS', 2)) / 1000.0,
+            'max_queue': int(os.environ.get('PREDICTION_QUEUE_DEPTH', 1024))}
+    stores = {}
+    if os.environ.get('PREDICTION_NORMALIZE_AT_LOOKUP', '0') == '1':
+        stores = {'store_path': RAW_STORE, 'scaler_path': SCALER_PATH}
+    return dict(stores, use_matrix=os.environ.get('PREDICTION_MATRIX', '0') == '1', batching=batching)
+
+
+def state_paths(config):
+    """Files a PredictionState built from config depends on, for the reloader."""
+    paths = [MODEL_PATH, WEIGHTS_PATH, weights_scaler_path(WEIGHTS_PATH),
+             config.get('store_path', NORMALIZED_STORE)]
+    return paths + ([config['scaler_path']] if config.get('scaler_path') else [])
+
+
+class PredictionState(object):
+    """Model, feature lookup and derived artifacts for one model version."""
+
+    def __init__(self, model_path=MODEL_PATH, weights_path=WEIGHTS_PATH, store_path=NORMALIZED_STORE,
+                 scaler_path=None, use_matrix=False, batching=None):
+        self.model_path = model_path
+        self.weights_path = weights_path
+        self.stats = FeatureLookup(load_or_build_store(store_path),
+                                   load_or_fit(scaler_path) if scaler_path else None)
+        self.fingerprint = fingerprint(model_path, weights_path, *self.stats.paths)
+        self.version = self.fingerprint[:12]
+
+        ### Refuse weights trained on differently normalized stats ###
+        check_weights(weights_path, self.stats.scaler_info)
+        self.model = load_model(model_path, weights_path)
+        self.batcher = MicroBatcher(self.model.predict, **batching) if batching else None
+
+        self.use_matrix = use_matrix
+        self.matrices = {}
+        self._matrix_lock = threading.Lock()
+        if use_matrix:
+            self.season_matrix(self.stats.latest_season, build=True)
+
+    def _predict_batch(self, input_matrix):
+        return self.model.predict(input_matrix, batch_size=8192)
+
+    def season_matrix(self, season, build=False):
+        """The season's saved prediction matrix, None if it was not built offline.
+
+        Only startup builds one (for the latest season), a request never
+        pays for the whole season.
+        """
+        with self._matrix_lock:
+            if season not in self.matrices:
+                matrix = load_or_build(self._predict_batch, self.stats, season,
+                                       model_path=self.model_path, weights_path=self.weights_path,
+                                       current=self.fingerprint, build=build)
+                if matrix is None:
+                    return None
+                self.matrices[season] = matrix
+            return self.matrices[season]
+
+    def teams_matrix(self, season, teams):
+        """A matrix covering teams: the season's saved one, or one built for just those teams."""
+        matrix = self.season_matrix(season)
+        if matrix is None:
+            matrix = build_matrix(self._predict_batch, self.stats, season, fingerprint=self.fingerprint,
+                                  teams=teams)
+        return matrix
+
+    def matchup_inputs(self, team1, team2, season):
+        with STAGE_SECONDS.time(stage='feature_lookup'):
+            rows = self.stats.matchup_rows(team1, team2, season)
+        with STAGE_SECONDS.time(stage='vector_build'):
+            return self.stats.gather(rows)
+
+    def predict_rows(self, input_matrix, deadline=None):
+        with STAGE_SECONDS.time(stage='model_predict'):
+            if self.batcher is not None:
+                return self.batcher.predict_one(input_matrix, deadline=deadline)
+            return self.model.predict(input_matrix)
+
+    def predict_pair(self, team1, team2, season, deadline=None):
+        """Outputs for (team1, team2) and (team2, team1) as one batch."""
+        return self.predict_rows(self.matchup_inputs([team1, team2], [team2, team1], season), deadline)
+
+    def predict_matchup(self, team1, team2, season=None, cache=None, deadline=None):
+        """(1 x 2) output for one matchup."""
+        season = self.stats.season_or_latest(season)
+        matrix = self.season_matrix(season) if self.use_matrix else None
+        if matrix is not None:
+            with STAGE_SECONDS.time(stage='matrix_lookup'):
+                return matrix.predict(team1, team2)
+        if cache is not None:
+            return cache.get_or_compute(team1, team2, season, self.fingerprint,
+                                        functools.partial(self.predict_pair, deadline=deadline))
+        return self.predict_rows(self.matchup_inputs(team1, team2, season), deadline)
+
+    def check_matchups(self, team1, team2, season):
+        """Raise UnknownTeam for any unknown team before work is started."""
+        matrix = self.season_matrix(season) if self.use_matrix else None
+        if matrix is not None:
+            matrix.positions_of(np.concatenate((team1, team2)))
+        else:
+            self.stats.rows(np.stack((team1, team2), axis=1), season)
+
+    def predict_chunks(self, team1, team2, season, chunk_size):
+        """Yield (start, stop, outputs) for arrays of matchups chunk by chunk."""
+        matrix = self.season_matrix(season) if self.use_matrix else None
+        buffer = np.empty((min(chunk_size, len(team1)), self.stats.width), dtype=self.stats.dtype)
+        for start in range(0, len(team1), chunk_size):
+            stop = min(start + chunk_size, len(team1))
+            if matrix is not None:
+                pred = matrix.predict_many(team1[start:stop], team2[start:stop])
+            else:
+                input_matrix = self.stats.matchups(team1[start:stop], team2[start:stop], season,
+                                                   out=buffer[:stop - start])
+                pred = self.model.predict(input_matrix)
+            yield start, stop, pred
+
+    def warm(self):
+        """Run one prediction so the first real request does not pay for it."""
+        index = self.stats.store.index
+        team = index[index[:, 1] == self.stats.latest_season, 0][0]
+        self.model.predict(self.stats.matchup(team, team))
+        return self
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
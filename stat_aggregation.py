@@ -0,0 +1,318 @@
+##############################################################################
+##
+## stat_aggregation.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Vectorized aggregation engine for the yearly stats frame.
+## Every regular season box score is split into two "team-game" records,
+## one for the winner and one for the loser, tagged with the venue split
+## (home or away) the game counts toward. The records are summed with a
+## single grouped reduction and the percentages and per game averages are
+## computed as whole-column operations.
+##
+## Venue rules match the original row-by-row implementation:
+##      WLoc == 'H'  winner -> home, loser -> away
+##      WLoc == 'A'  winner -> away, loser -> home
+##      WLoc == 'N'  winner -> away, loser -> away
+##
+##############################################################################
+
+import numpy as np
+import pandas as pd
+
+##############################################################################
+##
+## Column layout of the yearly stats frame
+##
+##############################################################################
+
+STAT_COLUMNS = [
+    'score_home',
+    'score_away',
+    'opp_score_home',
+    'opp_score_away',
+    'win_perct_home',
+    'win_perct_away',
+    'fg_perct_home',
+    'fg_made_home',
+    'fg_att_home',
+    'fg_perct_away',
+    'fg_made_away',
+    'fg_att_away',
+    'opp_fg_perct_home',
+    'opp_fg_made_home',
+    'opp_fg_att_home',
+    'opp_fg_perct_away',
+    'opp_fg_made_away',
+    'opp_fg_att_away',
+    '3pt_perct_home',
+    '3pt_fg_made_home',
+    '3pt_fg_att_home',
+    '3pt_perct_away',
+    '3pt_fg_made_away',
+    '3pt_fg_att_away',
+    'opp_3pt_perct_home',
+    'opp_3pt_fg_made_home',
+    'opp_3pt_fg_att_home',
+    'opp_3pt_perct_away',
+    'opp_3pt_fg_made_away',
+    'opp_3pt_fg_att_away',
+    'ft_perct_home',
+    'ft_made_home',
+    'ft_att_home',
+    'ft_perct_away',
+    'ft_made_away',
+    'ft_att_away',
+    'opp_ft_perct_home',
+    'opp_ft_made_home',
+    'opp_ft_att_home',
+    'opp_ft_perct_away',
+    'opp_ft_made_away',
+    'opp_ft_att_away',
+    'or_home',
+    'or_away',
+    'opp_or_home',
+    'opp_or_away',
+    'dr_home',
+    'dr_away',
+    'opp_dr_home',
+    'opp_dr_away',
+    'ast_home',
+    'ast_away',
+    'opp_ast_home',
+    'opp_ast_away',
+    'to_home',
+    'to_away',
+    'opp_to_home',
+    'opp_to_away',
+    'stl_home',
+    'stl_away',
+    'opp_stl_home',
+    'opp_stl_away',
+    'blk_home',
+    'blk_away',
+    'opp_blk_home',
+    'opp_blk_away',
+    'games_home',
+    'games_away']
+
+VENUES = ['home', 'away']
+
+### Stat name -> box score column suffix (prefixed with W or L) ###
+BOX_SCORE_STATS = {
+    'score': 'Score',
+    'fg_made': 'FGM',
+    'fg_att': 'FGA',
+    '3pt_fg_made': 'FGM3',
+    '3pt_fg_att': 'FGA3',
+    'ft_made': 'FTM',
+    'ft_att': 'FTA',
+    'or': 'OR',
+    'dr': 'DR',
+    'ast': 'Ast',
+    'to': 'TO',
+    'stl': 'Stl',
+    'blk': 'Blk'}
+
+### Percentage column -> (made column, attempted column) ###
+PERCENTAGE_STATS = {
+    'fg_perct': ('fg_made', 'fg_att'),
+    'opp_fg_perct': ('opp_fg_made', 'opp_fg_att'),
+    '3pt_perct': ('3pt_fg_made', '3pt_fg_att'),
+    'opp_3pt_perct': ('opp_3pt_fg_made', 'opp_3pt_fg_att'),
+    'ft_perct': ('ft_made', 'ft_att'),
+    'opp_ft_perct': ('opp_ft_made', 'opp_ft_att')}
+
+### Columns that are reported per game ###
+PER_GAME_STATS = [
+    'score', 'opp_score', 'win_perct',
+    'or', 'opp_or', 'dr', 'opp_dr',
+    'ast', 'opp_ast', 'to', 'opp_to',
+    'stl', 'opp_stl', 'blk', 'opp_blk']
+
+### Raw running sums kept for every team/season (everything except the
+### percentage columns, per game columns still hold season totals) ###
+PERCENTAGE_COLUMNS = ["%s_%s" % (stat, venue) for stat in PERCENTAGE_STATS for venue in VENUES]
+SUM_COLUMNS = [col for col in STAT_COLUMNS if col not in PERCENTAGE_COLUMNS]
+
+
+##############################################################################
+##
+## Team-game records
+##
+##############################################################################
+
+def build_team_games(box_scores):
+    """Split each box score into a winner and a loser team-game record.
+
+    The returned frame has one row per team per game with the columns
+    team, year, venue and the raw (un-suffixed) stat names used in
+    SUM_COLUMNS, e.g. 'fg_made', 'opp_fg_made', 'win_perct', 'games'.
+    """
+    num_games = box_scores.shape[0]
+    wloc = box_scores['WLoc'].values
+
+    records = []
+    for side, opp, venue in (('W', 'L', np.where(wloc == 'H', 'home', 'away')),
+                             ('L', 'W', np.where(wloc == 'A', 'home', 'away'))):
+        record = {
+            'team': box_scores[side + 'TeamID'].values,
+            'year': box_scores['Season'].values,
+            'venue': venue,
+            'win_perct': np.full(num_games, 1 if side == 'W' else 0),
+            'games': np.ones(num_games, dtype=int)}
+        for stat, suffix in BOX_SCORE_STATS.items():
+            record[stat] = box_scores[side + suffix].values
+            record['opp_' + stat] = box_scores[opp + suffix].values
+        records.append(pd.DataFrame(record))
+
+    return pd.concat(records, ignore_index=True)
+
+
+##############################################################################
+##
+## Grouped reductions
+##
+##############################################################################
+
+def aggregate_totals(box_scores):
+    """Sum the team-game records into raw season totals.
+
+    Returns a frame indexed by (team, year) holding SUM_COLUMNS. Only the
+    team/seasons that appear in box_scores are present.
+    """
+    team_games = build_team_games(box_scores)
+    sums = team_games.groupby(['team', 'year', 'venue']).sum()
+    sums = sums.unstack('venue', fill_value=0)
+    sums.columns = ["%s_%s" % (stat, venue) for stat, venue in sums.columns]
+    return sums.reindex(columns=SUM_COLUMNS, fill_value=0).astype(float)
+
+
+def derive_stats(totals):
+    """Compute percentages and per game averages from raw season totals.
+
+    Returns a new frame with the full STAT_COLUMNS layout. Divisions by a
+    zero attempt or game count leave the value at zero, the same as the
+    original per-row implementation.
+    """
+    stats = totals.reindex(columns=STAT_COLUMNS, fill_value=0.0).astype(float)
+
+    for venue in VENUES:
+        for perct, (made, att) in PERCENTAGE_STATS.items():
+            made_col = totals["%s_%s" % (made, venue)].values
+            att_col = totals["%s_%s" % (att, venue)].values
+            stats["%s_%s" % (perct, venue)] = np.divide(
+                made_col, att_col, out=np.zeros(len(att_col)), where=att_col != 0)
+
+        games = totals['games_' + venue].values
+        per_game_cols = ["%s_%s" % (stat, venue) for stat in PER_GAME_STATS]
+        stats[per_game_cols] = np.divide(
+            totals[per_game_cols].values, games[:, None],
+            out=np.zeros((len(games), len(per_game_cols))), where=games[:, None] != 0)
+
+    return stats
+
+
+def full_index(teams, seasons):
+    """Build the (team, year) cartesian product index used by yearly_stats."""
+    iterables = [np.arange(np.min(teams), np.max(teams) + 1, dtype=int),
+                 np.arange(np.min(seasons), np.max(seasons) + 1, dtype=int)]
+    return pd.MultiIndex.from_product(iterables, names=['team', 'year'])
+
+
+def aggregate_yearly_stats(box_scores, teams):
+    """Build the complete 68 column yearly_stats frame.
+
+    teams is the Teams.csv frame (only the TeamID range is used) and
+    box_scores is RegularSeasonDetailedResults.csv.
+    """
+    index = full_index(teams['TeamID'], box_scores['Season'])
+    totals = aggregate_totals(box_scores).reindex(index, fill_value=0.0)
+    return derive_stats(totals)
+
+
+##############################################################################
+##
+## Incremental updates
+##
+## The raw SUM_COLUMNS totals are kept separately from the derived frame so
+## a day's new box scores can be added to the running sums and only the
+## touched (team, year) rows re-derived. Every game already counted is
+## remembered by its (Season, DayNum, WTeamID, LTeamID) key, so a game is
+## never added twice and a late game of an already loaded day is still
+## picked up. The (Season, DayNum) high-water mark is kept for reporting.
+##
+##############################################################################
+
+def high_water_mark(box_scores):
+    """Return the latest (Season, DayNum) in box_scores, or None if empty."""
+    if box_scores.shape[0] == 0:
+        return None
+    last = box_scores[['Season', 'DayNum']].sort_values(['Season', 'DayNum']).iloc[-1]
+    return (int(last['Season']), int(last['DayNum']))
+
+
+def game_keys(box_scores):
+    """One int64 per game packing (Season, DayNum, WTeamID, LTeamID), team ids below 10000."""
+    keys = box_scores['Season'].values.astype(np.int64) * 1000 + box_scores['DayNum'].values
+    keys = keys * 10000 + box_scores['WTeamID'].values
+    return keys * 10000 + box_scores['LTeamID'].values
+
+
+def new_games(box_scores, merged):
+    """Select the box scores whose game key is not in merged (sorted keys).
+
+    Repeated rows within box_scores are counted once. Returns the new box
+    scores and the merged keys including them.
+    """
+    keys = game_keys(box_scores)
+    first = np.zeros(len(keys), dtype=bool)
+    first[np.unique(keys, return_index=True)[1]] = True
+    fresh = first & ~np.isin(keys, merged)
+    return box_scores[fresh], np.union1d(merged, keys[fresh])
+
+
+def games_after(box_scores, mark):
+    """Select the box scores played strictly after the (Season, DayNum) mark."""
+    if mark is None:
+        return box_scores
+    season, day = mark
+    after = (box_scores['Season'] > season) | \
+            ((box_scores['Season'] == season) & (box_scores['DayNum'] > day))
+    return box_scores[after]
+
+
+def update_totals(totals, box_scores):
+    """Add new box scores into the running totals.
+
+    Returns the updated totals frame and the (team, year) index of the
+    rows that changed. Team/seasons seen for the first time are appended.
+    """
+    new_totals = aggregate_totals(box_scores)
+    touched = new_totals.index
+
+    missing = touched.difference(totals.index)
+    if len(missing):
+        totals = pd.concat([totals, pd.DataFrame(0.0, index=missing, columns=SUM_COLUMNS)])
+
+    totals.loc[touched, SUM_COLUMNS] = totals.loc[touched, SUM_COLUMNS].values + \
+        new_totals[SUM_COLUMNS].values
+    return totals, touched
+
+
+def update_yearly_stats(yearly_stats, totals, touched):
+    """Re-derive the touched rows of yearly_stats from the running totals.
+
+    The cartesian (team, year) index is widened when a new team or season
+    shows up so the frame keeps the same layout as a full rebuild.
+    """
+    teams = touched.get_level_values('team').union(yearly_stats.index.get_level_values('team'))
+    seasons = touched.get_level_values('year').union(yearly_stats.index.get_level_values('year'))
+    index = full_index(teams, seasons)
+    if not index.equals(yearly_stats.index):
+        yearly_stats = yearly_stats.reindex(index, fill_value=0.0)
+
+    yearly_stats.loc[touched, STAT_COLUMNS] = derive_stats(totals.loc[touched]).values
+    return yearly_stats
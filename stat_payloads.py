@@ -0,0 +1,109 @@
+##############################################################################
+##
+## stat_payloads.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Precomputed JSON responses for the stats service. Every
+## (team, season) stat line in the raw feature store is serialized once at
+## load time, along with one payload per season and per season/conference
+## for the bulk endpoint, so serving a request is a dictionary read. Each
+## payload carries an ETag (hash of its bytes) for conditional GETs.
+##
+## Conferences are read from data/stage_2/TeamConferences.csv when it is
+## available (Season, TeamID, ConfAbbrev).
+##
+##############################################################################
+
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from feature_store import RAW_STORE, UnknownSeason, UnknownTeam, load_or_build_store
+from prediction_matrix import fingerprint
+
+CONFERENCES_PATH = os.path.normpath("data/stage_2/TeamConferences.csv")
+
+### Response field -> yearly stats column ###
+STAT_FIELDS = [
+    ("Score", 'score_home'),
+    ("OppScore", 'opp_score_home'),
+    ("OffReb", 'or_home'),
+    ("DefReb", 'dr_home'),
+    ("Ast", 'ast_home'),
+    ("Stl", 'stl_home'),
+    ("Blk", 'blk_home')]
+
+
+def load_conferences(path=CONFERENCES_PATH):
+    """(season, team) -> conference abbreviation, empty if the csv is missing."""
+    if not os.path.exists(path):
+        return {}
+    conferences = pd.read_csv(path)
+    return dict(zip(zip(conferences['Season'], conferences['TeamID']), conferences['ConfAbbrev']))
+
+
+def _payload(obj):
+    body = json.dumps(obj, sort_keys=True, separators=(',', ':')).encode()
+    return body, hashlib.sha1(body).hexdigest()[:20]
+
+
+class StatPayloads(object):
+    """Serialized stat lines for every team/season in a raw feature store."""
+
+    def __init__(self, store, conferences=None, version=None):
+        self.store = store
+        self.version = version
+        self.latest_season = int(store.seasons.max())
+
+        columns = [store.column_index(col) for _, col in STAT_FIELDS]
+        ### The raw store is float64 so these are the exact stats, a float32
+        ### store is rounded through its shortest repr ###
+        values = np.asarray(store.features[:, columns])
+        if values.dtype != np.float64:
+            values = values.astype(str).astype(float)
+
+        lines = {}
+        by_season = {}
+        by_conference = {}
+        conferences = conferences or {}
+        for (team, season), row in zip(store.index, values):
+            team, season = int(team), int(season)
+            line = dict(zip([field for field, _ in STAT_FIELDS], row.tolist()))
+            lines[(team, season)] = _payload(line)
+            by_season.setdefault(season, {})[str(team)] = line
+            conference = conferences.get((season, team))
+            if conference is not None:
+                by_conference.setdefault((season, conference), {})[str(team)] = line
+
+        self.lines = lines
+        self.seasons = {season: _payload(teams) for season, teams in by_season.items()}
+        self.conferences = {key: _payload(teams) for key, teams in by_conference.items()}
+
+    def team(self, team, season=None):
+        """(body, etag) of one team's stat line, UnknownTeam if it never played."""
+        season = self.latest_season if season is None else season
+        try:
+            return self.lines[(team, season)]
+        except KeyError:
+            raise UnknownTeam("No stats for team %s in season %s" % (team, season))
+
+    def bulk(self, season=None, conference=None):
+        """(body, etag) of a season's (or one conference's) stat lines."""
+        season = self.latest_season if season is None else season
+        try:
+            if conference is None:
+                return self.seasons[season]
+            return self.conferences[(season, conference)]
+        except KeyError:
+            if season not in self.seasons:
+                raise UnknownSeason("No stats for season %s" % season)
+            raise UnknownTeam("No stats for %s in season %s" % (conference, season))
+
+
+def load_payloads(store_path=RAW_STORE, conferences_path=CONFERENCES_PATH):
+    """Build the payloads for the raw store, versioned by its fingerprint."""
+    return StatPayloads(load_or_build_store(store_path), load_conferences(conferences_path),
+                        version=fingerprint(store_path)[:12])
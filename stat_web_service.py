@@ -1,28 +1,71 @@
 import pandas as pd
-import pickle
 import numpy as np
 import os
 
 from flask import Flask
+from flask import Response
 from flask import jsonify
+from flask import request
+from feature_store import RAW_STORE, UnknownTeam
+from stat_payloads import CONFERENCES_PATH, load_payloads
+from hot_reload import HotReloader, admin_allowed
+from metrics import REGISTRY, STAGE_SECONDS, instrument_flask, reloader_collector
 
-df = pickle.load(open(os.path.normpath("custom_data/yearly_stats.p"), "rb"))
+### Every response is serialized once here, requests only pick a payload.
+### The payloads are rebuilt in the background when the stats change
+### (STATS_RELOAD_INTERVAL seconds, or POST /admin/reload, which needs the
+### STATS_ADMIN_TOKEN bearer token if set and localhost otherwise) ###
+ADMIN_TOKEN_VARIABLE = 'STATS_ADMIN_TOKEN'
+admin_token = os.environ.get(ADMIN_TOKEN_VARIABLE)
+reloader = HotReloader(load_payloads, [RAW_STORE, CONFERENCES_PATH],
+                       interval=float(os.environ.get('STATS_RELOAD_INTERVAL', 0)))
 
 
 app = Flask(__name__)
 
+### Request and per stage latency at /metrics (see metrics.py) ###
+instrument_flask(app)
+REGISTRY.add_collector(reloader_collector("stats_payloads", reloader))
+
+def payload_response(payload, version):
+    with STAGE_SECONDS.time(stage='serialization'):
+        body, etag = payload
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Stats-Version'] = version
+        return response.make_conditional(request)
+
 @app.route('/get-stats/<int:team_id>', methods=['GET'])
 def get_stats(team_id):
-    out = {
-        "Score": df.loc[(team_id, 2019), 'score_home'],
-        "OppScore": df.loc[(team_id, 2019), 'opp_score_home'],
-        "OffReb": df.loc[(team_id, 2019), 'or_home'],
-        "DefReb": df.loc[(team_id, 2019), 'dr_home'],
-        "Ast": df.loc[(team_id, 2019), 'ast_home'],
-        "Stl": df.loc[(team_id, 2019), 'stl_home'],
-        "Blk": df.loc[(team_id, 2019), 'blk_home']
-    }
-    return jsonify(out)
+    payloads = reloader.current
+    season = request.args.get('season', None, type=int)
+    with STAGE_SECONDS.time(stage='feature_lookup'):
+        payload = payloads.team(team_id, season)
+    return payload_response(payload, payloads.version)
+
+@app.route('/get-stats', methods=['GET'])
+def get_bulk_stats():
+    payloads = reloader.current
+    season = request.args.get('season', None, type=int)
+    conference = request.args.get('conference', None)
+    with STAGE_SECONDS.time(stage='feature_lookup'):
+        payload = payloads.bulk(season, conference)
+    return payload_response(payload, payloads.version)
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    allowed, status = admin_allowed(admin_token, request.headers.get('Authorization'), request.remote_addr)
+    if not allowed:
+        if status == 401:
+            return jsonify({'error': "Missing or wrong admin token"}), 401, {'WWW-Authenticate': 'Bearer'}
+        return jsonify({'error': "Reload is only allowed from localhost without %s" % ADMIN_TOKEN_VARIABLE}), 403
+    started = reloader.reload()
+    return jsonify({'reloading': started, 'version': reloader.current.version}), 202
+
+@app.errorhandler(UnknownTeam)
+def unknown_team(error):
+    return jsonify({'error': str(error)}), 404
 
 if __name__ == '__main__':
     app.run()
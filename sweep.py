@@ -0,0 +1,188 @@
+##############################################################################
+##
+## sweep.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Parallel hyperparameter sweep over the train_model.py
+## network. The search space is a JSON object mapping each parameter to the
+## list of values to try, e.g.
+##      {"layers": [[256, 128, 64, 32, 8], [128, 64, 32]],
+##       "alpha": [0.1, 0.3],
+##       "batch_size": [10, 64],
+##       "epochs": [150],
+##       "patience": [10]}
+## Parameters left out keep the train_model.py defaults. Every combination
+## is a trial, or a random --trials of them.
+##
+## Trials run concurrently in a process pool, each process limited to
+## --threads BLAS/TensorFlow threads so the trials do not fight over cores.
+## Trials report their validation loss after every epoch to a shared board
+## and one that is worse than the median of the trials that reached the
+## same epoch (after --warmup epochs) is stopped early.
+##
+## Each trial writes its own models/<sweep>-<n>.yaml, weights/<sweep>-<n>.h5
+## and best checkpoint weights/<sweep>-<n>.best.h5. The results table
+## sweeps/<sweep>.csv (validation log loss and accuracy of the best
+## checkpoint, epochs run, pruned, wall time) is rewritten as trials finish.
+##
+## Usage:
+##      python sweep.py <space.json> [--trials N] [--threads 1]
+##                      [--processes N] [--warmup 5] [--name sweep-...]
+##
+##############################################################################
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                    'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS']
+
+
+def expand_space(space, trials=None, seed=None):
+    """Every combination of the search space, or a random sample of them."""
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+    if trials is not None and trials < len(grid):
+        grid = random.Random(seed).sample(grid, trials)
+    return grid
+
+
+def limit_threads(threads):
+    """Pool initializer, runs before the trial process imports TensorFlow."""
+    for name in THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+
+def log_loss(labels, probs, eps=1e-15):
+    probs = np.clip(probs, eps, 1 - eps)
+    return float(-np.mean(np.sum(labels * np.log(probs), axis=1)))
+
+
+def run_trial(version, params, board, lock, warmup, threads):
+    """Train one configuration, returns its row of the results table."""
+    import tensorflow as tf
+    import keras
+    from keras import backend
+    import train_model
+
+    ### Pool processes run several trials, start each from an empty graph ###
+    backend.clear_session()
+    if hasattr(tf, 'ConfigProto'):
+        backend.set_session(tf.Session(config=tf.ConfigProto(intra_op_parallelism_threads=threads,
+                                                             inter_op_parallelism_threads=1)))
+
+    class MedianPruning(keras.callbacks.Callback):
+        """Stop when val_loss is worse than the median of the other trials."""
+
+        def __init__(self):
+            keras.callbacks.Callback.__init__(self)
+            self.pruned = False
+            self.epochs = 0
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.epochs = epoch + 1
+            loss = (logs or {}).get('val_loss')
+            if loss is None:
+                return
+            with lock:
+                reports = board.get(epoch, []) + [loss]
+                board[epoch] = reports
+            if epoch + 1 >= warmup and len(reports) >= 3 and loss > statistics.median(reports):
+                self.pruned = True
+                self.model.stop_training = True
+
+    start = time.time()
+    settings = dict(layers=train_model.LAYERS, alpha=train_model.ALPHA, batch_size=train_model.BATCH_SIZE,
+                    epochs=train_model.EPOCHS, patience=train_model.PATIENCE)
+    settings.update(params)
+
+    model_path = os.path.normpath("models/%s.yaml" % version)
+    weights_path = os.path.normpath("weights/%s.h5" % version)
+    checkpoint_path = os.path.normpath("weights/%s.best.h5" % version)
+
+    train_batches, val_batches = train_model.training_sequences(settings['batch_size'])
+    model = train_model.build_model(train_batches.input_dim, settings['layers'], settings['alpha'])
+    pruning = MedianPruning()
+    train_model.train(model, train_batches, val_batches, epochs=settings['epochs'],
+                      patience=settings['patience'], checkpoint_path=checkpoint_path,
+                      workers=1, callbacks=[pruning])
+    train_model.save_model(model, model_path, weights_path)
+
+    ### Score the best checkpoint on the validation set ###
+    model.load_weights(checkpoint_path)
+    probs = model.predict_generator(val_batches, workers=1)
+    labels = np.concatenate([val_batches[i][1] for i in range(len(val_batches))])
+
+    row = {'version': version, 'params': json.dumps(params, sort_keys=True)}
+    row.update({name: json.dumps(value) if isinstance(value, list) else value for name, value in params.items()})
+    row.update({'val_log_loss': log_loss(labels, probs),
+                'val_accuracy': float(np.mean(probs.argmax(axis=1) == labels.argmax(axis=1))),
+                'epochs_run': pruning.epochs,
+                'pruned': pruning.pruned,
+                'wall_time': time.time() - start,
+                'model_path': model_path,
+                'weights_path': checkpoint_path})
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a hyperparameter sweep of the matchup model.")
+    parser.add_argument("space", help="JSON search space")
+    parser.add_argument("--trials", type=int, default=None,
+                        help="sample this many combinations instead of the full grid")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="BLAS/TensorFlow threads per trial")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="concurrent trials (default: cores / threads)")
+    parser.add_argument("--warmup", type=int, default=5,
+                        help="epochs before a trial can be pruned")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--name", default=time.strftime("sweep-%Y%m%d-%H%M%S"))
+    args = parser.parse_args()
+
+    with open(args.space, "r") as space_file:
+        configs = expand_space(json.load(space_file), args.trials, args.seed)
+    processes = args.processes or max(1, (os.cpu_count() or 1) // args.threads)
+    results_path = os.path.normpath("sweeps/%s.csv" % args.name)
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    print("Running %d trials on %d processes, results in %s" % (len(configs), processes, results_path))
+
+    ### Spawned workers start without the parent's imports or threads ###
+    context = multiprocessing.get_context('spawn')
+    manager = context.Manager()
+    board, lock = manager.dict(), manager.Lock()
+    rows = []
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=limit_threads, initargs=(args.threads,)) as pool:
+        futures = {pool.submit(run_trial, "%s-%03d" % (args.name, n), params, board, lock,
+                               args.warmup, args.threads): params
+                   for n, params in enumerate(configs)}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as error:
+                row = {'params': json.dumps(futures[future], sort_keys=True), 'error': repr(error)}
+            rows.append(row)
+            print("%s: %s" % (row.get('version', 'failed'),
+                              row.get('error') or "val_log_loss=%.4f" % row['val_log_loss']))
+            results = pd.DataFrame(rows)
+            if 'val_log_loss' in results:
+                results = results.sort_values('val_log_loss')
+            results.to_csv(results_path, index=False)
+    manager.shutdown()
+
+
+if __name__ == '__main__':
+    main()
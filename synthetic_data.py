@@ -0,0 +1,123 @@
+##############################################################################
+##
+## synthetic_data.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Generate stand-in kaggle files with the same columns as the
+## real data/stage_2 csvs, for benchmarking without the competition data.
+##      Teams.csv                        TeamID, TeamName, FirstD1Season, LastD1Season
+##      TeamSpellings.csv                TeamNameSpelling, TeamID
+##      RegularSeasonDetailedResults.csv every box score column
+##      SampleSubmissionStage2.csv       ID (Season_Team1_Team2), Pred
+## At scale 1 the volume matches the 2019 stage 2 files (366 teams, 17
+## seasons of ~5,150 games, every pair of 68 tournament teams). Scale N
+## generates N times the seasons (ending in 2019) and N seasons of
+## submission rows. Box scores are internally consistent (made <= attempted,
+## points = 2 x twos + 3 x threes + free throws, winner outscores loser).
+##
+## Usage:
+##      python synthetic_data.py <output dir> [--scale 1] [--seed 0]
+##
+##############################################################################
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+NUM_TEAMS = 366
+FIRST_TEAM = 1101
+SEASONS = 17
+LAST_SEASON = 2019
+GAMES_PER_SEASON = 5150
+TOURNEY_TEAMS = 68
+BOX_SCORE = ['FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF']
+
+
+def box_scores(rng, size):
+    """One side of `size` box scores, as a dict of arrays."""
+    fga = rng.integers(45, 76, size)
+    fga3 = rng.integers(10, 31, size)
+    fgm = np.minimum(rng.binomial(fga, 0.44), fga)
+    fgm3 = np.minimum(rng.binomial(fga3, 0.35), fgm)
+    fta = rng.integers(5, 36, size)
+    ftm = rng.binomial(fta, 0.7)
+    return {'FGM': fgm, 'FGA': fga, 'FGM3': fgm3, 'FGA3': fga3, 'FTM': ftm, 'FTA': fta,
+            'OR': rng.integers(3, 20, size), 'DR': rng.integers(15, 35, size),
+            'Ast': rng.integers(6, 25, size), 'TO': rng.integers(6, 22, size),
+            'Stl': rng.integers(2, 13, size), 'Blk': rng.integers(0, 9, size),
+            'PF': rng.integers(10, 27, size)}
+
+
+def season_games(rng, season, num_teams=NUM_TEAMS, num_games=GAMES_PER_SEASON):
+    """Regular season detailed results for one season."""
+    team1 = rng.integers(0, num_teams, num_games)
+    team2 = (team1 + rng.integers(1, num_teams, num_games)) % num_teams
+    side1, side2 = box_scores(rng, num_games), box_scores(rng, num_games)
+    score1 = 2 * side1['FGM'] + side1['FGM3'] + side1['FTM']
+    score2 = 2 * side2['FGM'] + side2['FGM3'] + side2['FTM']
+
+    ### A tie goes to the first team with one more made free throw ###
+    tie = score1 == score2
+    side1['FTM'] = side1['FTM'] + tie
+    side1['FTA'] = np.maximum(side1['FTA'], side1['FTM'])
+    score1 = score1 + tie
+
+    first_won = score1 > score2
+    games = {'Season': np.full(num_games, season),
+             'DayNum': np.sort(rng.integers(0, 133, num_games)),
+             'WTeamID': FIRST_TEAM + np.where(first_won, team1, team2),
+             'WScore': np.where(first_won, score1, score2),
+             'LTeamID': FIRST_TEAM + np.where(first_won, team2, team1),
+             'LScore': np.where(first_won, score2, score1),
+             'WLoc': rng.choice(np.array(['H', 'A', 'N']), num_games, p=[0.55, 0.3, 0.15]),
+             'NumOT': rng.binomial(1, 0.06, num_games)}
+    for stat in BOX_SCORE:
+        games['W' + stat] = np.where(first_won, side1[stat], side2[stat])
+    for stat in BOX_SCORE:
+        games['L' + stat] = np.where(first_won, side2[stat], side1[stat])
+    return pd.DataFrame(games)
+
+
+def generate(directory, scale=1, seed=0):
+    """Write the synthetic csvs to directory, returns their row counts."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    num_seasons = SEASONS * scale
+    first_season = LAST_SEASON - num_seasons + 1
+    team_ids = FIRST_TEAM + np.arange(NUM_TEAMS)
+
+    pd.DataFrame({'TeamID': team_ids,
+                  'TeamName': ["Team %d" % team for team in team_ids],
+                  'FirstD1Season': first_season,
+                  'LastD1Season': LAST_SEASON}).to_csv(os.path.join(directory, "Teams.csv"), index=False)
+    pd.DataFrame({'TeamNameSpelling': ["%s%d" % (prefix, team) for prefix in ["team ", "team-", "t"]
+                                       for team in team_ids],
+                  'TeamID': np.tile(team_ids, 3)}).to_csv(os.path.join(directory, "TeamSpellings.csv"),
+                                                          index=False)
+
+    ### Written a season at a time so memory stays flat at any scale ###
+    results_path = os.path.join(directory, "RegularSeasonDetailedResults.csv")
+    for i, season in enumerate(range(first_season, LAST_SEASON + 1)):
+        season_games(rng, season).to_csv(results_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+
+    ids = []
+    for season in range(LAST_SEASON - scale + 1, LAST_SEASON + 1):
+        teams = np.sort(rng.choice(team_ids, TOURNEY_TEAMS, replace=False))
+        ids += ["%d_%d_%d" % (season, a, b) for i, a in enumerate(teams) for b in teams[i + 1:]]
+    pd.DataFrame({'ID': ids, 'Pred': 0.5}).to_csv(os.path.join(directory, "SampleSubmissionStage2.csv"),
+                                                  index=False)
+
+    return {'teams': NUM_TEAMS, 'seasons': num_seasons, 'games': num_seasons * GAMES_PER_SEASON,
+            'submission_rows': len(ids)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic kaggle csvs.")
+    parser.add_argument("directory")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.directory, args.scale, args.seed))
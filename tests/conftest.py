@@ -0,0 +1,76 @@
+##############################################################################
+##
+## conftest.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Shared fixtures for the test suite. The modules live at the
+## repository root and read their files relative to the working directory,
+## so tests that need files build a small synthetic tree (see
+## synthetic_data.py) in a temporary directory and chdir into it.
+##
+##############################################################################
+
+import os
+import pickle
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import synthetic_data
+from stat_aggregation import aggregate_yearly_stats
+
+NUM_TEAMS = 40
+SEASONS = [2017, 2018, 2019]
+GAMES_PER_SEASON = 400
+
+
+def make_box_scores(seed=0, seasons=SEASONS, num_games=GAMES_PER_SEASON):
+    rng = np.random.default_rng(seed)
+    return pd.concat([synthetic_data.season_games(rng, season, NUM_TEAMS, num_games) for season in seasons],
+                     ignore_index=True)
+
+
+def make_teams():
+    """Teams.csv, with a few teams that play no games like real non-D1 ids."""
+    team_ids = synthetic_data.FIRST_TEAM + np.arange(NUM_TEAMS + 5)
+    return pd.DataFrame({'TeamID': team_ids, 'TeamName': ["Team %d" % team for team in team_ids]})
+
+
+@pytest.fixture
+def box_scores():
+    return make_box_scores()
+
+
+def write_tree(directory):
+    """Kaggle csvs, the yearly stats pickle and the shipped model in directory."""
+    data_dir = os.path.join(directory, "data", "stage_2")
+    os.makedirs(data_dir)
+    os.makedirs(os.path.join(directory, "custom_data"))
+    os.makedirs(os.path.join(directory, "weights"))
+    box_scores, teams = make_box_scores(), make_teams()
+    box_scores.to_csv(os.path.join(data_dir, "RegularSeasonDetailedResults.csv"), index=False)
+    teams.to_csv(os.path.join(data_dir, "Teams.csv"), index=False)
+    with open(os.path.join(directory, "custom_data", "yearly_stats.p"), "wb") as stats_file:
+        pickle.dump(aggregate_yearly_stats(box_scores, teams), stats_file)
+    shutil.copytree(os.path.join(REPO_DIR, "models"), os.path.join(directory, "models"))
+    shutil.copy(os.path.join(REPO_DIR, "weights", "best_model.h5"), os.path.join(directory, "weights"))
+
+
+@pytest.fixture(scope='module')
+def tree(tmp_path_factory):
+    """A synthetic checkout, the working directory for the whole module."""
+    directory = str(tmp_path_factory.mktemp("tree"))
+    write_tree(directory)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield directory
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,62 @@
+import itertools
+import numpy as np
+import pandas as pd
+from bracket import Bracket, chalk_bracket, most_likely_bracket
+
+
+def eight_team_bracket():
+    """Seeds W1..W8 (teams 1..8) with a first round, semifinals and a final."""
+    seeds = pd.DataFrame({'Season': 2019, 'Seed': ["W%d" % seed for seed in range(1, 9)],
+                          'TeamID': range(1, 9)})
+    slots = pd.DataFrame({'Season': 2019,
+                          'Slot': ['R1W1', 'R1W2', 'R1W3', 'R1W4', 'R2W1', 'R2W2', 'R3W1'],
+                          'StrongSeed': ['W1', 'W2', 'W3', 'W4', 'R1W1', 'R1W2', 'R2W1'],
+                          'WeakSeed': ['W8', 'W7', 'W6', 'W5', 'R1W4', 'R1W3', 'R2W2']})
+    return Bracket.from_frames(2019, seeds, slots)
+
+
+def brute_force(bracket, probs):
+    """Enumerate every outcome of every slot, returns (best log-probability, winners)."""
+    num_seeds = len(bracket.seed_positions)
+    best = (-np.inf, None)
+    for outcome in itertools.product([0, 1], repeat=len(bracket.slots)):
+        winners = list(bracket.seed_positions)
+        log_probability = 0.0
+        for k, strong_wins in enumerate(outcome):
+            a, b = winners[bracket.strong[k]], winners[bracket.weak[k]]
+            winner, loser = (a, b) if strong_wins else (b, a)
+            winners.append(winner)
+            log_probability += np.log(probs[winner, loser])
+        if log_probability > best[0]:
+            best = (log_probability, winners[num_seeds:])
+    return best
+
+
+def test_most_likely_bracket_matches_brute_force():
+    bracket = eight_team_bracket()
+    counts = np.zeros((len(bracket.slots), len(bracket.teams)), dtype=np.int64)
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        upper = np.triu(rng.random((8, 8)), 1)
+        probs = upper + np.tril(1 - upper.T, -1) + np.eye(8) * 0.5
+
+        picks, log_probability = most_likely_bracket(bracket, probs, counts, 1)
+        expected, winners = brute_force(bracket, probs)
+        assert np.isclose(log_probability, expected)
+        assert [pick['winner'] for pick in picks] == [int(bracket.teams[w]) for w in winners]
+        assert log_probability >= sum(np.log(pick['matchup_probability'])
+                                      for pick in chalk_bracket(bracket, probs, counts, 1)) - 1e-12
+
+
+def test_most_likely_bracket_can_differ_from_chalk():
+    bracket = eight_team_bracket()
+    counts = np.zeros((len(bracket.slots), len(bracket.teams)), dtype=np.int64)
+    probs = np.full((8, 8), 0.5)
+    ### Team 1 barely beats team 8 but is hopeless afterwards, team 8 would win it all ###
+    probs[0, 7], probs[7, 0] = 0.51, 0.49
+    probs[0, 1:7], probs[1:7, 0] = 0.01, 0.99
+    probs[7, 1:7], probs[1:7, 7] = 0.99, 0.01
+    picks, _ = most_likely_bracket(bracket, probs, counts, 1)
+    chalk = chalk_bracket(bracket, probs, counts, 1)
+    assert chalk[0]['winner'] == 1 and picks[0]['winner'] == 8
+    assert picks[-1]['winner'] == 8
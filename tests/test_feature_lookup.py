@@ -0,0 +1,18 @@
+import pytest
+from conftest import make_box_scores, make_teams
+from feature_lookup import FeatureLookup
+from feature_store import FeatureStore, UnknownSeason, UnknownTeam, played_mask, write_store
+from stat_aggregation import aggregate_yearly_stats
+
+
+def test_unknown_team_and_season(tmp_path):
+    yearly_stats = aggregate_yearly_stats(make_box_scores(), make_teams())
+    write_store(yearly_stats, str(tmp_path / "raw.store"), mask=played_mask(yearly_stats))
+    lookup = FeatureLookup(FeatureStore.load(str(tmp_path / "raw.store")))
+    team = int(lookup.store.index[0, 0])
+    with pytest.raises(UnknownTeam, match="team 99999"):
+        lookup.matchup(team, 99999)
+    with pytest.raises(UnknownSeason, match="season 1900"):
+        lookup.matchup(team, team, 1900)
+    with pytest.raises(UnknownTeam):
+        lookup.store.position(99999, lookup.latest_season)
@@ -0,0 +1,26 @@
+import os
+import numpy as np
+import pytest
+from conftest import REPO_DIR
+from inference import load_model
+
+MODEL_PATH = os.path.join(REPO_DIR, "models", "20190319.yaml")
+WEIGHTS_PATH = os.path.join(REPO_DIR, "weights", "best_model.h5")
+
+
+def test_numpy_model_outputs_probabilities():
+    model = load_model(MODEL_PATH, WEIGHTS_PATH, backend='numpy')
+    inputs = np.random.RandomState(0).rand(100, model.input_dim).astype(np.float32)
+    outputs = model.predict(inputs)
+    assert outputs.shape == (100, 2)
+    np.testing.assert_allclose(outputs.sum(axis=1), 1.0, rtol=1e-5)
+    ### Batching does not change the result ###
+    np.testing.assert_allclose(model.predict(inputs, batch_size=7), outputs, rtol=1e-6)
+
+
+def test_numpy_and_keras_agree():
+    pytest.importorskip("keras.models")
+    numpy_model = load_model(MODEL_PATH, WEIGHTS_PATH, backend='numpy')
+    keras_model = load_model(MODEL_PATH, WEIGHTS_PATH, backend='keras')
+    inputs = np.random.RandomState(1).rand(1000, numpy_model.input_dim).astype(np.float32)
+    np.testing.assert_allclose(numpy_model.predict(inputs), keras_model.predict(inputs), atol=1e-5)
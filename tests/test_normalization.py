@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from conftest import make_box_scores, make_teams
+from feature_lookup import FeatureLookup
+from feature_store import FeatureStore, played_mask, write_store
+from normalization import Scaler, ScalerMismatch, check_weights, weights_scaler_path, write_scaler_info
+from stat_aggregation import aggregate_yearly_stats
+
+
+@pytest.fixture(scope='module')
+def yearly_stats():
+    return aggregate_yearly_stats(make_box_scores(), make_teams())
+
+
+def test_full_fit_matches_original_normalization(yearly_stats):
+    scaler = Scaler.fit_frame(yearly_stats, chunk_size=17)
+    original = (yearly_stats - yearly_stats.min()) / (yearly_stats.max() - yearly_stats.min())
+    np.testing.assert_allclose(scaler.transform_frame(yearly_stats).values, original.fillna(0).values,
+                               atol=1e-12)
+
+
+def test_played_fit_ignores_teams_without_games(yearly_stats):
+    played = Scaler.fit_frame(yearly_stats, played_only=True)
+    mask = played_mask(yearly_stats)
+    assert not mask.all()
+    np.testing.assert_array_equal(played.minimum, yearly_stats[mask].min().values)
+    assert played.fingerprint != Scaler.fit_frame(yearly_stats).fingerprint
+
+
+def test_constant_column_scales_to_zero():
+    scaler = Scaler.fit([np.array([[1.0, 5.0], [3.0, 5.0]])], ['a', 'b'])
+    np.testing.assert_array_equal(scaler.transform(np.array([[2.0, 5.0]])), [[0.5, 0.0]])
+
+
+def test_save_load_keeps_fingerprint(tmp_path, yearly_stats):
+    scaler = Scaler.fit_frame(yearly_stats)
+    path = str(tmp_path / "scaler.npz")
+    scaler.save(path)
+    loaded = Scaler.load(path)
+    assert loaded.fingerprint == scaler.fingerprint
+    assert loaded.fit_rows == 'full'
+
+
+def test_check_weights(tmp_path, yearly_stats):
+    weights = str(tmp_path / "model.h5")
+    full = Scaler.fit_frame(yearly_stats).info()
+    played = Scaler.fit_frame(yearly_stats, played_only=True).info()
+
+    ### Unstamped weights were trained on a full fit ###
+    check_weights(weights, full)
+    check_weights(weights, None)
+    with pytest.raises(ScalerMismatch):
+        check_weights(weights, played)
+
+    write_scaler_info(weights_scaler_path(weights), played)
+    check_weights(weights, played)
+    with pytest.raises(ScalerMismatch):
+        check_weights(weights, full)
+    with pytest.raises(ScalerMismatch):
+        check_weights(weights, None)
+
+
+def test_store_round_trip_and_lookup_normalization(tmp_path, yearly_stats):
+    scaler = Scaler.fit_frame(yearly_stats)
+    mask = played_mask(yearly_stats)
+    write_store(yearly_stats, str(tmp_path / "raw.store"), dtype='float64', mask=mask)
+    write_store(scaler.transform_frame(yearly_stats), str(tmp_path / "normalized.store"), mask=mask,
+                scaler=scaler.info())
+    raw = FeatureStore.load(str(tmp_path / "raw.store"))
+    normalized = FeatureStore.load(str(tmp_path / "normalized.store"))
+    assert raw.features.shape[0] == mask.sum()
+    assert normalized.scaler == scaler.info()
+
+    team, season = yearly_stats[mask].index[0]
+    np.testing.assert_array_equal(raw.row(team, season), yearly_stats.loc[(team, season)].values)
+
+    teams = np.array([key[0] for key in yearly_stats[mask].index if key[1] == season])
+    at_lookup = FeatureLookup(raw, scaler).matchups(teams[:-1], teams[1:], season)
+    stored = FeatureLookup(normalized).matchups(teams[:-1], teams[1:], season)
+    assert at_lookup.dtype == np.float32
+    np.testing.assert_allclose(at_lookup, stored, atol=1e-6)
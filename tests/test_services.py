@@ -0,0 +1,173 @@
+import asyncio
+import importlib
+import json
+import os
+import sys
+import numpy as np
+import pytest
+from admission import AdmissionController
+from batching import QueueFull
+
+SERVICES = ["prediction_web_service", "stat_web_service", "asgi_service"]
+
+
+@pytest.fixture(scope='module')
+def services(tree):
+    """The three service modules, imported inside the synthetic tree."""
+    with pytest.MonkeyPatch.context() as env:
+        for name in list(os.environ):
+            if name.startswith(("PREDICTION_", "STATS_", "BRACKET_", "ASGI_")):
+                env.delenv(name)
+        modules = {name: importlib.import_module(name) for name in SERVICES}
+        yield modules
+        modules["asgi_service"].executor.shutdown(wait=False)
+        for name in SERVICES:
+            sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def predictions(services):
+    return services["prediction_web_service"].app.test_client()
+
+
+@pytest.fixture
+def team_ids(services):
+    stats = services["prediction_web_service"].reloader.current.stats
+    index = stats.store.index
+    return [int(team) for team in index[index[:, 1] == stats.latest_season, 0][:4]]
+
+
+def test_prediction(predictions, team_ids):
+    response = predictions.get('/%d/%d' % (team_ids[0], team_ids[1]))
+    assert response.status_code == 200
+    assert sorted(response.get_json()) == sorted(str(team) for team in team_ids[:2])
+    assert response.headers['X-Model-Version']
+
+
+def test_prediction_unknown_team_and_season(predictions, team_ids):
+    response = predictions.get('/99999/%d' % team_ids[0])
+    assert response.status_code == 404
+    assert response.get_json() == {'error': "No stats for team 99999 in season 2019"}
+    assert predictions.get('/%d/%d?season=1900' % (team_ids[0], team_ids[1])).status_code == 404
+
+
+def test_bulk(predictions, team_ids):
+    matchups = [[team_ids[0], team_ids[1]], [team_ids[2], team_ids[3]]]
+    response = predictions.post('/bulk', json={'matchups': matchups})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.status_code == 200
+    assert [[line['team1'], line['team2']] for line in lines] == matchups
+
+    response = predictions.post('/bulk', json={'matchups': sum(matchups, []), 'season': "2019",
+                                               'format': 'binary'})
+    pred = np.frombuffer(response.get_data(), dtype='<f4').reshape(-1, 2)
+    np.testing.assert_allclose(pred, [line['pred'] for line in lines], rtol=1e-6)
+
+
+@pytest.mark.parametrize("body", [
+    '[1, 2]',
+    'not json',
+    '{"season": "last", "matchups": []}',
+    '{"season": 2019.5, "matchups": []}',
+    '{"matchups": [[1101, 1102], [1103]]}',
+    '{"matchups": [["a", "b"]]}',
+    '{"matchups": [1101, 1102, 1103]}',
+    '{"matchups": {"1101": 1102}}',
+    '{"matchups": [], "format": "xml"}'])
+def test_bulk_rejects_malformed_bodies(predictions, body):
+    response = predictions.post('/bulk', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json()['error']
+
+
+def test_bulk_unknown_team(predictions, team_ids):
+    response = predictions.post('/bulk', json={'matchups': [[team_ids[0], 99999]]})
+    assert response.status_code == 404
+
+
+def test_bracket_without_seeds(predictions):
+    assert predictions.get('/bracket/2019').status_code == 404
+
+
+def test_admission_errors(services, predictions, team_ids, monkeypatch):
+    service = services["prediction_web_service"]
+    admission = AdmissionController(1, max_waiting=0, retry_after=5)
+    monkeypatch.setattr(service, 'admission', admission)
+    path = '/%d/%d' % (team_ids[0], team_ids[1])
+
+    response = predictions.get(path, headers={'X-Request-Deadline-Ms': '0.001'})
+    assert response.status_code == 504
+
+    admission.acquire()
+    response = predictions.get(path)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    admission.release()
+
+    def queue_full(*args, **kwargs):
+        raise QueueFull("Prediction queue is full")
+    monkeypatch.setattr(service.reloader.current, 'predict_matchup', queue_full)
+    monkeypatch.setattr(service, 'retry_after', 7)
+    response = predictions.get(path)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+
+
+def test_admin_reload_auth(services, predictions, monkeypatch):
+    service = services["prediction_web_service"]
+    remote = {'REMOTE_ADDR': '10.1.2.3'}
+    assert predictions.post('/admin/reload', environ_base=remote).status_code == 403
+    assert predictions.post('/admin/reload').status_code == 202
+
+    monkeypatch.setattr(service, 'admin_token', 's3cret')
+    assert predictions.post('/admin/reload').status_code == 401
+    assert predictions.post('/admin/reload', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = predictions.post('/admin/reload', headers={'Authorization': 'Bearer s3cret'}, environ_base=remote)
+    assert response.status_code == 202
+
+
+def test_stats_service(services, team_ids):
+    stats = services["stat_web_service"].app.test_client()
+    response = stats.get('/get-stats/%d' % team_ids[0])
+    assert response.status_code == 200
+    assert stats.get('/get-stats/%d' % team_ids[0], headers={'If-None-Match': response.headers['ETag']}) \
+        .status_code == 304
+    assert stats.get('/get-stats/99999').status_code == 404
+    assert stats.get('/get-stats?season=1900').status_code == 404
+    assert stats.post('/admin/reload', environ_base={'REMOTE_ADDR': '10.1.2.3'}).status_code == 403
+
+
+def asgi_request(app, method, path, headers=()):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request'}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': list(headers)}
+    asyncio.run(app(scope, receive, send))
+    return messages[0]['status'], dict(messages[0]['headers']), messages[1]['body']
+
+
+def test_asgi(services, team_ids, monkeypatch):
+    service = services["asgi_service"]
+    path = '/%d/%d' % (team_ids[0], team_ids[1])
+    status, headers, body = asgi_request(service.app, 'GET', path)
+    assert status == 200
+    status, head_headers, head_body = asgi_request(service.app, 'HEAD', path)
+    assert (status, head_body) == (200, b'')
+    assert head_headers[b'content-length'] == str(len(body)).encode()
+
+    assert asgi_request(service.app, 'GET', '/99999/%d' % team_ids[0])[0] == 404
+    assert asgi_request(service.app, 'GET', '/get-stats/99999')[0] == 404
+    assert asgi_request(service.app, 'POST', path)[0] == 405
+
+    admission = AdmissionController(1, max_waiting=0, retry_after=5)
+    monkeypatch.setattr(service, 'admission', admission)
+    assert asgi_request(service.app, 'GET', path, [(b'x-request-deadline-ms', b'0.001')])[0] == 504
+    admission.acquire()
+    status, headers, _ = asgi_request(service.app, 'GET', path)
+    assert (status, headers[b'retry-after']) == (503, b'5')
+    admission.release()
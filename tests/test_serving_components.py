@@ -0,0 +1,116 @@
+import threading
+import time
+import numpy as np
+import pytest
+from admission import AdmissionController, DeadlineExceeded, Overloaded
+from batching import MicroBatcher, QueueFull
+from bracket import BracketCache
+from prediction_cache import PredictionCache
+
+
+class BlockingModel(object):
+    """Doubles its inputs, holding the first batch until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.batches = []
+
+    def predict(self, rows):
+        self.batches.append(len(rows))
+        self.started.set()
+        self.release.wait(5)
+        return rows * 2
+
+
+def test_batcher_coalesces_waiting_rows():
+    model = BlockingModel()
+    batcher = MicroBatcher(model.predict, max_batch_size=8, max_wait=0.05)
+    first = batcher.submit(np.array([[0.0]]))
+    assert model.started.wait(5)
+    ### Queued while the first batch is in the model ###
+    futures = [batcher.submit(np.array([[float(i)]])) for i in range(1, 6)]
+    model.release.set()
+    assert first.result(5).tolist() == [[0.0]]
+    assert [future.result(5)[0, 0] for future in futures] == [2.0, 4.0, 6.0, 8.0, 10.0]
+    assert model.batches == [1, 5]
+    assert batcher.stats()['max_batch_size_seen'] == 5
+    batcher.close()
+
+
+def test_batcher_queue_full_and_deadline():
+    model = BlockingModel()
+    batcher = MicroBatcher(model.predict, max_batch_size=4, max_wait=0.001, max_queue=1)
+    batcher.submit(np.array([[1.0]]))
+    assert model.started.wait(5)
+    late = batcher.submit(np.array([[2.0]]), deadline=time.monotonic() + 0.01)
+    with pytest.raises(QueueFull):
+        batcher.submit(np.array([[3.0]]))
+    time.sleep(0.02)
+    model.release.set()
+    with pytest.raises(DeadlineExceeded):
+        late.result(5)
+    assert batcher.stats()['expired'] == 1
+    batcher.close()
+
+
+def test_prediction_cache_fills_both_orderings():
+    cache = PredictionCache(3, fingerprint="a")
+    calls = []
+
+    def predict_pair(team1, team2, season):
+        calls.append((team1, team2))
+        return np.array([[0.25, 0.75], [0.75, 0.25]])
+
+    assert cache.get_or_compute(1, 2, 2019, "a", predict_pair).tolist() == [[0.25, 0.75]]
+    assert cache.get_or_compute(2, 1, 2019, "a", predict_pair).tolist() == [[0.75, 0.25]]
+    assert calls == [(1, 2)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    ### Two more pairs push the oldest entries out ###
+    cache.get_or_compute(3, 4, 2019, "a", predict_pair)
+    assert cache.stats()['size'] == 3 and cache.evictions == 1
+
+    cache.reset("b")
+    assert cache.stats()['size'] == 0
+    ### Results of a model that was swapped out meanwhile are not kept ###
+    cache.get_or_compute(1, 2, 2019, "a", predict_pair)
+    assert cache.stats()['size'] == 0
+
+
+def test_admission_sheds_and_expires():
+    admission = AdmissionController(1, max_waiting=1, retry_after=7)
+    admission.acquire()
+
+    waiter = threading.Thread(target=lambda: admission.acquire(time.monotonic() + 5))
+    waiter.start()
+    while admission.stats()['waiting'] == 0:
+        time.sleep(0.001)
+    with pytest.raises(Overloaded) as overloaded:
+        admission.acquire()
+    assert overloaded.value.retry_after == 7
+
+    admission.release()
+    waiter.join(5)
+    assert admission.stats()['in_flight'] == 1
+
+    with pytest.raises(DeadlineExceeded):
+        admission.acquire(time.monotonic() + 0.01)
+    admission.release()
+    with pytest.raises(DeadlineExceeded):
+        admission.acquire(time.monotonic() - 1)
+    stats = admission.stats()
+    assert (stats['admitted'], stats['shed'], stats['expired'], stats['in_flight']) == (2, 1, 2, 0)
+
+
+def test_bracket_cache_keys_and_evicts():
+    cache = BracketCache(capacity=2)
+    runs = []
+    run = lambda key: (lambda: runs.append(key) or {'key': key})
+    assert cache.get_or_run((2019, "a", 10, 1), run(1)) == {'key': 1}
+    assert cache.get_or_run((2019, "a", 10, 1), run(2)) == {'key': 1}
+    cache.get_or_run((2019, "b", 10, 1), run(3))
+    cache.get_or_run((2018, "b", 10, 1), run(4))
+    cache.get_or_run((2019, "a", 10, 1), run(5))
+    assert runs == [1, 3, 4, 5]
+    assert cache.stats() == {'capacity': 2, 'size': 2, 'hits': 1, 'misses': 4}
@@ -0,0 +1,103 @@
+import os
+import pickle
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+from conftest import REPO_DIR, make_box_scores, make_teams
+from stat_aggregation import STAT_COLUMNS, aggregate_yearly_stats, full_index, game_keys, new_games
+
+### The original data_manipulation.py, one box score at a time ###
+SIDE_STATS = [('score', 'Score'), ('fg_made', 'FGM'), ('fg_att', 'FGA'), ('3pt_fg_made', 'FGM3'),
+              ('3pt_fg_att', 'FGA3'), ('ft_made', 'FTM'), ('ft_att', 'FTA'), ('or', 'OR'), ('dr', 'DR'),
+              ('ast', 'Ast'), ('to', 'TO'), ('stl', 'Stl'), ('blk', 'Blk')]
+PERCENTAGES = [('fg_perct', 'fg_made', 'fg_att'), ('opp_fg_perct', 'opp_fg_made', 'opp_fg_att'),
+               ('3pt_perct', '3pt_fg_made', '3pt_fg_att'),
+               ('opp_3pt_perct', 'opp_3pt_fg_made', 'opp_3pt_fg_att'),
+               ('ft_perct', 'ft_made', 'ft_att'), ('opp_ft_perct', 'opp_ft_made', 'opp_ft_att')]
+PER_GAME = ['score', 'opp_score', 'win_perct', 'or', 'opp_or', 'dr', 'opp_dr', 'ast', 'opp_ast',
+            'to', 'opp_to', 'stl', 'opp_stl', 'blk', 'opp_blk']
+
+
+def reference_yearly_stats(box_scores, teams):
+    index = full_index(teams['TeamID'], box_scores['Season'])
+    stats = pd.DataFrame(0.0, index=index, columns=STAT_COLUMNS)
+    lines = {}
+    for _, row in box_scores.iterrows():
+        for side, opp in (('W', 'L'), ('L', 'W')):
+            ### Neutral site games count as away games for both teams ###
+            venue = 'home' if row['WLoc'] == ('H' if side == 'W' else 'A') else 'away'
+            line = lines.setdefault((row[side + 'TeamID'], row['Season']), {})
+            sums = [(stat, row[side + suffix]) for stat, suffix in SIDE_STATS] + \
+                [('opp_' + stat, row[opp + suffix]) for stat, suffix in SIDE_STATS] + \
+                [('win_perct', 1 if side == 'W' else 0), ('games', 1)]
+            for stat, value in sums:
+                col = "%s_%s" % (stat, venue)
+                line[col] = line.get(col, 0) + value
+
+    for key, line in lines.items():
+        totals = dict(line)
+        for venue in ('home', 'away'):
+            total = lambda stat: totals.get("%s_%s" % (stat, venue), 0)
+            for perct, made, att in PERCENTAGES:
+                if total(att):
+                    line["%s_%s" % (perct, venue)] = total(made) / float(total(att))
+            if total('games'):
+                for stat in PER_GAME:
+                    line["%s_%s" % (stat, venue)] = total(stat) / float(total('games'))
+        for col, value in line.items():
+            stats.loc[key, col] = value
+    return stats
+
+
+def test_aggregation_matches_row_by_row_reference():
+    box_scores, teams = make_box_scores(seasons=[2018, 2019], num_games=150), make_teams()
+    expected = reference_yearly_stats(box_scores, teams)
+    actual = aggregate_yearly_stats(box_scores, teams)
+    assert list(actual.columns) == STAT_COLUMNS
+    assert actual.index.equals(expected.index)
+    np.testing.assert_allclose(actual.values, expected.values, rtol=1e-12)
+
+
+def test_new_games_skips_counted_and_repeated_games(box_scores):
+    seen = game_keys(box_scores[:100])
+    seen.sort()
+    batch = pd.concat([box_scores[50:150], box_scores[140:150]])
+    fresh, merged = new_games(batch, seen)
+    assert len(fresh) == 50
+    assert np.array_equal(merged, np.unique(game_keys(box_scores[:150])))
+
+
+def run_manipulation(directory, *args):
+    subprocess.check_call([sys.executable, os.path.join(REPO_DIR, "data_manipulation.py")] + list(args),
+                          cwd=directory, stdout=subprocess.DEVNULL)
+
+
+def test_incremental_updates_match_full_rebuild(tmp_path):
+    data_dir = tmp_path / "data" / "stage_2"
+    data_dir.mkdir(parents=True)
+    (tmp_path / "custom_data").mkdir()
+    box_scores, teams = make_box_scores(), make_teams()
+    teams.to_csv(str(data_dir / "Teams.csv"), index=False)
+
+    ### Day 1: everything up to the middle of the last season ###
+    last = box_scores[box_scores['Season'] == box_scores['Season'].max()]
+    cut_day = int(last['DayNum'].median())
+    loaded = (box_scores['Season'] < last['Season'].iloc[0]) | (box_scores['DayNum'] < cut_day)
+    box_scores[loaded].to_csv(str(data_dir / "RegularSeasonDetailedResults.csv"), index=False)
+    run_manipulation(str(tmp_path))
+
+    ### Day 2: a feed that repeats loaded games and holds late games of a loaded day ###
+    late_day = box_scores[~loaded & (box_scores['DayNum'] == cut_day)]
+    assert len(late_day)
+    feed = pd.concat([box_scores[loaded].tail(30), box_scores[~loaded]])
+    feed.to_csv(str(tmp_path / "feed.csv"), index=False)
+    run_manipulation(str(tmp_path), "--incremental", "--new-games", "feed.csv")
+    ### Running the same feed again changes nothing ###
+    run_manipulation(str(tmp_path), "--incremental", "--new-games", "feed.csv")
+
+    with open(str(tmp_path / "custom_data" / "yearly_stats.p"), "rb") as stats_file:
+        incremental = pickle.load(stats_file)
+    expected = aggregate_yearly_stats(box_scores, teams)
+    assert incremental.index.equals(expected.index)
+    np.testing.assert_allclose(incremental[STAT_COLUMNS].values, expected.values, rtol=1e-12)
@@ -3,61 +3,133 @@
 ## train_model.py
 ##
 ## @author: Matthew Cline
-## @version: 20190319
+## @version: 20261018
 ##
-## Description: Fully connected neural network model trainer to pick the 
-## winner in a basketball game. Uses the average stats from the entire 
+## Description: Fully connected neural network model trainer to pick the
+## winner in a basketball game. Uses the average stats from the entire
 ## season as the input. Provides a one hot encoding of each teams
 ## probability of winning as the output.
 ##
+## The game logs are streamed from the memory-mapped arrays written by
+## create_labels.py (see training_input.py), so training memory does not
+## grow with the dataset. The input width is read from the data.
+##
+## Usage:
+##      python train_model.py [--batch-size 10] [--epochs 150]
+##                            [--workers 2] [--max-queue-size 10]
+##                            [--version 20190320] [--checkpoint FILE]
+##          Writes models/<version>.yaml and weights/<version>.h5, the best
+##          epoch by validation loss is checkpointed to FILE (default
+##          weights/best_model.h5). Both get the scaler fingerprint of the
+##          training data next to them (see normalization.py).
+##
 ##############################################################################
 
-import numpy as np
+import argparse
 import os
-import pickle
 from keras.models import Sequential
 from keras.layers import Dense, LeakyReLU, Activation
 from keras.callbacks import EarlyStopping, ModelCheckpoint
 import tensorflow as tf
+from training_data import SCALER_INFO_FILE, TRAIN_DIR, VAL_DIR, load_shards
+from normalization import read_scaler_info, weights_scaler_path, write_scaler_info
+from training_input import MatchupSequence
+from profiling import phase
+
+LAYERS = [256, 128, 64, 32, 8]
+ALPHA = 0.1
+BATCH_SIZE = 10
+EPOCHS = 150
+PATIENCE = 10
+CHECKPOINT_PATH = os.path.normpath("weights/best_model.h5")
+
+
+def build_model(input_dim, layers=LAYERS, alpha=ALPHA):
+    """Dense/LeakyReLU stack with a two way softmax output."""
+    model = Sequential()
+    model.add(Dense(layers[0], input_dim=input_dim))
+    model.add(LeakyReLU(alpha=alpha))
+    for width in layers[1:]:
+        model.add(Dense(width))
+        model.add(LeakyReLU(alpha=alpha))
+    model.add(Dense(2))
+    model.add(Activation(tf.nn.softmax))
+    model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy', 'mean_squared_error'])
+    return model
+
+
+def training_sequences(batch_size=BATCH_SIZE, train_dir=TRAIN_DIR, val_dir=VAL_DIR, seed=None):
+    """Shuffled training and ordered validation batches from the mapped arrays."""
+    return (MatchupSequence(load_shards(train_dir), batch_size, shuffle=True, seed=seed),
+            MatchupSequence(load_shards(val_dir), batch_size, shuffle=False))
+
+
+def stamp_weights(weights_path, train_dir=TRAIN_DIR):
+    """Record the scaler of the data in train_dir next to weights trained on it.
+
+    The weights are only valid with that scaler (see normalization.py).
+    """
+    write_scaler_info(weights_scaler_path(weights_path),
+                      read_scaler_info(os.path.join(train_dir, SCALER_INFO_FILE)))
+
+
+def train(model, train_batches, val_batches, epochs=EPOCHS, patience=PATIENCE,
+          checkpoint_path=CHECKPOINT_PATH, workers=2, max_queue_size=10, callbacks=None,
+          train_dir=TRAIN_DIR):
+    """Fit on the batch sequences while worker threads prefetch ahead.
+
+    The checkpoint is stamped with the scaler of train_dir, the directory
+    train_batches was read from.
+    """
+    callbacks = [EarlyStopping(monitor='val_acc', patience=patience),
+                 ModelCheckpoint(filepath=checkpoint_path,
+                                 monitor='val_loss',
+                                 save_best_only=True)] + list(callbacks or [])
+    history = model.fit_generator(train_batches,
+                                  epochs=epochs,
+                                  callbacks=callbacks,
+                                  validation_data=val_batches,
+                                  workers=workers,
+                                  max_queue_size=max_queue_size,
+                                  use_multiprocessing=False)
+    stamp_weights(checkpoint_path, train_dir)
+    return history
+
+
+def save_model(model, model_path, weights_path, train_dir=TRAIN_DIR):
+    with open(model_path, "w") as yaml_file:
+        yaml_file.write(model.to_yaml())
+    print("Saved model config to %s" % model_path)
+    model.save_weights(weights_path)
+    stamp_weights(weights_path, train_dir)
+    print("Saved model weights to %s" % weights_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the matchup model.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--workers", type=int, default=2,
+                        help="threads prefetching batches")
+    parser.add_argument("--max-queue-size", type=int, default=10,
+                        help="batches prefetched ahead of the current step")
+    parser.add_argument("--version", default="20190320",
+                        help="name of the saved models/<version>.yaml and weights/<version>.h5")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                        help="where the best epoch's model is saved")
+    args = parser.parse_args()
+
+    with phase("load_data"):
+        train_batches, val_batches = training_sequences(args.batch_size)
+    with phase("build_model"):
+        model = build_model(train_batches.input_dim)
+    with phase("train"):
+        train(model, train_batches, val_batches, epochs=args.epochs, checkpoint_path=args.checkpoint,
+              workers=args.workers, max_queue_size=args.max_queue_size)
+    with phase("save_model"):
+        weights_path = os.path.normpath("weights/%s.h5" % args.version)
+        save_model(model, os.path.normpath("models/%s.yaml" % args.version), weights_path)
 
-### Import the game logs ###
-train_data = pickle.load(open(os.path.normpath("train_data/data.p"), "rb"))
-train_labels = pickle.load(open(os.path.normpath("train_data/labels.p"), "rb"))
-val_data = pickle.load(open(os.path.normpath("val_data/data.p"), "rb"))
-val_labels = pickle.load(open(os.path.normpath("val_data/labels.p"), "rb"))
-
-### Model Architecture ###
-model = Sequential()
-model.add(Dense(256, input_dim=136))
-model.add(LeakyReLU(alpha=0.1))
-model.add(Dense(128))
-model.add(LeakyReLU(alpha=0.1))
-model.add(Dense(64))
-model.add(LeakyReLU(alpha=0.1))
-model.add(Dense(32))
-model.add(LeakyReLU(alpha=0.1))
-model.add(Dense(8))
-model.add(LeakyReLU(alpha=0.1))
-model.add(Dense(2))
-model.add(Activation(tf.nn.softmax))
-
-callbacks = [EarlyStopping(monitor='val_acc', patience=10),
-             ModelCheckpoint(filepath=os.path.normpath("weights/best_model.h5"),
-                             monitor='val_loss',
-                             save_best_only=True)]
-
-model.compile(loss='categorical_crossentropy', optimizer='adam', metrics=['accuracy', 'mean_squared_error'])
-model.fit(train_data,
-          train_labels,
-          epochs=150,
-          batch_size=10,
-          callbacks=callbacks,
-          validation_data=(val_data,val_labels))
-
-model_yaml =  model.to_yaml()
-with open("models/20190320.yaml", "w") as yaml_file:
-    yaml_file.write(model_yaml)
-print("Saved model config to models/20190320.yaml")
-model.save_weights("weights/20190320.h5")
-print("Saved model weights to weights/20190320.h5")
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+##############################################################################
+##
+## training_data.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Build and load the model's training arrays. Every regular
+## season game becomes two rows, the home team first and then the away team
+## first, each labelled with a one hot [first team won, second team won].
+## Games at a neutral or away site are oriented with the loser as the home
+## team, the same rule the original iterrows builder used.
+##
+## Arrays are written with np.lib.format.open_memmap into preallocated
+## float32 .npy files chunk by chunk, so peak memory is one chunk no matter
+## how many games there are, and training maps them back read-only.
+##      train_data/data.npy   train_data/labels.npy
+##      val_data/data.npy     val_data/labels.npy
+## A directory may instead hold shards data-<n>.npy / labels-<n>.npy (e.g.
+## one per source of games), load_shards maps them all in name order.
+##
+##############################################################################
+
+import glob
+import os
+import numpy as np
+
+TRAIN_DIR = os.path.normpath("train_data")
+VAL_DIR = os.path.normpath("val_data")
+DATA_FILE = "data.npy"
+LABELS_FILE = "labels.npy"
+SCALER_INFO_FILE = "scaler.json"
+
+
+def orient_games(games):
+    """(home, away, season, home_won) arrays for a frame of game results."""
+    home_won = (games['WLoc'] == 'H').values
+    winners = games['WTeamID'].values.astype(np.int64)
+    losers = games['LTeamID'].values.astype(np.int64)
+    home = np.where(home_won, winners, losers)
+    away = np.where(home_won, losers, winners)
+    return home, away, games['Season'].values.astype(np.int64), home_won
+
+
+def write_dataset(lookup, home, away, season, home_won, directory, dtype='float32', chunk_size=65536):
+    """Write both orderings of every game to <directory>/data.npy and labels.npy.
+
+    Rows 2i and 2i + 1 are (home, away) and (away, home) for game i.
+    Returns the (data, labels) shapes written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    num_rows = 2 * len(home)
+    data_path = os.path.join(directory, DATA_FILE)
+    labels_path = os.path.join(directory, LABELS_FILE)
+
+    data = np.lib.format.open_memmap(data_path + ".tmp", mode='w+', dtype=dtype,
+                                     shape=(num_rows, lookup.width))
+    labels = np.lib.format.open_memmap(labels_path + ".tmp", mode='w+', dtype=dtype,
+                                       shape=(num_rows, 2))
+
+    ### Gather straight into the memmap when the store already has its dtype ###
+    direct = lookup.dtype == data.dtype
+    for start in range(0, len(home), chunk_size):
+        stop = min(start + chunk_size, len(home))
+        team1 = np.stack((home[start:stop], away[start:stop]), axis=1).ravel()
+        team2 = np.stack((away[start:stop], home[start:stop]), axis=1).ravel()
+        seasons = np.repeat(season[start:stop], 2)
+        rows = slice(2 * start, 2 * stop)
+
+        if direct:
+            lookup.matchups(team1, team2, seasons, out=data[rows])
+        else:
+            data[rows] = lookup.matchups(team1, team2, seasons)
+
+        won = home_won[start:stop]
+        labels[rows][0::2, 0] = won
+        labels[rows][0::2, 1] = ~won
+        labels[rows][1::2, 0] = ~won
+        labels[rows][1::2, 1] = won
+
+    shapes = data.shape, labels.shape
+    data.flush()
+    labels.flush()
+    del data, labels
+    os.replace(data_path + ".tmp", data_path)
+    os.replace(labels_path + ".tmp", labels_path)
+    return shapes
+
+
+def load_dataset(directory, mmap_mode='r'):
+    """Map (data, labels) written by write_dataset, read-only by default."""
+    return (np.load(os.path.join(directory, DATA_FILE), mmap_mode=mmap_mode),
+            np.load(os.path.join(directory, LABELS_FILE), mmap_mode=mmap_mode))
+
+
+def load_shards(directory, mmap_mode='r'):
+    """Map every (data, labels) shard in a directory, [data.npy] if unsharded."""
+    data_paths = sorted(glob.glob(os.path.join(directory, "data-*.npy")))
+    if not data_paths:
+        data_paths = [os.path.join(directory, DATA_FILE)]
+    shards = []
+    for data_path in data_paths:
+        labels_path = os.path.join(directory, os.path.basename(data_path).replace("data", "labels", 1))
+        shards.append((np.load(data_path, mmap_mode=mmap_mode), np.load(labels_path, mmap_mode=mmap_mode)))
+    return shards
@@ -0,0 +1,60 @@
+##############################################################################
+##
+## training_input.py
+##
+## @author: Matthew Cline
+## @version: 20261018
+##
+## Description: Streaming input for model training. A MatchupSequence
+## serves mini-batches from memory-mapped (and optionally sharded) arrays
+## written by create_labels.py, so only the rows of the batches in flight
+## are ever read into memory. Keras' fit_generator prefetches the next
+## batches on worker threads (workers / max_queue_size) while the current
+## step runs.
+##
+## Shuffling is a fresh permutation of the global row numbers every epoch.
+## Each batch's rows are sorted before they are read so a batch touches the
+## file front to back.
+##
+##############################################################################
+
+import numpy as np
+from keras.utils import Sequence
+
+
+class MatchupSequence(Sequence):
+    """Mini-batches of (data, labels) from a list of mapped shards."""
+
+    def __init__(self, shards, batch_size, shuffle=True, seed=None):
+        self.shards = shards
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.random = np.random.RandomState(seed)
+
+        sizes = [data.shape[0] for data, _ in shards]
+        self.starts = np.concatenate(([0], np.cumsum(sizes)))
+        self.num_rows = int(self.starts[-1])
+        self.input_dim = shards[0][0].shape[1]
+        self.order = np.arange(self.num_rows)
+        self.on_epoch_end()
+
+    def __len__(self):
+        return (self.num_rows + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, idx):
+        rows = np.sort(self.order[idx * self.batch_size:(idx + 1) * self.batch_size])
+        shard_of = np.searchsorted(self.starts, rows, side='right') - 1
+
+        data = np.empty((len(rows), self.input_dim), dtype=np.float32)
+        labels = np.empty((len(rows), 2), dtype=np.float32)
+        for shard in np.unique(shard_of):
+            mask = shard_of == shard
+            local = rows[mask] - self.starts[shard]
+            shard_data, shard_labels = self.shards[shard]
+            data[mask] = shard_data[local]
+            labels[mask] = shard_labels[local]
+        return data, labels
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.random.shuffle(self.order)